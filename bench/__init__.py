@@ -0,0 +1,10 @@
+"""
+Standard benchmark suite: fixed-seed scenarios over res/maps and the
+TransCenter cards, compared against a stored baseline.
+
+    python -m bench --suite quick                 # compare to bench/baseline_quick.json
+    python -m bench --suite full --update         # record a new baseline
+
+Timings are compared as the best of --repeat runs (5 by default); single
+runs on a shared machine are too noisy for the tolerances of suite.py.
+"""
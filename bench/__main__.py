@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+
+from bench.baseline import best_of, compare, load_baseline, save_baseline
+from bench.suite import SUITES, TOLERANCES
+from lib.game_runner import run_benchmark, save_results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Run the benchmark suite and check it against a baseline.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--baseline", default=None, help="baseline json, bench/baseline_<suite>.json by default")
+    parser.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every job, the best of them is compared")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parallel runs, more than 1 makes the timings noisier")
+    parser.add_argument("--json", default=None, help="also save the full metrics")
+    args = parser.parse_args(argv)
+
+    baseline_path = args.baseline
+    if baseline_path is None:
+        baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_%s.json" % args.suite)
+    groups = SUITES[args.suite]()
+    # 每个任务一个新进程, 内存峰值不受之前任务的影响; 同一任务的多次运行分散在整个测试过程中
+    repeats = [[r for scenarios, planners in groups
+                for r in run_benchmark(scenarios, planners, seeds=args.seeds, n_workers=args.workers, isolated=True)]
+               for _ in range(max(args.repeat, 1))]
+    results = best_of(repeats, TOLERANCES)
+    save_results(results, args.json)
+    for r in results:
+        print("%-36s %-44s agvs %4d  del/1k %7.1f  tick %8.2fms  step %8.1fus  rss %7.1fMB" % (
+              r["scenario"], r["planner"], r["n_agvs"], r["deliveries_per_1k"], r["tick_ms"], r["engine_step_us"], r["rss_peak_mb"]))
+
+    if args.update:
+        save_baseline(baseline_path, args.suite, results, list(TOLERANCES))
+        print("baseline written to", baseline_path)
+        return 0
+    if not os.path.exists(baseline_path):
+        print("no baseline at %s, run with --update first" % baseline_path)
+        return 2
+    regressions, missing = compare(results, load_baseline(baseline_path), TOLERANCES)
+    for key in missing:
+        print("no baseline entry:", key)
+    for key, metric, base, new, limit in regressions:
+        print("REGRESSION %s %s: %.3f -> %.3f (limit %.3f)" % (key, metric, base, new, limit))
+    print("%d runs, %d regressions" % (len(results), len(regressions)))
+    return 1 if len(regressions)>0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
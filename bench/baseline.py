@@ -0,0 +1,58 @@
+import json
+import platform
+
+def result_key(result):
+    return "%s|%s|%d" % (result["scenario"], result["planner"], result["seed"])
+
+def best_of(repeats, tolerances):
+    """
+    Merges repeated runs of the same jobs, keeping the best value of every
+    compared metric, which is far less noisy than a single timing.
+    """
+    merged = [dict(r) for r in repeats[0]]
+    for results in repeats[1:]:
+        for best, r in zip(merged, results):
+            for metric, (_, _, higher_is_better) in tolerances.items():
+                best[metric] = max(best[metric], r[metric]) if higher_is_better else min(best[metric], r[metric])
+    return merged
+
+def save_baseline(path, suite, results, metrics):
+    runs = {result_key(r): {m: r[m] for m in metrics} for r in results}
+    with open(path, "w") as f:
+        # 计时随机器而变, 记录生成基准的机器以便对照
+        json.dump({"suite": suite, "host": platform.node(), "python": platform.python_version(),
+                   "runs": runs}, f, indent=2, sort_keys=True)
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(results, baseline, tolerances):
+    """
+    Returns (regressions, missing): regressions are
+    (key, metric, baseline value, new value, limit), missing the keys of
+    results without a baseline entry.
+    tolerances: {metric: (relative, absolute, higher_is_better)}, a metric
+                regresses when it is worse than the baseline by more than
+                relative*baseline+absolute
+    """
+    regressions = []
+    missing = []
+    for r in results:
+        key = result_key(r)
+        base = baseline["runs"].get(key)
+        if base is None:
+            missing.append(key)
+            continue
+        for metric, (relative, absolute, higher_is_better) in tolerances.items():
+            if metric not in base: continue
+            slack = relative*abs(base[metric])+absolute
+            if higher_is_better:
+                limit = base[metric]-slack
+                bad = r[metric]<limit
+            else:
+                limit = base[metric]+slack
+                bad = r[metric]>limit
+            if bad:
+                regressions.append((key, metric, base[metric], r[metric], limit))
+    return regressions, missing
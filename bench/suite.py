@@ -0,0 +1,72 @@
+"""
+Fixed-seed benchmark scenarios over res/maps, the TransCenter cards and
+random CBS puzzles.
+"""
+import glob
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPS = ["M0", "M1", "M2", "M3", "M4", "M5", "L0", "XL0", "XXL0"]
+CARDS = sorted(glob.glob(os.path.join(ROOT, "res", "game_cards", "TransCenter", "*", "*")))
+
+# 地图越大每一步越慢, 步数相应减少
+STEPS = {"M": 500, "L": 500, "XL": 300, "XXL": 200}
+
+PLANNERS = [
+    "WHCA",
+    "WHCA:isHierachical=True",
+    "WHCA:low_level='sipp',replan='keep_parked'",
+    # CBS/ECBS 在构造时规划整个谜题, 只用于 puzzle_scenario
+    "CBS",
+    "CBS:low_level='sipp'",
+    "CBS:suboptimality=1.5",
+]
+
+# 指标: (允许的相对变化, 绝对的噪声余量, 越大越好)
+# 计时取 --repeat 次运行中最好的一次, 在共享的机器上至少需要 5 次
+TOLERANCES = {
+    "tick_ms": (0.25, 0.05, False),
+    "engine_step_us": (0.25, 10.0, False),
+    "init_s": (0.25, 0.005, False),
+    "rss_peak_mb": (0.15, 5.0, False),
+    "deliveries_per_1k": (0.02, 0.0, True),
+}
+
+def map_scenario(name, agv_density=1.0, parcel_gen_gap=2, n_parcels=3, steps=None):
+    if steps is None:
+        steps = STEPS[name.rstrip("0123456789")]
+    return {"name": "%s-d%g-g%g" % (name, agv_density, parcel_gen_gap),
+            "map": os.path.join(ROOT, "res", "maps", name+".txt"),
+            "n_parcels": n_parcels, "parcel_gen_gap": parcel_gen_gap,
+            "agv_density": agv_density, "max_step": steps}
+
+def card_scenario(path, steps=None):
+    return {"name": os.path.relpath(path, ROOT), "card": path, "max_step": steps}
+
+def puzzle_scenario(size, n_agvs, seed):
+    return {"name": "P%d-n%d-s%d" % (size, n_agvs, seed), "puzzle": [size, size],
+            "n_agvs": n_agvs, "road_ratio": 0.7, "seed": seed, "max_step": 200}
+
+def quick_suite():
+    """
+    A few minutes on one core, for every change of the hot paths.
+    Returns [(scenarios, planners), ...].
+    """
+    scenarios = [map_scenario(name, steps=200) for name in ["M0", "M3", "L0"]]
+    scenarios.append(map_scenario("XL0", steps=100))
+    scenarios.extend(card_scenario(path, steps=200) for path in CARDS[:1])
+    puzzles = [puzzle_scenario(10, 6, seed) for seed in range(2)]
+    return [(scenarios, PLANNERS[:3]), (puzzles, PLANNERS[3:])]
+
+def full_suite():
+    """
+    Every map at two AGV densities and two parcel generation gaps, every
+    TransCenter card, and CBS puzzles of two sizes.
+    """
+    scenarios = [map_scenario(name, density, gap)
+                 for name in MAPS for density in [0.5, 1.0] for gap in [1, 4]]
+    scenarios.extend(card_scenario(path) for path in CARDS)
+    puzzles = [puzzle_scenario(size, n_agvs, seed) for size, n_agvs in [(10, 6), (12, 8)] for seed in range(4)]
+    return [(scenarios, PLANNERS[:3]), (puzzles, PLANNERS[3:])]
+
+SUITES = {"quick": quick_suite, "full": full_suite}
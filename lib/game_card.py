@@ -3,6 +3,10 @@ import os
 import pickle
 from lib.utils import parse_map, init_parcels
 from lib.game_engine import game_engine
+from lib.parcel_events import parcel_events
+
+# 0: parcel_gen_seq 以 pickle 保存的列表; 1: parcel_events 的列式数组, 加载时内存映射
+CARD_VERSION = 1
 
 class game_card:
 
@@ -14,6 +18,7 @@ class game_card:
             folder_path = None
 
         if folder_path is None:
+            self.version = CARD_VERSION
             self.max_step = max_step
             self.parcel_gen_gap = parcel_gen_gap
             self.have_dl = bool(have_dl)
@@ -30,25 +35,9 @@ class game_card:
             if parcel_gen_gap == 0:
                 self.parcel_gen_seq = None
             else:
-                self.parcel_gen_seq = self._build_parcel_gen_seq()
+                self.parcel_gen_seq = parcel_events.from_seq(self._build_parcel_gen_seq(), self.have_dl)
         else:
-            if folder_path[-1]=="/":
-                root = folder_path
-            else:
-                root = folder_path+"/"
-            self.max_step, self.parcel_gen_gap, self.have_dl = np.load(root+"basic_info.npy")
-            self.max_step = int(self.max_step)
-            self.have_dl = bool(self.have_dl)
-            self._map = np.load(root+"_map.npy")
-            if self.have_dl:
-                self.step_left = np.load(root+"step_left.npy")
-            else:
-                self.step_left = None
-            if self.parcel_gen_gap>0:
-                with open(root+'parcel_gen_seq.pickle', 'rb') as handle:
-                    self.parcel_gen_seq = pickle.load(handle)
-            else:
-                self.parcel_gen_seq = None
+            self.load(folder_path)
 
     def save(self, folder_path):
         if folder_path[-1]=="/":
@@ -59,19 +48,25 @@ class game_card:
             os.mkdir(root)
         except FileExistsError:
             print("Note: The game card folder already exists.")
-        basic_info = np.array([self.max_step, self.parcel_gen_gap, self.have_dl])
+        basic_info = np.array([self.max_step, self.parcel_gen_gap, self.have_dl, CARD_VERSION])
         np.save(root+"basic_info", basic_info)
         np.save(root+"_map", self._map)
         if self.have_dl: np.save(root+"step_left", self.step_left)
-        with open(root+'parcel_gen_seq.pickle', 'wb') as handle:
-            pickle.dump(self.parcel_gen_seq, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.parcel_gen_seq is not None:
+            self.parcel_gen_seq.save(root)
 
-    def load(self, folder_path):
+    def load(self, folder_path, mmap=True):
+        """
+        Loads both card versions. mmap: memory-map the parcel events of
+        version 1 cards instead of reading them.
+        """
         if folder_path[-1]=="/":
             root = folder_path
         else:
             root = folder_path+"/"
-        self.max_step, self.parcel_gen_gap, self.have_dl = np.load(root+"basic_info.npy")
+        basic_info = np.load(root+"basic_info.npy")
+        self.max_step, self.parcel_gen_gap, self.have_dl = basic_info[:3]
+        self.version = int(basic_info[3]) if len(basic_info)>3 else 0
         self.max_step = int(self.max_step)
         self.have_dl = bool(self.have_dl)
         self._map = np.load(root+"_map.npy")
@@ -79,11 +74,20 @@ class game_card:
             self.step_left = np.load(root+"step_left.npy")
         else:
             self.step_left = None
-        if self.parcel_gen_gap>0:
-            with open(root+'parcel_gen_seq.pickle', 'rb') as handle:
-                self.parcel_gen_seq = pickle.load(handle)
-        else:
+        if self.version==0:
             self.parcel_gen_seq = None
+            if self.parcel_gen_gap>0:
+                with open(root+'parcel_gen_seq.pickle', 'rb') as handle:
+                    seq = pickle.load(handle)
+                if seq is not None:
+                    self.parcel_gen_seq = parcel_events.from_seq(seq, self.have_dl)
+        elif self.version==1:
+            if os.path.exists(root+"parcel_events.npy"):
+                self.parcel_gen_seq = parcel_events.load(root, self.have_dl, mmap=mmap)
+            else:
+                self.parcel_gen_seq = None
+        else:
+            raise ValueError("Unknown game card version: "+str(self.version))
 
     def _build_parcel_gen_seq(self):
         result = []
@@ -119,3 +123,36 @@ class game_card:
         else:
             ge = game_engine(self._map, self.parcel_gen_gap, parcel_gen_seq=self.parcel_gen_seq)
         return self.max_step, ge
+
+def convert_card(folder_path):
+    """
+    Rewrites a version 0 (pickled parcel_gen_seq) card in the current format
+    and checks that it loads back to the same content, raising ValueError
+    (and keeping the pickle) otherwise.
+    """
+    root = folder_path if folder_path[-1]=="/" else folder_path+"/"
+    card = game_card(root)
+    if card.version==CARD_VERSION:
+        return card
+    seq = None
+    if os.path.exists(root+"parcel_gen_seq.pickle"):
+        with open(root+'parcel_gen_seq.pickle', 'rb') as handle:
+            seq = pickle.load(handle)
+    card.save(root)
+    converted = game_card(root)
+    # 校验失败时保留旧的 pickle, 不用 assert 以免在 python -O 下被跳过
+    if not np.array_equal(converted._map, card._map):
+        raise ValueError("Converted card has a different map: "+root)
+    if (converted.max_step, converted.parcel_gen_gap, converted.have_dl) != (card.max_step, card.parcel_gen_gap, card.have_dl):
+        raise ValueError("Converted card has a different basic_info: "+root)
+    if not ((converted.step_left is None and card.step_left is None) or np.array_equal(converted.step_left, card.step_left)):
+        raise ValueError("Converted card has different deadlines: "+root)
+    if card.parcel_gen_gap>0 and seq is not None:
+        if [[[int(v) for v in gen] for gen in gens] for gens in seq] != \
+           [[list(gen) for gen in gens] for gens in converted.parcel_gen_seq.to_seq()]:
+            raise ValueError("Converted card has a different parcel_gen_seq: "+root)
+    elif converted.parcel_gen_seq is not None:
+        raise ValueError("Converted card has a parcel_gen_seq the original has not: "+root)
+    if os.path.exists(root+"parcel_gen_seq.pickle"):
+        os.remove(root+"parcel_gen_seq.pickle")
+    return converted
@@ -3,6 +3,29 @@ import os
 import numpy as np
 import pygame.freetype
 
+def cell_states(engine):
+    """
+    The drawn state of every cell, (m, n, 4): player id, whether the player
+    is loaded, parcel id and the steps left of the parcel.
+    """
+    state = np.zeros(engine.terrain.shape+(4,), dtype=np.int64)
+    state[:,:,0] = engine.player_map
+    state[:,:,2] = engine.parcel_map
+    occupied = engine.player_map>0
+    state[:,:,1][occupied] = engine.players[engine.player_map[occupied].astype(np.int64)-1,2]>0
+    if engine.step_left is not None:
+        loaded = engine.parcel_map>0
+        state[:,:,3][loaded] = np.asarray(engine.step_left)[engine.parcel_map[loaded].astype(np.int64)-1]
+    return state
+
+def changed_cells(state, prev):
+    """
+    The cells whose state differs, all the occupied cells if prev is None.
+    """
+    if prev is None:
+        return np.argwhere((state[:,:,0]>0) | (state[:,:,2]>0))
+    return np.argwhere(np.any(state!=prev, axis=2))
+
 class game_display:
 
     def __init__(self, engine, disp_scale=1.0, mute=True):
@@ -36,6 +59,11 @@ class game_display:
         self.text_font = pygame.freetype.SysFont('Comic Sans MS', self.text_font_size)
         self.num_font = pygame.freetype.SysFont('Comic Sans MS', self.num_font_size)
 
+        # 静态层(网格 墙 出货点 货架)只画一次, 之后每帧只重画状态改变的格子
+        self.background = None
+        self.terrain = None
+        self.prev_state = None
+
     def update(self, engine, moves_str=[], isPlaySounds=False):
         """
         return: True  -> The display is on.
@@ -44,140 +72,147 @@ class game_display:
         for e in pygame.event.get():
             if e.type == pygame.QUIT:
                 return False
+            if e.type == pygame.VIDEOEXPOSE:
+                self.invalidate()
 
         if not self.mute and isPlaySounds:
             self.sounds[np.random.randint(len(self.sounds))].play()
 
-        # 清屏
-        self.screen.fill(self.color_dark)
+        full = self.background is None or self.terrain is not engine.terrain
+        if full:
+            self._build_background(engine)
+            self.screen.blit(self.background, (0, 0))
+            self.prev_state = None
+
+        state = cell_states(engine)
+        rects = [self._show_texts(engine, moves_str)]
+        for i, j in changed_cells(state, self.prev_state):
+            rects.append(self._show_cell(engine, i, j))
+        self.prev_state = state
+
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update(rects)
+        return True
 
-        self._show_players(engine)
-        self._show_parcels(engine)
+    def invalidate(self):
+        """
+        Forces a full redraw at the next update, e.g. after the window was
+        covered or the engine state was replaced in place.
+        """
+        self.background = None
 
-        self._show_texts(engine, moves_str)
-        self._show_blocks(engine)
-        self._show_walls(engine)
-        self._show_spawns(engine)
-        self._show_shelves(engine)
+    def _build_background(self, engine):
+        self.terrain = engine.terrain
+        self.background = pygame.Surface(self.screen.get_size())
+        self.background.fill(self.color_dark)
+        self._show_blocks(self.background, engine)
+        for i, j in np.argwhere(engine.terrain!=0):
+            self._show_static(self.background, engine, i, j)
 
-        pygame.display.update()
-        return True
+    def _cell_rect(self, i, j):
+        return pygame.Rect(j*self.block_size, i*self.block_size+self.header_size, self.block_size+1, self.block_size+1)
+
+    def _show_cell(self, engine, i, j):
+        """
+        Restores the background of a cell and draws its player and parcel.
+        Returns the dirty rect.
+        """
+        rect = self._cell_rect(i, j)
+        # 数字不会画出格子之外, 未改变的相邻格子无需重画
+        self.screen.set_clip(rect)
+        self.screen.blit(self.background, rect, rect)
+        occupied = engine.player_map[i,j]>0 or engine.parcel_map[i,j]>0
+        if engine.player_map[i,j]>0:
+            self._show_player(engine, i, j)
+        if engine.parcel_map[i,j]>0:
+            self._show_parcel(engine, i, j)
+        # 出货点和货架的边框画在AGV之上; 空格子的背景已经有边框, 再画一次抗锯齿的数字会变亮
+        if occupied and engine.terrain[i,j]!=0 and engine.terrain[i,j]!=-1:
+            self._show_static(self.screen, engine, i, j)
+        self.screen.set_clip(None)
+        return rect
 
     def _show_texts(self, engine, moves_str):
-        textsurface, rect = self.text_font.render('YOUR MOVES: '+" ".join(moves_str), self.color_green)
+        rect = pygame.Rect(1, 1, self.screen.get_width()-2, self.header_size-1)
+        self.screen.blit(self.background, rect, rect)
+        # 文字超出标题栏的部分不会被下一帧清除, 裁掉
+        self.screen.set_clip(rect)
+        textsurface, _ = self.text_font.render('YOUR MOVES: '+" ".join(moves_str), self.color_green)
         self.screen.blit(textsurface,(2,10))
-        textsurface, rect = self.text_font.render('SCORE: '+str(engine.score), self.color_green)
+        textsurface, _ = self.text_font.render('SCORE: '+str(engine.score), self.color_green)
         self.screen.blit(textsurface,(2,10+self.text_font_size+10))
-        textsurface, rect = self.text_font.render('STEP: '+str(engine.steps), self.color_green)
-        self.screen.blit(textsurface,(2+engine._map.shape[1]*self.block_size/2, 10+self.text_font_size+10))
-
-    def _show_blocks(self, engine):
-        pygame.draw.lines(self.screen, self.color_green, False, [(0,0),
-                          (engine._map.shape[1]*self.block_size,0)], 1)
-        pygame.draw.lines(self.screen, self.color_green, False, [(0,0),
-                          (0,engine._map.shape[0]*self.block_size+self.header_size)], 1)
-        pygame.draw.lines(self.screen, self.color_green, False, [(engine._map.shape[1]*self.block_size,0),
-                          (engine._map.shape[1]*self.block_size,engine._map.shape[0]*self.block_size+self.header_size)], 1)
-
-        for i in range(engine._map.shape[0]+1):
+        textsurface, _ = self.text_font.render('STEP: '+str(engine.steps), self.color_green)
+        self.screen.blit(textsurface,(2+engine.terrain.shape[1]*self.block_size/2, 10+self.text_font_size+10))
+        self.screen.set_clip(None)
+        return rect
+
+    def _show_blocks(self, surface, engine):
+        height, width = engine.terrain.shape
+        pygame.draw.lines(surface, self.color_green, False, [(0,0),
+                          (width*self.block_size,0)], 1)
+        pygame.draw.lines(surface, self.color_green, False, [(0,0),
+                          (0,height*self.block_size+self.header_size)], 1)
+        pygame.draw.lines(surface, self.color_green, False, [(width*self.block_size,0),
+                          (width*self.block_size,height*self.block_size+self.header_size)], 1)
+
+        for i in range(height+1):
             y = i*self.block_size+self.header_size
-            pygame.draw.lines(self.screen, self.color_green, False, [(0,y),
-                              (engine._map.shape[1]*self.block_size,y)], 1)
-        for i in range(engine._map.shape[1]+1):
+            pygame.draw.lines(surface, self.color_green, False, [(0,y),
+                              (width*self.block_size,y)], 1)
+        for i in range(width+1):
             x = i*self.block_size
-            pygame.draw.lines(self.screen, self.color_green, False, [(x,self.header_size),
-                              (x,engine._map.shape[0]*self.block_size+self.header_size)], 1)
-
-    def _show_walls(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,0]==-1:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = self.block_size
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_green, (0, 0, size, size), 0)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-    def _show_spawns(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,0]==-2:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size*0.8)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_green, (0, 0, size, size), 1)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-    def _show_shelves(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,0]>0:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size*0.8)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_green, (0, 0, size, size), 1)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-                    textsurface, rect = self.num_font.render(str(int(engine._map[i,j,0])), self.color_green)
-                    self.screen.blit(textsurface,(x-int(size/2)+2, y-int(size/2)+2))
-
-    def _show_players(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,2]>0:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size*0.8)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    if engine.players[int(engine._map[i,j,2])-1][2]>0:
-                        pygame.draw.rect(s, self.color_player_2, (0, 0, size, size), 0)
-                    else:
-                        pygame.draw.rect(s, self.color_player_1, (0, 0, size, size), 0)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-                    num_str = str(int(engine._map[i,j,2]))
-                    textsurface, rect = self.num_font.render(num_str, self.color_dark)
-                    font_size = self.num_font.get_metrics(num_str)
-                    font_width = int(np.sum([font_size[i][1]-font_size[i][0]-1 for i in range(len(font_size))]))
-                    font_height = font_size[0][3]-font_size[0][2]
-                    self.screen.blit(textsurface, (x+int(size/2) - font_width - 2,
-                                                   y+int(size/2) - font_height - 2))
-
-    def _show_parcels(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,1]>0:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size * 0.5)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_parcel, (0, 0, size, size), 1)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-                    # 剩余时间
-                    if engine.step_left is not None:
-                        parcel_id = int(engine._map[i,j,1])
-                        num_str = str(engine.step_left[parcel_id-1])
-                        textsurface, rect = self.num_font.render(num_str, self.color_parcel)
-                        font_size = self.num_font.get_metrics(num_str)
-                        font_height = font_size[0][3]-font_size[0][2]
-                        self.screen.blit(textsurface, (x-int(size/2)+2, y-int(size/2)+2))
-
-                    num_str = str(int(engine._map[i,j,1]))
-                    textsurface, rect = self.num_font.render(num_str, self.color_parcel)
-                    font_size = self.num_font.get_metrics(num_str)
-                    font_height = font_size[0][3]-font_size[0][2]
-                    self.screen.blit(textsurface, (x-int(size/2)+2, y+2))
+            pygame.draw.lines(surface, self.color_green, False, [(x,self.header_size),
+                              (x,height*self.block_size+self.header_size)], 1)
+
+    def _show_static(self, surface, engine, i, j):
+        """
+        A wall, spawn or shelf cell.
+        """
+        x = j * self.block_size + int(self.block_size/2)
+        y = i * self.block_size + int(self.block_size/2) + self.header_size
+        value = int(engine.terrain[i,j])
+        if value==-1:
+            size = self.block_size
+            pygame.draw.rect(surface, self.color_green, (x-int(size/2), y-int(size/2), size, size), 0)
+            return
+        size = int(self.block_size*0.8)
+        pygame.draw.rect(surface, self.color_green, (x-int(size/2), y-int(size/2), size, size), 1)
+        if value>0:
+            textsurface, _ = self.num_font.render(str(value), self.color_green)
+            surface.blit(textsurface,(x-int(size/2)+2, y-int(size/2)+2))
+
+    def _show_player(self, engine, i, j):
+        x = j * self.block_size + int(self.block_size/2)
+        y = i * self.block_size + int(self.block_size/2) + self.header_size
+        size = int(self.block_size*0.8)
+        player = int(engine.player_map[i,j])
+        if engine.players[player-1][2]>0:
+            color = self.color_player_2
+        else:
+            color = self.color_player_1
+        pygame.draw.rect(self.screen, color, (x-int(size/2), y-int(size/2), size, size), 0)
+
+        num_str = str(player)
+        textsurface, _ = self.num_font.render(num_str, self.color_dark)
+        font_size = self.num_font.get_metrics(num_str)
+        font_width = int(np.sum([font_size[k][1]-font_size[k][0]-1 for k in range(len(font_size))]))
+        font_height = font_size[0][3]-font_size[0][2]
+        self.screen.blit(textsurface, (x+int(size/2) - font_width - 2,
+                                       y+int(size/2) - font_height - 2))
+
+    def _show_parcel(self, engine, i, j):
+        x = j * self.block_size + int(self.block_size/2)
+        y = i * self.block_size + int(self.block_size/2) + self.header_size
+        size = int(self.block_size * 0.5)
+        pygame.draw.rect(self.screen, self.color_parcel, (x-int(size/2), y-int(size/2), size, size), 1)
+
+        parcel_id = int(engine.parcel_map[i,j])
+        # 剩余时间
+        if engine.step_left is not None:
+            textsurface, _ = self.num_font.render(str(engine.step_left[parcel_id-1]), self.color_parcel)
+            self.screen.blit(textsurface, (x-int(size/2)+2, y-int(size/2)+2))
+
+        textsurface, _ = self.num_font.render(str(parcel_id), self.color_parcel)
+        self.screen.blit(textsurface, (x-int(size/2)+2, y+2))
@@ -3,6 +3,8 @@ import os
 import numpy as np
 import pygame.freetype
 
+from lib.game_display import cell_states, changed_cells
+
 class game_display_X:
     """
     X stands for extremely big. If the map is huge, then use this class to
@@ -38,6 +40,11 @@ class game_display_X:
                                                engine._map.shape[0]*self.block_size+self.header_size+1))
         self.text_font = pygame.freetype.SysFont('Comic Sans MS', self.text_font_size)
 
+        # 静态层只画一次, 之后每帧只重画状态改变的格子
+        self.background = None
+        self.terrain = None
+        self.prev_state = None
+
     def update(self, engine, moves_str=[], isPlaySounds=False):
         """
         return: True  -> The display is on.
@@ -46,121 +53,112 @@ class game_display_X:
         for e in pygame.event.get():
             if e.type == pygame.QUIT:
                 return False
+            if e.type == pygame.VIDEOEXPOSE:
+                self.invalidate()
 
         if not self.mute and isPlaySounds:
             self.sounds[np.random.randint(len(self.sounds))].play()
 
-        # 清屏
-        self.screen.fill(self.color_dark)
-
-        self._show_players(engine)
-        self._show_parcels(engine)
-
-        self._show_texts(engine, moves_str)
-        self._show_blocks(engine)
-        self._show_walls(engine)
-        self._show_spawns(engine)
-        self._show_shelves(engine)
-
-        pygame.display.update()
+        full = self.background is None or self.terrain is not engine.terrain
+        if full:
+            self._build_background(engine)
+            self.screen.blit(self.background, (0, 0))
+            self.prev_state = None
+
+        state = cell_states(engine)
+        rects = [self._show_texts(engine, moves_str)]
+        for i, j in changed_cells(state, self.prev_state):
+            rects.append(self._show_cell(engine, i, j))
+        self.prev_state = state
+
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update(rects)
         return True
 
+    def invalidate(self):
+        """
+        Forces a full redraw at the next update.
+        """
+        self.background = None
+
+    def _build_background(self, engine):
+        self.terrain = engine.terrain
+        self.background = pygame.Surface(self.screen.get_size())
+        self.background.fill(self.color_dark)
+        self._show_blocks(self.background, engine)
+        for i, j in np.argwhere(engine.terrain!=0):
+            self._show_static(self.background, engine, i, j)
+
+        # 标签不变, 也画在背景上
+        textsurface, _ = self.text_font.render('YOUR MOVES:', self.color_green)
+        self.background.blit(textsurface,(2,10))
+        textsurface, _ = self.text_font.render('SCORE:', self.color_green)
+        self.background.blit(textsurface,(2,10+self.text_font_size+10))
+        textsurface, _ = self.text_font.render('STEP:', self.color_green)
+        self.background.blit(textsurface,(2+engine.terrain.shape[1]*self.block_size/2, 10+self.text_font_size+10))
+
+    def _show_cell(self, engine, i, j):
+        rect = pygame.Rect(j*self.block_size, i*self.block_size+self.header_size, self.block_size+1, self.block_size+1)
+        self.screen.blit(self.background, rect, rect)
+        x = j * self.block_size + int(self.block_size/2)
+        y = i * self.block_size + int(self.block_size/2) + self.header_size
+        if engine.player_map[i,j]>0:
+            size = int(self.block_size-2)
+            if engine.players[int(engine.player_map[i,j])-1][2]>0:
+                color = self.color_player_2
+            else:
+                color = self.color_player_1
+            pygame.draw.rect(self.screen, color, (x-int(size/2), y-int(size/2), size, size), 0)
+        if engine.parcel_map[i,j]>0:
+            size = int(self.block_size-4)
+            pygame.draw.rect(self.screen, self.color_parcel, (x-int(size/2), y-int(size/2), size, size), 1)
+        if engine.terrain[i,j]!=0 and engine.terrain[i,j]!=-1:
+            self._show_static(self.screen, engine, i, j)
+        return rect
+
     def _show_texts(self, engine, moves_str):
-        textsurface, rect = self.text_font.render('YOUR MOVES:', self.color_green)
-        self.screen.blit(textsurface,(2,10))
-        textsurface, rect = self.text_font.render('SCORE:', self.color_green)
-        self.screen.blit(textsurface,(2,10+self.text_font_size+10))
-        textsurface, rect = self.text_font.render('STEP:', self.color_green)
-        self.screen.blit(textsurface,(2+engine._map.shape[1]*self.block_size/2, 10+self.text_font_size+10))
-
-        textsurface, rect = self.text_font.render(" ".join(moves_str), self.color_green)
+        rect = pygame.Rect(1, 1, self.screen.get_width()-2, self.header_size-1)
+        self.screen.blit(self.background, rect, rect)
+        # 文字超出标题栏的部分不会被下一帧清除, 裁掉
+        self.screen.set_clip(rect)
+        textsurface, _ = self.text_font.render(" ".join(moves_str), self.color_green)
         self.screen.blit(textsurface,(2+10+self.text_font_size*7+10,10))
-        textsurface, rect = self.text_font.render(str(engine.score), self.color_green)
+        textsurface, _ = self.text_font.render(str(engine.score), self.color_green)
         self.screen.blit(textsurface,(2+self.text_font_size*4,10+self.text_font_size+10))
-        textsurface, rect = self.text_font.render(str(engine.steps), self.color_green)
-        self.screen.blit(textsurface,(2+engine._map.shape[1]*self.block_size/2+self.text_font_size*3, 10+self.text_font_size+10))
-
-    def _show_blocks(self, engine):
-        pygame.draw.lines(self.screen, self.color_green, False, [(0,0),
-                          (engine._map.shape[1]*self.block_size,0)], 1)
-        pygame.draw.lines(self.screen, self.color_green, False, [(0,0),
-                          (0,engine._map.shape[0]*self.block_size+self.header_size)], 1)
-        pygame.draw.lines(self.screen, self.color_green, False, [(engine._map.shape[1]*self.block_size,0),
-                          (engine._map.shape[1]*self.block_size,engine._map.shape[0]*self.block_size+self.header_size)], 1)
-
-        for i in range(engine._map.shape[0]+1):
+        textsurface, _ = self.text_font.render(str(engine.steps), self.color_green)
+        self.screen.blit(textsurface,(2+engine.terrain.shape[1]*self.block_size/2+self.text_font_size*3, 10+self.text_font_size+10))
+        self.screen.set_clip(None)
+        return rect
+
+    def _show_blocks(self, surface, engine):
+        height, width = engine.terrain.shape
+        pygame.draw.lines(surface, self.color_green, False, [(0,0),
+                          (width*self.block_size,0)], 1)
+        pygame.draw.lines(surface, self.color_green, False, [(0,0),
+                          (0,height*self.block_size+self.header_size)], 1)
+        pygame.draw.lines(surface, self.color_green, False, [(width*self.block_size,0),
+                          (width*self.block_size,height*self.block_size+self.header_size)], 1)
+
+        for i in range(height+1):
             y = i*self.block_size+self.header_size
-            pygame.draw.lines(self.screen, self.color_green, False, [(0,y),
-                              (engine._map.shape[1]*self.block_size,y)], 1)
-        for i in range(engine._map.shape[1]+1):
+            pygame.draw.lines(surface, self.color_green, False, [(0,y),
+                              (width*self.block_size,y)], 1)
+        for i in range(width+1):
             x = i*self.block_size
-            pygame.draw.lines(self.screen, self.color_green, False, [(x,self.header_size),
-                              (x,engine._map.shape[0]*self.block_size+self.header_size)], 1)
-
-    def _show_walls(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,0]==-1:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = self.block_size
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_green, (0, 0, size, size), 0)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-    def _show_spawns(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,0]==-2:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size-2)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_green, (0, 0, size, size), 1)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-    def _show_shelves(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,0]>0:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size-2)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_green, (0, 0, size, size), 1)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-    def _show_players(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,2]>0:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size-2)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    if engine.players[int(engine._map[i,j,2])-1][2]>0:
-                        pygame.draw.rect(s, self.color_player_2, (0, 0, size, size), 0)
-                    else:
-                        pygame.draw.rect(s, self.color_player_1, (0, 0, size, size), 0)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
-
-    def _show_parcels(self, engine):
-        for i in range(engine._map.shape[0]):
-            for j in range(engine._map.shape[1]):
-                if engine._map[i,j,1]>0:
-                    x = j * self.block_size + int(self.block_size/2)
-                    y = i * self.block_size + int(self.block_size/2) + self.header_size
-                    size = int(self.block_size-4)
-                    s = pygame.Surface((size,size))
-                    s.fill(self.color_dark)
-                    s.set_colorkey(self.color_dark)
-                    pygame.draw.rect(s, self.color_parcel, (0, 0, size, size), 1)
-                    self.screen.blit(s, (x-int(size/2), y-int(size/2)))
+            pygame.draw.lines(surface, self.color_green, False, [(x,self.header_size),
+                              (x,height*self.block_size+self.header_size)], 1)
+
+    def _show_static(self, surface, engine, i, j):
+        """
+        A wall, spawn or shelf cell.
+        """
+        x = j * self.block_size + int(self.block_size/2)
+        y = i * self.block_size + int(self.block_size/2) + self.header_size
+        if engine.terrain[i,j]==-1:
+            size = self.block_size
+            pygame.draw.rect(surface, self.color_green, (x-int(size/2), y-int(size/2), size, size), 0)
+        else:
+            size = int(self.block_size-2)
+            pygame.draw.rect(surface, self.color_green, (x-int(size/2), y-int(size/2), size, size), 1)
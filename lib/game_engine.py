@@ -1,6 +1,100 @@
 import numpy as np
 import threading
 
+from lib.spatial_index import grid_index
+from lib.parcel_events import as_parcel_events
+
+def min_int_dtype(max_value, signed=False):
+    """
+    The narrowest integer dtype holding 0..max_value (and -128.. if signed).
+    """
+    for dtype in ([np.int8, np.int16, np.int32] if signed else [np.uint8, np.uint16, np.uint32]):
+        if max_value<=np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class layered_map:
+    """
+    Compatibility view of the engine's layers as the old (x,y,3) int array:
+    terrain (walls -1, spawns -2, shelves >0), parcels and players, each
+    stored in its own narrow integer array.
+
+    Indexing one layer, e.g. _map[:,:,2] or _map[x,y,1], indexes that layer
+    only: single cells are returned as ints, slices as views of the narrow
+    layer, so _map[:,:,1][x,y] = v writes through as it did on the old array.
+    Indices spanning several layers, e.g. _map[x,y] or _map[a:b,:,:], stack
+    only the selected cells into a read-only int array, writing into it
+    raises instead of being silently lost. np.asarray(_map) builds the
+    dense array.
+    """
+    ndim = 3
+    dtype = np.dtype(int)
+
+    def __init__(self, terrain, parcels, players):
+        self.layers = (terrain, parcels, players)
+        self.shape = terrain.shape+(3,)
+
+    @classmethod
+    def from_array(cls, _map, n_players=None):
+        _map = np.asarray(_map)
+        n_shelves = max(int(np.max(_map[:,:,0])), 0)
+        if n_players is None:
+            n_players = int(np.max(_map[:,:,2]))
+        return cls(_map[:,:,0].astype(min_int_dtype(max(n_shelves, 2), signed=True)),
+                   _map[:,:,1].astype(min_int_dtype(n_shelves)),
+                   _map[:,:,2].astype(min_int_dtype(n_players)))
+
+    @staticmethod
+    def _split(index):
+        """
+        index -> (index of the cells, index of the layers)
+        """
+        if not isinstance(index, tuple):
+            index = (index,)
+        if any(i is Ellipsis or i is None for i in index):
+            raise IndexError("layered_map supports [x, y, layer] indices only")
+        # 二维布尔掩码同时索引 x 和 y 两个轴
+        n_cell_axes = 2 if isinstance(index[0], np.ndarray) and index[0].dtype==bool and index[0].ndim==2 else 1
+        if len(index)>4-n_cell_axes:
+            raise IndexError("layered_map supports [x, y, layer] indices only")
+        index = index+(slice(None),)*(4-n_cell_axes-len(index))
+        if not isinstance(index[-1], (int, np.integer, slice)):
+            raise IndexError("the layer index of a layered_map must be an int or a slice")
+        return index[:-1], index[-1]
+
+    def __getitem__(self, index):
+        cells, k = self._split(index)
+        if isinstance(k, slice):
+            result = np.stack([self.layers[j][cells].astype(int) for j in range(3)[k]], axis=-1)
+            # 多层的结果是副本, 设为只读, 写入时报错而不是被忽略
+            result.setflags(write=False)
+            return result
+        result = self.layers[k][cells]
+        return result if isinstance(result, np.ndarray) else int(result)
+
+    def __setitem__(self, index, value):
+        cells, k = self._split(index)
+        if isinstance(k, slice):
+            value = np.asarray(value)
+            for n, j in enumerate(range(3)[k]):
+                self.layers[j][cells] = value if value.ndim==0 else value[...,n]
+        else:
+            self.layers[k][cells] = value
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.stack([layer.astype(int) for layer in self.layers], axis=2)
+        return dense if dtype is None else dense.astype(dtype)
+
+    def astype(self, dtype):
+        return np.asarray(self, dtype=dtype)
+
+    def copy(self):
+        return layered_map(*[np.copy(layer) for layer in self.layers])
+
+    @property
+    def nbytes(self):
+        return sum(layer.nbytes for layer in self.layers)
+
 class game_engine:
     """
     规则:
@@ -26,126 +120,144 @@ class game_engine:
         """
         self._lock = threading.Lock() # 避免 atomic 未同步
         self.auto_unload = auto_unload
-        self._map = _map.astype(int)
+        # 地形 包裹 AGV 三层分别以最窄的整数类型保存, self._map 为兼容旧代码的视图
+        self._set_layers(_map.copy() if isinstance(_map, layered_map) else _map)
         self.should_gen = parcel_gen_gap>0 or (parcel_gen_seq is not None)
         self.parcel_gen_gap = parcel_gen_gap
-        self.parcel_gen_seq = parcel_gen_seq # [[(x11,y11,shelf11)], [], [(x21,y21,shelf21),(x22,y22,shelf22)], ...]
+        # parcel_events, lists of the old format [[(x11,y11,shelf11)], [], [(x21,y21,shelf21),(x22,y22,shelf22)], ...] are converted
+        self.parcel_gen_seq = as_parcel_events(parcel_gen_seq, step_left is not None)
         self.success_score = 10
 
         if dl_bound is None:
-            self.lower_dl = 1 * (self._map.shape[0]+self._map.shape[1])
-            self.upper_dl = 4 * (self._map.shape[0]+self._map.shape[1])
+            self.lower_dl = 1 * (self.terrain.shape[0]+self.terrain.shape[1])
+            self.upper_dl = 4 * (self.terrain.shape[0]+self.terrain.shape[1])
         else:
             self.lower_dl, self.upper_dl = dl_bound
 
+        # 包裹坐标由引擎维护, 与货架坐标一起供 planner 与计分直接读取
+        self._build_parcel_index()
+
         if step_left is None:
             self.step_left = None
         elif len(step_left)==0:
-            self.step_left = -np.ones([np.max(self._map[:,:,0])], dtype=int)
+            self.step_left = -np.ones([self.n_shelves], dtype=int)
             for i in range(len(self.step_left)):
-                if i+1 in self._map[:,:,1]:
+                if self.parcel_coords[i,0]>=0:
                     self.step_left[i] = np.random.randint(self.upper_dl-self.lower_dl+1)+self.lower_dl
         else:
             self.step_left = step_left
         self.score = 0
         self.steps = 0
+        # 每次 step 或 set_state 加一, 供 planner 判断缓存是否过期
+        self.state_version = 0
 
         self.n_delivered = 0
         self.n_delayed = 0
 
         # i, j, whether the player carries a parcel. 注意 逻辑ij和显示时的xy是相反的
-        self.players = np.zeros([np.sum(_map[:,:,2]>0),3])
-        for i in range(_map.shape[0]):
-            for j in range(_map.shape[1]):
-                if self._map[i,j,2]>0:
-                    self.players[self._map[i,j,2]-1][0] = i
-                    self.players[self._map[i,j,2]-1][1] = j
+        self.players = np.zeros([np.sum(self.player_map>0),3], dtype=np.int32)
+        self.players[:,:2] = self._find_coords(self.player_map, len(self.players))
+        self._build_player_index()
+
+    def _set_layers(self, _map):
+        if not isinstance(_map, layered_map):
+            _map = layered_map.from_array(_map)
+        self._map = _map
+        self.terrain, self.parcel_map, self.player_map = _map.layers
+        self.n_shelves = max(int(np.max(self.terrain)), 0)
+        # 货架坐标及包裹重生点只随地形改变
+        self.shelf_coords = self._find_coords(self.terrain, self.n_shelves)
+        self.spawn_coords = np.argwhere(self.terrain==-2)
+
+    def _find_coords(self, layer, n):
+        """
+        Returns the (n, 2) coords of the ids 1..n in layer, -1 for the absent ones.
+        """
+        coords = -np.ones([max(int(n), 0), 2], dtype=int)
+        cells = np.argwhere(layer>0)
+        coords[layer[cells[:,0], cells[:,1]].astype(int)-1] = cells
+        return coords
+
+    def _build_parcel_index(self):
+        self.parcel_coords = self._find_coords(self.parcel_map, self.n_shelves)
+        self.n_parcels = int(np.sum(self.parcel_coords[:,0]>=0))
+        # 包裹的空间索引, 元素为包裹编号-1 (与 parcel_coords 的下标一致)
+        self.parcel_index = grid_index(self.terrain.shape)
+        for k in np.nonzero(self.parcel_coords[:,0]>=0)[0]:
+            self.parcel_index.insert(int(k), *self.parcel_coords[k])
+
+    def _build_player_index(self):
+        # AGV的空间索引, 元素为AGV下标
+        self.player_index = grid_index(self.terrain.shape)
+        for i, (x, y) in enumerate(self.players[:,:2].astype(int)):
+            self.player_index.insert(i, x, y)
+
+    def _set_parcel(self, x, y, parcel):
+        """
+        Writes parcel (0 to clear) to the parcel layer at (x,y) and keeps
+        parcel_coords and n_parcels in sync.
+        """
+        old = self.parcel_map[x,y]
+        if old>0:
+            self.parcel_coords[old-1] = -1
+            self.parcel_index.remove(int(old)-1)
+            self.n_parcels -= 1
+        self.parcel_map[x,y] = parcel
+        if parcel>0:
+            self.parcel_coords[parcel-1] = (x, y)
+            self.parcel_index.insert(int(parcel)-1, x, y)
+            self.n_parcels += 1
+
+    def _count_timeout(self):
+        if self.step_left is None:
+            return 0
+        return int(np.sum((self.parcel_coords[:,0]>=0) & (self.step_left<0)))
 
     def step(self, moves):
         """
         moves = [move_0, move_1, ...]
         move = (x,y,grab)
-        The function updates self._map, and returns the reward.
+        The function updates the map layers, and returns the reward.
         """
+        n = len(self.players)
+        move_arr = np.zeros([n,3], dtype=int)
+        if len(moves)>0:
+            move_arr[:min(len(moves), n)] = np.array(moves, dtype=int).reshape(-1,3)[:n]
+        pos = self.players[:,:2].astype(int)
 
-        moves_indices = np.array([[i,move[0],move[1],move[2]] for i,move in enumerate(moves)])
-        moves_indices = np.random.permutation(moves_indices)
-
-
-        candidates = []
-        for move in moves_indices:
-            if int(move[0])>=len(self.players): continue
-            old_pos = (self.players[int(move[0])][:2]).astype(int)
-            new_pos = (old_pos+move[1:3]).astype(int)
-            if np.sum(np.abs(old_pos-new_pos))>0:
-                # 过界
-                if new_pos[0]<0 or new_pos[1]<0 or new_pos[0]>=self._map.shape[0] or new_pos[1]>=self._map.shape[1]:
-                    continue
-                # 墙壁
-                if self._map[new_pos[0], new_pos[1]][0]==-1:
-                    continue
-                # 其他AGV
-                if self._map[new_pos[0], new_pos[1]][2]>0:
-                    candidates.append(move)
-                    continue
-                # 若AGV身上有货物
-                if self.players[int(move[0])][2]!=0:
-                    # 非AGV上的货物
-                    if self._map[new_pos[0], new_pos[1]][1]>0 and self._map[new_pos[0], new_pos[1]][2]<=0:
-                        continue
-                self.players[int(move[0])][:2] = new_pos
-                self.update_player_map() # 更新AGV位置
-                # 如果身上带着货物 更新货物位置
-                if self.players[int(move[0])][2]!=0:
-                    self._map[:,:,1][new_pos[0], new_pos[1]] = self.players[int(move[0])][2]
-                    self._map[:,:,1][old_pos[0], old_pos[1]] = 0
-
-            # 抓起/放下
-            if self.auto_unload:
-                if self.players[int(move[0])][2]>0 and self._map[new_pos[0], new_pos[1], 0]==self.players[int(move[0])][2]:
-                    self.players[int(move[0])][2] = 0
-                if move[-1]!=0 and self.players[int(move[0])][2]==0:
-                    self.players[int(move[0])][2] = self._map[:,:,1][old_pos[0], old_pos[1]]
-            else:
-                if move[-1]!=0:
-                    if self.players[int(move[0])][2]>0:
-                        self.players[int(move[0])][2] = 0
-                    else:
-                        self.players[int(move[0])][2] = self._map[:,:,1][old_pos[0], old_pos[1]]
-
-        candidate_last_length = -1
-        while(len(candidates)>0 and not(len(candidates)==candidate_last_length)):
-            # 更好的实现方法是 topological sort 否则无法解决环的问题
-            new_candidates = []
-            for move in candidates:
-                old_pos = (self.players[int(move[0])][:2]).astype(int)
-                new_pos = (old_pos+move[1:3]).astype(int)
-                # 其他AGV
-                if self._map[new_pos[0], new_pos[1]][2]>0:
-                    new_candidates.append(move)
-                    continue
-                self.players[int(move[0])][:2] = new_pos
-                self.update_player_map() # 更新AGV位置
-                # 如果身上带着货物 更新货物位置
-                if self.players[int(move[0])][2]!=0:
-                    self._map[:,:,1][new_pos[0], new_pos[1]] = self.players[int(move[0])][2]
-                    self._map[:,:,1][old_pos[0], old_pos[1]] = 0
-
-                # 抓起/放下
-                if self.auto_unload:
-                    if self.players[int(move[0])][2]>0 and self._map[new_pos[0], new_pos[1], 0]==self.players[int(move[0])][2]:
-                        self.players[int(move[0])][2] = 0
-                    if move[-1]!=0 and self.players[int(move[0])][2]==0:
-                        self.players[int(move[0])][2] = self._map[:,:,1][old_pos[0], old_pos[1]]
-                else:
-                    if move[-1]!=0:
-                        if self.players[int(move[0])][2]>0:
-                            self.players[int(move[0])][2] = 0
-                        else:
-                            self.players[int(move[0])][2] = self._map[:,:,1][old_pos[0], old_pos[1]]
-
-            candidate_last_length = len(candidates)
-            candidates = new_candidates
+        moving, target, blocked = self._resolve_moves(pos, move_arr)
+
+        # 先清空所有移动AGV(及其货物)的原位置 再写入新位置 这样环形移动也能正确更新
+        movers = np.nonzero(moving)[0]
+        if len(movers)>0:
+            old, new = pos[movers], target[movers]
+            self.player_map[old[:,0], old[:,1]] = 0
+            self.player_map[new[:,0], new[:,1]] = movers+1
+            self.players[movers,:2] = new
+            for i, (x, y) in zip(movers.tolist(), new.tolist()):
+                self.player_index.move(i, x, y)
+            carriers = movers[self.players[movers,2]!=0]
+            if len(carriers)>0:
+                parcels = self.players[carriers,2].astype(int)
+                old, new = pos[carriers], target[carriers]
+                self.parcel_map[old[:,0], old[:,1]] = 0
+                self.parcel_map[new[:,0], new[:,1]] = parcels
+                self.parcel_coords[parcels-1] = new
+                for k, (x, y) in zip((parcels-1).tolist(), new.tolist()):
+                    self.parcel_index.move(k, x, y)
+
+        # 抓起/放下 移动失败的AGV不执行
+        cur = self.players[:,:2].astype(int)
+        carry = self.players[:,2].astype(int)
+        grab = (move_arr[:,2]!=0) & ~blocked
+        here = self.parcel_map[cur[:,0], cur[:,1]]
+        if self.auto_unload:
+            carry[(carry>0) & (self.terrain[cur[:,0], cur[:,1]]==carry)] = 0
+            grab &= (carry==0)
+            carry[grab] = here[grab]
+        else:
+            carry[grab] = np.where(carry[grab]>0, 0, here[grab])
+        self.players[:,2] = carry
 
         delta_score = self.update_score() # 检查是否有包裹摆放到位 有的话更新分数
 
@@ -161,102 +273,156 @@ class game_engine:
 
         if self.step_left is not None:
             self.step_left-=1
-            for i in range(len(self.step_left)):
-                if self.step_left[i]<0: self.step_left[i]=-1
+            self.step_left[self.step_left<0] = -1
 
         self.steps+=1
+        self.state_version+=1
         return delta_score
 
-    def update_player_map(self):
-        player_map = np.zeros(self._map.shape[:2])
-        for i,p in enumerate(self.players):
-            player_map[int(p[0]), int(p[1])] = i+1
-        self._map[:,:,2] = player_map
+    def _resolve_moves(self, pos, move_arr):
+        """
+        Decides which players move this step.
+        The legality of every move (bounds, walls, parcels for loaded AGVs) is
+        checked at once with numpy, and a cell wanted by several players goes
+        to a random one of them. Every remaining mover depends on at most the
+        one player standing on its target, and every cell has at most one
+        mover heading to it, so the dependencies form chains and cycles that
+        are resolved in a single pass: a chain moves iff its head moves into a
+        free cell, a rotating cycle of 3+ players moves as a whole, and a
+        2-cycle (a head-on swap) is not allowed.
+        Returns (moving, target, blocked), blocked marking the players whose
+        move was rejected.
+        """
+        n = len(pos)
+        h, w = self.terrain.shape
+        carry = self.players[:,2].astype(int)
+        target = pos+move_arr[:,:2]
+        wants = np.any(move_arr[:,:2]!=0, axis=1)
+
+        # 过界 与 墙壁
+        legal = wants & np.all(target>=0, axis=1) & (target[:,0]<h) & (target[:,1]<w)
+        tx = np.where(legal, target[:,0], 0)
+        ty = np.where(legal, target[:,1], 0)
+        legal &= self.terrain[tx, ty]!=-1
+        # 若AGV身上有货物 不能前往有货的格子 除非该货物正在被格子上的AGV带走
+        occupant = self.player_map[tx, ty].astype(int)
+        occupant_carry = np.where(occupant>0, carry[occupant-1], 0)
+        legal &= ~((carry!=0) & (self.parcel_map[tx, ty]>0) & ~((occupant>0) & (occupant_carry!=0)))
+
+        # 多个AGV目标格子相同时 随机一方可以成功
+        rank = np.random.permutation(n)
+        candidates = np.nonzero(legal)[0]
+        candidates = candidates[np.argsort(rank[candidates], kind="stable")]
+        _, first = np.unique(target[candidates,0]*w+target[candidates,1], return_index=True)
+        winners = np.zeros(n, dtype=bool)
+        winners[candidates[first]] = True
+        legal &= winners
+
+        succ = np.where(legal & (occupant>0), occupant-1, -1).tolist()
+        legal_list = legal.tolist()
+        moving = np.zeros(n, dtype=bool)
+        resolved = np.zeros(n, dtype=bool)
+        for i in np.nonzero(legal)[0].tolist():
+            if resolved[i]: continue
+            path = []
+            on_path = {}
+            j = i
+            cycle_start = -1
+            while True:
+                if resolved[j]:
+                    ok = moving[j]
+                    break
+                if j in on_path:
+                    cycle_start = on_path[j]
+                    ok = (len(path)-cycle_start)>=3
+                    break
+                on_path[j] = len(path)
+                path.append(j)
+                if not legal_list[j]:
+                    ok = False
+                    break
+                if succ[j]<0:
+                    ok = True
+                    break
+                j = succ[j]
+            moving[path] = ok
+            resolved[path] = True
+
+        blocked = wants & ~moving
+        return moving, target, blocked
 
     def update_score(self):
-        correct_map = (self._map[:,:,0]==self._map[:,:,1]).astype(int) * (self._map[:,:,1]!=0).astype(int)
-        for p in self.players:
-            if p[2]!=0:
-                correct_map[int(p[0]),int(p[1])]=0
-        correct_coords = np.argwhere(correct_map==1)
-        parcel_coords = np.argwhere(self._map[:,:,1]>0)
+        ids = np.nonzero(self.parcel_coords[:,0]>=0)[0]
+        coords = self.parcel_coords[ids]
+        # 包裹在对应货架上 且不在带货的AGV身上
+        correct = np.all(coords==self.shelf_coords[ids], axis=1)
+        carriers = self.player_map[coords[:,0], coords[:,1]].astype(int)
+        correct &= ~((carriers>0) & (self.players[carriers-1,2]!=0))
+        correct_ids = ids[correct]
         _s = 0
         if self.step_left is not None:
-            for x,y in parcel_coords:
-                if self.step_left[self._map[x,y,1]-1]<0:
-                    _s-=1
-            for x,y in correct_coords:
-                if self.step_left[self._map[x,y,1]-1]<0:
-                    self.n_delayed+=1
-                _s+=self.success_score
-                self.n_delivered+=1
-                self.step_left[self._map[x,y,1]-1] = -1
-        else:
-            for x,y in correct_coords:
-                _s+=self.success_score
-                self.n_delivered+=1
+            _s -= int(np.sum(self.step_left[ids]<0))
+            self.n_delayed += int(np.sum(self.step_left[correct_ids]<0))
+            self.step_left[correct_ids] = -1
+        _s += self.success_score*len(correct_ids)
+        self.n_delivered += len(correct_ids)
 
         with self._lock:
             self.score+=_s
 
-        self._map[:,:,1] *= (correct_map==0)
+        for x,y in self.parcel_coords[correct_ids]:
+            self._set_parcel(x, y, 0)
         return _s
 
     def generate_parcels(self, num):
         if self.parcel_gen_seq is None:
             for _ in range(num):
-                shelf_max = np.max(self._map[:,:,0])
-                spawn_locs = (self._map[:,:,0]==-2).astype(int)
-                parcel_locs = (self._map[:,:,1]>0).astype(int)
-                parcel_locs *= spawn_locs
-                avail_locs = spawn_locs-parcel_locs
-                if np.sum(avail_locs) == 0:
+                shelf_max = len(self.shelf_coords)
+                spawns = self.spawn_coords
+                avail_locs = spawns[self.parcel_map[spawns[:,0], spawns[:,1]]==0]
+                if len(avail_locs) == 0:
                     # 包裹重生点已被占满
                     break
-                if np.sum(self._map[:,:,1]>0)>=shelf_max:
+                if self.n_parcels>=shelf_max:
                     # 已经不可能产生不重复的包裹
                     break
-                avail_indices = np.nonzero(avail_locs)
-                loc_id = np.random.randint(len(avail_indices[0]))
-                loc = (avail_indices[0][loc_id],avail_indices[1][loc_id])
+                loc_id = np.random.randint(len(avail_locs))
+                loc = avail_locs[loc_id]
 
                 # 同一时间 每个parcel目的地不能相同
-                p = np.ones(shelf_max)
-                for i in range(shelf_max):
-                    if (i+1) in self._map[:,:,1]:
-                        p[i]=0
+                p = (self.parcel_coords[:,0]<0).astype(float)
                 p = p/np.sum(p)
                 obj = int(np.random.choice(np.arange(shelf_max)+1, p = p))
                 if self.step_left is not None:
                     self.step_left[obj-1] = np.random.randint(self.upper_dl-self.lower_dl+1)+self.lower_dl
-                self._map[loc[0],loc[1],1] = obj
+                self._set_parcel(loc[0], loc[1], obj)
         else:
-            if self.step_left is not None:
-                for x,y,shelf_index,dl in self.parcel_gen_seq[self.steps]:
-                    if self._map[x,y,1]==0 and shelf_index not in self._map[:,:,1]:
-                        self._map[x,y,1] = shelf_index
+            events = self.parcel_gen_seq.at(self.steps)
+            for x,y,shelf_index,dl in zip(events["x"].tolist(), events["y"].tolist(),
+                                          events["shelf"].tolist(), events["deadline"].tolist()):
+                if self.parcel_map[x,y]==0 and self.parcel_coords[shelf_index-1,0]<0:
+                    self._set_parcel(x, y, shelf_index)
+                    if self.step_left is not None:
                         self.step_left[shelf_index-1] = dl
-            else:
-                for x,y,shelf_index in self.parcel_gen_seq[self.steps]:
-                    if self._map[x,y,1]==0 and shelf_index not in self._map[:,:,1]:
-                        self._map[x,y,1] = shelf_index
 
     def get_score(self):
         # score, num_delivered, num_time_out
-        parcel_coords = np.argwhere(self._map[:,:,1]>0)
-        n_timeout = 0
-        if self.step_left is not None:
-            for x,y in parcel_coords:
-                if self.step_left[self._map[x,y,1]-1]<0:
-                    n_timeout+=1
-        return self.steps, self.score, self.n_delivered, self.n_delayed, n_timeout
+        # 超时数由 step_left 与 parcel_coords 现算, 外部修改 step_left 后也不会过时
+        return self.steps, self.score, self.n_delivered, self.n_delayed, self._count_timeout()
 
     def get_state(self):
+        # 只复制紧凑的三层, 返回的 layered_map 可以像旧的 (x,y,3) 数组一样读取
         if self.step_left is not None:
-            return np.copy(self._map), np.copy(self.players), np.copy(self.step_left)
-        return np.copy(self._map), np.copy(self.players), None
+            return self._map.copy(), np.copy(self.players), np.copy(self.step_left)
+        return self._map.copy(), np.copy(self.players), None
 
     def set_state(self, _map, players, step_left=None):
-        self._map = _map
-        self.players = players
+        """
+        _map: a layered_map from get_state, or a (x,y,3) array
+        """
+        self._set_layers(_map)
+        self.players = np.asarray(players).astype(np.int32)
         self.step_left = step_left
+        self._build_parcel_index()
+        self._build_player_index()
+        self.state_version += 1
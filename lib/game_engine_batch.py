@@ -0,0 +1,267 @@
+import numpy as np
+
+from lib.parcel_events import as_parcel_events
+
+class game_engine_batch:
+    """
+    Steps B independent instances of game_engine at once. The state of all
+    instances is stored in stacked arrays:
+        _map         : (B, x, y, 3), the same layers as game_engine._map
+        players      : (B, n_players, 3), i, j, the parcel carried
+        step_left    : (B, n_shelves) or None
+        parcel_coords: (B, n_shelves, 2), -1 for the absent parcels
+    The rules are the ones of game_engine.step, update_score and
+    generate_parcels, applied to every instance with numpy instead of a
+    Python loop over engines. Only the random streams differ.
+    """
+
+    def __init__(self, _maps, parcel_gen_gap, parcel_gen_seqs=None, step_left=None, dl_bound=None, auto_unload=False):
+        """
+        _maps: (B, x, y, 3) array, or a list of B (x, y, 3) maps of the same
+               shape and with the same number of players.
+        parcel_gen_seqs: None, or a list of B parcel_gen_seq or parcel_events
+                         (see game_engine), no parcels past their horizon
+        step_left: None: no deadline
+                   np.array([]) or []: random deadlines given by the engine
+                   (B, n_shelves) array: the given deadlines
+        """
+        self.auto_unload = auto_unload
+        self._map = np.array(_maps, dtype=int)
+        self.batch_size, h, w, _ = self._map.shape
+        self.should_gen = parcel_gen_gap>0 or (parcel_gen_seqs is not None)
+        self.parcel_gen_gap = parcel_gen_gap
+        self.parcel_gen_seqs = None
+        if parcel_gen_seqs is not None:
+            self.parcel_gen_seqs = [as_parcel_events(seq, step_left is not None) for seq in parcel_gen_seqs]
+        self.success_score = 10
+
+        if dl_bound is None:
+            self.lower_dl = 1 * (h+w)
+            self.upper_dl = 4 * (h+w)
+        else:
+            self.lower_dl, self.upper_dl = dl_bound
+
+        n_shelves = max(int(np.max(self._map[:,:,:,0])), 0)
+        n_players = int(np.sum(self._map[0,:,:,2]>0))
+        self.shelf_coords = self._find_coords(self._map[...,0], n_shelves)
+        self.parcel_coords = self._find_coords(self._map[...,1], n_shelves)
+        self.players = np.zeros([self.batch_size, n_players, 3], dtype=int)
+        self.players[:,:,:2] = self._find_coords(self._map[...,2], n_players)
+        self._spawns = [np.argwhere(self._map[b,:,:,0]==-2) for b in range(self.batch_size)]
+
+        if step_left is None:
+            self.step_left = None
+        elif len(step_left)==0:
+            self.step_left = -np.ones([self.batch_size, n_shelves], dtype=int)
+            present = self.parcel_coords[:,:,0]>=0
+            self.step_left[present] = np.random.randint(self.upper_dl-self.lower_dl+1, size=np.sum(present))+self.lower_dl
+        else:
+            self.step_left = np.array(step_left, dtype=int).reshape(self.batch_size, n_shelves)
+
+        self.score = np.zeros(self.batch_size, dtype=int)
+        self.steps = 0
+        self.n_delivered = np.zeros(self.batch_size, dtype=int)
+        self.n_delayed = np.zeros(self.batch_size, dtype=int)
+
+    def _find_coords(self, layers, n):
+        coords = -np.ones([self.batch_size, n, 2], dtype=int)
+        b, x, y = np.nonzero(layers>0)
+        coords[b, layers[b, x, y]-1] = np.stack([x, y], axis=1)
+        return coords
+
+    def step(self, moves):
+        """
+        moves: (B, n_players, 3) array of (x,y,grab)
+        Returns the (B,) rewards.
+        """
+        bsz, n = self.players.shape[:2]
+        move_arr = np.asarray(moves, dtype=int).reshape(bsz, n, 3)
+        pos = self.players[:,:,:2]
+
+        moving, target, blocked = self._resolve_moves(pos, move_arr)
+
+        # 先清空所有移动AGV(及其货物)的原位置 再写入新位置
+        b, i = np.nonzero(moving)
+        if len(b)>0:
+            old, new = pos[b, i], target[b, i]
+            self._map[b, old[:,0], old[:,1], 2] = 0
+            self._map[b, new[:,0], new[:,1], 2] = i+1
+            carrying = self.players[b, i, 2]!=0
+            if np.any(carrying):
+                cb, parcels = b[carrying], self.players[b[carrying], i[carrying], 2]
+                old, new = old[carrying], new[carrying]
+                self._map[cb, old[:,0], old[:,1], 1] = 0
+                self._map[cb, new[:,0], new[:,1], 1] = parcels
+                self.parcel_coords[cb, parcels-1] = new
+            self.players[b, i, :2] = target[b, i]
+
+        # 抓起/放下 移动失败的AGV不执行
+        bs = np.arange(bsz)[:,None]
+        cur = self.players[:,:,:2]
+        carry = self.players[:,:,2]
+        grab = (move_arr[:,:,2]!=0) & ~blocked
+        here = self._map[bs, cur[:,:,0], cur[:,:,1], 1]
+        if self.auto_unload:
+            carry[(carry>0) & (self._map[bs, cur[:,:,0], cur[:,:,1], 0]==carry)] = 0
+            grab &= (carry==0)
+            carry[grab] = here[grab]
+        else:
+            carry[grab] = np.where(carry[grab]>0, 0, here[grab])
+
+        delta_score = self.update_score()
+
+        if self.should_gen:
+            if self.parcel_gen_seqs is None:
+                if self.parcel_gen_gap<1:
+                    nums = np.round(np.random.random(bsz) * 2 / self.parcel_gen_gap).astype(int)
+                else:
+                    nums = (np.random.random(bsz)<(1/self.parcel_gen_gap)).astype(int)
+                self.generate_parcels(nums)
+            else:
+                self.generate_parcels(None)
+
+        if self.step_left is not None:
+            self.step_left-=1
+            self.step_left[self.step_left<0] = -1
+
+        self.steps+=1
+        return delta_score
+
+    def _resolve_moves(self, pos, move_arr):
+        """
+        The batched version of game_engine._resolve_moves. The chains of
+        dependent moves of all instances are resolved together by pointer
+        jumping, so the number of numpy passes grows with log(chain length).
+        """
+        bsz, n = pos.shape[:2]
+        h, w = self._map.shape[1:3]
+        carry = self.players[:,:,2]
+        target = pos+move_arr[:,:,:2]
+        wants = np.any(move_arr[:,:,:2]!=0, axis=2)
+        bs = np.arange(bsz)[:,None]
+
+        # 过界 与 墙壁
+        legal = wants & np.all(target>=0, axis=2) & (target[:,:,0]<h) & (target[:,:,1]<w)
+        tx = np.where(legal, target[:,:,0], 0)
+        ty = np.where(legal, target[:,:,1], 0)
+        legal &= self._map[bs, tx, ty, 0]!=-1
+        # 若AGV身上有货物 不能前往有货的格子 除非该货物正在被格子上的AGV带走
+        occupant = self._map[bs, tx, ty, 2]
+        occupant_carry = np.where(occupant>0, carry[bs, np.maximum(occupant-1, 0)], 0)
+        legal &= ~((carry!=0) & (self._map[bs, tx, ty, 1]>0) & ~((occupant>0) & (occupant_carry!=0)))
+
+        # 多个AGV目标格子相同时 随机一方可以成功
+        flat_legal = legal.ravel()
+        cells = (np.arange(bsz)[:,None]*h*w+tx*w+ty).ravel()
+        candidates = np.nonzero(flat_legal)[0]
+        order = np.lexsort((np.random.random(len(candidates)), cells[candidates]))
+        candidates = candidates[order]
+        first = np.ones(len(candidates), dtype=bool)
+        first[1:] = cells[candidates[1:]]!=cells[candidates[:-1]]
+        flat_legal[:] = False
+        flat_legal[candidates[first]] = True
+
+        # 依赖链: AGV能否移动取决于目标格子上的AGV能否移动
+        g = bsz*n
+        succ = np.where(flat_legal & (occupant.ravel()>0),
+                        (np.arange(bsz)[:,None]*n+occupant-1).ravel(), -1)
+        state = -np.ones(g, dtype=int) # -1 unresolved, 0 blocked, 1 moving
+        state[~flat_legal] = 0
+        state[flat_legal & (succ<0)] = 1
+        nxt = np.where(succ>=0, succ, np.arange(g))
+        for _ in range(int(np.ceil(np.log2(max(n, 2))))+1):
+            unresolved = np.nonzero(state<0)[0]
+            if len(unresolved)==0: break
+            s = state[nxt[unresolved]]
+            state[unresolved] = s
+            unresolved = unresolved[s<0]
+            nxt[unresolved] = nxt[nxt[unresolved]]
+        # 剩下的均处于环中 二元环(对向交换)不允许
+        cycle = np.nonzero(state<0)[0]
+        state[cycle] = (succ[succ[cycle]]!=cycle).astype(int)
+
+        moving = (state==1).reshape(bsz, n)
+        blocked = wants & ~moving
+        return moving, target, blocked
+
+    def update_score(self):
+        bsz = self.batch_size
+        present = self.parcel_coords[:,:,0]>=0
+        # 包裹在对应货架上 且不在带货的AGV身上
+        correct = present & np.all(self.parcel_coords==self.shelf_coords, axis=2)
+        b, p = np.nonzero(correct)
+        coords = self.parcel_coords[b, p]
+        carriers = self._map[b, coords[:,0], coords[:,1], 2]
+        carried = carriers>0
+        carried[carried] = self.players[b[carried], carriers[carried]-1, 2]!=0
+        correct[b[carried], p[carried]] = False
+
+        _s = self.success_score*np.sum(correct, axis=1)
+        if self.step_left is not None:
+            _s -= np.sum(present & (self.step_left<0), axis=1)
+            self.n_delayed += np.sum(correct & (self.step_left<0), axis=1)
+            self.step_left[correct] = -1
+        self.n_delivered += np.sum(correct, axis=1)
+        self.score += _s
+
+        b, p = np.nonzero(correct)
+        coords = self.parcel_coords[b, p]
+        self._map[b, coords[:,0], coords[:,1], 1] = 0
+        self.parcel_coords[b, p] = -1
+        return _s
+
+    def _add_parcel(self, b, x, y, parcel, dl=None):
+        self._map[b, x, y, 1] = parcel
+        self.parcel_coords[b, parcel-1] = (x, y)
+        if dl is not None:
+            self.step_left[b, parcel-1] = dl
+
+    def generate_parcels(self, nums):
+        """
+        nums: (B,) number of parcels to generate per instance, ignored when
+        the instances replay parcel_gen_seqs.
+        """
+        n_shelves = self.parcel_coords.shape[1]
+        if self.parcel_gen_seqs is None:
+            for b in np.nonzero(nums)[0]:
+                spawns = self._spawns[b]
+                for _ in range(nums[b]):
+                    avail_locs = spawns[self._map[b, spawns[:,0], spawns[:,1], 1]==0]
+                    free = self.parcel_coords[b,:,0]<0
+                    if len(avail_locs)==0 or not np.any(free):
+                        break
+                    loc = avail_locs[np.random.randint(len(avail_locs))]
+                    obj = int(np.random.choice(np.arange(n_shelves)+1, p=free/np.sum(free)))
+                    dl = None
+                    if self.step_left is not None:
+                        dl = np.random.randint(self.upper_dl-self.lower_dl+1)+self.lower_dl
+                    self._add_parcel(b, loc[0], loc[1], obj, dl)
+        else:
+            for b, seq in enumerate(self.parcel_gen_seqs):
+                # 与 game_engine 相同, 超出序列长度后不再产生包裹
+                events = seq.at(self.steps)
+                for x,y,shelf_index,dl in zip(events["x"].tolist(), events["y"].tolist(),
+                                              events["shelf"].tolist(), events["deadline"].tolist()):
+                    if self._map[b,x,y,1]==0 and self.parcel_coords[b,shelf_index-1,0]<0:
+                        self._add_parcel(b, x, y, shelf_index, dl if self.step_left is not None else None)
+
+    def observe(self):
+        """
+        Zero-copy views of the state for policy code: the (B, x, y, 3) map,
+        the (B, n_players, 3) players and the step_left array (or None).
+        They change in place as the batch is stepped.
+        """
+        return self._map, self.players, self.step_left
+
+    def instance(self, b):
+        """
+        Zero-copy (_map, players) views of instance b.
+        """
+        return self._map[b], self.players[b]
+
+    def get_score(self):
+        # steps, score, num_delivered, num_delayed, num_time_out, 后四项为 (B,) 数组
+        n_timeout = np.zeros(self.batch_size, dtype=int)
+        if self.step_left is not None:
+            n_timeout = np.sum((self.parcel_coords[:,:,0]>=0) & (self.step_left<0), axis=1)
+        return self.steps, self.score, self.n_delivered, self.n_delayed, n_timeout
@@ -0,0 +1,221 @@
+"""
+Headless runner: plays planners on game cards and maps without pygame and
+reports their throughput and latency.
+
+    python -m lib.game_runner --cards res/game_cards/TransCenter/L0/0 \
+        --maps res/maps/M0.txt --planners WHCA WHCA:isHierachical=True CBS \
+        --workers 4 --json results.json --csv results.csv
+"""
+import argparse
+import ast
+import csv
+import json
+import os
+import random
+import resource
+import time
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from lib.game_card import game_card
+from lib.game_engine import game_engine
+from lib.map_cache import compile_map
+from lib.utils import init_parcels, thin_players, random_puzzle_abs
+from search import planner_profile
+from search.planner_CA import greedy_WHCA, heuristic_grid
+from search.planner_CBS import CBS
+
+PLANNERS = {
+    "WHCA": lambda ge, max_step=10, **kwargs: greedy_WHCA(ge, max_step, **kwargs),
+    "CBS": lambda ge, **kwargs: CBS(ge, **kwargs),
+}
+
+def parse_planner(spec):
+    """
+    "NAME" or "NAME:key=value,key=value" -> (name, kwargs), values are
+    python literals, e.g. "WHCA:max_step=20,assignment_policy='random'".
+    """
+    name, _, args = spec.partition(":")
+    if name not in PLANNERS:
+        raise ValueError("Unknown planner: "+name)
+    kwargs = {}
+    for item in [x for x in args.split(",") if len(x)>0]:
+        key, value = item.split("=", 1)
+        try:
+            kwargs[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[key] = value
+    return name, kwargs
+
+def build_engine(scenario):
+    """
+    scenario: a game card folder, or a dict {"map": path to a res/maps txt,
+              "n_parcels": int, "parcel_gen_gap": float, "max_step": int,
+              "have_dl": bool, "agv_density": fraction of the AGVs kept},
+              or a dict {"card": game card folder, "max_step": int or None},
+              or a dict {"puzzle": (m, n), "n_agvs": int, "road_ratio": float,
+              "seed": int, "max_step": int} for a random puzzle in which
+              every AGV starts on its parcel (the setting of CBS)
+    Returns (max_step, game_engine).
+    """
+    if isinstance(scenario, str):
+        return game_card(scenario).output_engine()
+    if "puzzle" in scenario:
+        # 谜题由自己的种子生成, 与运行的种子无关
+        np.random.seed(scenario.get("seed", 0))
+        random.seed(scenario.get("seed", 0))
+        _map = random_puzzle_abs(tuple(scenario["puzzle"]), scenario.get("road_ratio", 0.7), scenario["n_agvs"])
+        return scenario.get("max_step", 500), game_engine(_map, 0, auto_unload=True)
+    if "card" in scenario:
+        card_steps, ge = game_card(scenario["card"]).output_engine()
+        max_step = scenario.get("max_step")
+        return card_steps if max_step is None else min(max_step, card_steps), ge
+    compiled = compile_map(scenario["map"])
+    _map = compiled.parse(init_parcels(compiled._abs, scenario.get("n_parcels", 0)))
+    if scenario.get("agv_density", 1)<1:
+        _map[:,:,2] = thin_players(_map[:,:,2], scenario["agv_density"])
+    step_left = [] if scenario.get("have_dl", False) else None
+    ge = game_engine(_map, scenario.get("parcel_gen_gap", 2), step_left=step_left)
+    return scenario.get("max_step", 500), ge
+
+def scenario_name(scenario):
+    if isinstance(scenario, str):
+        return scenario.rstrip("/")
+    return scenario.get("name", scenario.get("map", scenario.get("card")))
+
+def run_one(scenario, planner, seed=0, max_step=None, profile=None):
+    """
+    Plays one planner on one scenario and returns a dict of metrics.
+    planner: a planner spec, see parse_planner.
+    profile: None, or a folder to write the planner profile of the run to
+             (a summary .json and a chrome .trace.json)
+    """
+    np.random.seed(seed)
+    random.seed(seed)
+    name, kwargs = parse_planner(planner)
+    card_steps, ge = build_engine(scenario)
+    n_steps = card_steps if max_step is None else min(max_step, card_steps)
+    if name=="WHCA" and kwargs.get("isHierachical") and isinstance(scenario, dict) and "map" in scenario:
+        # 距离场按规划器实际使用的网格计算并缓存, AGV被抽稀时网格不同, 缓存也不同
+        kwargs.setdefault("distance_fields", compile_map(scenario["map"], distance_fields=True,
+                                                         field_grid=heuristic_grid(ge)))
+
+    if profile is not None:
+        planner_profile.enable()
+    try:
+        t0 = time.perf_counter()
+        policy = PLANNERS[name](ge, **kwargs)
+        init_time = time.perf_counter()-t0
+
+        plan_times = []
+        step_times = []
+        t_start = time.perf_counter()
+        for _ in range(n_steps):
+            t0 = time.perf_counter()
+            isValid, moves = policy.pop_moves(ge)
+            t1 = time.perf_counter()
+            if not isValid: break
+            ge.step(moves)
+            t2 = time.perf_counter()
+            plan_times.append(t1-t0)
+            step_times.append(t2-t1)
+        wall_time = time.perf_counter()-t_start
+        if hasattr(policy, "close"):
+            # 并行模式的进程池
+            policy.close()
+    finally:
+        # 出错时也关闭计数, 不影响之后的运行
+        if profile is not None:
+            planner_profile.disable()
+    if profile is not None:
+        os.makedirs(profile, exist_ok=True)
+        prefix = os.path.join(profile, "%s-%s-%d" % (os.path.basename(scenario_name(scenario)), planner.replace(":", "_"), seed))
+        planner_profile.PROFILER.save_json(prefix+".json")
+        planner_profile.PROFILER.save_chrome_trace(prefix+".trace.json")
+
+    steps, score, n_delivered, n_delayed, n_timeout = ge.get_score()
+    plan_ms = np.array(plan_times)*1000 if len(plan_times)>0 else np.zeros(1)
+    return {
+        "scenario": scenario_name(scenario),
+        "planner": planner,
+        "seed": seed,
+        "steps": int(steps),
+        "score": int(score),
+        "delivered": int(n_delivered),
+        "delayed": int(n_delayed),
+        "timeout": int(n_timeout),
+        "throughput": float(n_delivered)/max(steps, 1),
+        "deliveries_per_1k": 1000.0*n_delivered/max(steps, 1),
+        "n_agvs": len(ge.players),
+        "init_s": init_time,
+        "wall_s": wall_time,
+        "tick_ms": wall_time*1000/max(len(plan_times), 1),
+        "engine_step_us": float(np.mean(step_times))*1e6 if len(step_times)>0 else 0.0,
+        "plan_ms_p50": float(np.percentile(plan_ms, 50)),
+        "plan_ms_p90": float(np.percentile(plan_ms, 90)),
+        "plan_ms_p99": float(np.percentile(plan_ms, 99)),
+        "plan_ms_max": float(np.max(plan_ms)),
+        # 进程的内存峰值, 每个进程只跑一个任务时即为该任务的峰值
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+    }
+
+def _run_job(job):
+    return run_one(*job)
+
+def run_benchmark(scenarios, planners, seeds=(0,), max_step=None, n_workers=None, profile=None, isolated=False):
+    """
+    Runs every (scenario, planner, seed) combination in a process pool and
+    returns the list of metric dicts in job order.
+    isolated: run every job in a fresh process, so that rss_peak_mb is the
+              peak of that job alone
+    """
+    jobs = [(s, p, seed, max_step, profile) for s in scenarios for p in planners for seed in seeds]
+    if n_workers==1 and not isolated:
+        return [_run_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=n_workers, max_tasks_per_child=1 if isolated else None) as pool:
+        return list(pool.map(_run_job, jobs))
+
+def save_results(results, json_path=None, csv_path=None):
+    if json_path is not None:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if csv_path is not None and len(results)>0:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run planners headlessly on game cards and maps.")
+    parser.add_argument("--cards", nargs="*", default=[], help="game card folders")
+    parser.add_argument("--maps", nargs="*", default=[], help="res/maps txt files")
+    parser.add_argument("--n-parcels", type=int, default=3, help="initial parcels on the maps")
+    parser.add_argument("--gen-gap", type=float, default=2, help="parcel generation gap on the maps")
+    parser.add_argument("--deadline", action="store_true", help="give the map parcels deadlines")
+    parser.add_argument("--planners", nargs="+", default=["WHCA"], help="planner specs, e.g. WHCA:max_step=20")
+    parser.add_argument("--steps", type=int, default=None, help="max steps per run")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", default=None)
+    parser.add_argument("--csv", default=None)
+    parser.add_argument("--profile", default=None, help="folder for the planner profiles of the runs")
+    args = parser.parse_args(argv)
+
+    scenarios = list(args.cards)
+    for path in args.maps:
+        scenarios.append({"map": path, "name": os.path.basename(path), "n_parcels": args.n_parcels,
+                          "parcel_gen_gap": args.gen_gap, "have_dl": args.deadline,
+                          "max_step": args.steps if args.steps is not None else 500})
+    for spec in args.planners:
+        parse_planner(spec)
+
+    results = run_benchmark(scenarios, args.planners, seeds=args.seeds, max_step=args.steps, n_workers=args.workers, profile=args.profile)
+    save_results(results, args.json, args.csv)
+    for r in results:
+        print("%-40s %-24s delivered %5d timeout %4d  tick %7.2fms  plan p50/p99 %6.2f/%6.2fms" % (
+              r["scenario"], r["planner"], r["delivered"], r["timeout"], r["tick_ms"], r["plan_ms_p50"], r["plan_ms_p99"]))
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import numpy as np
+
+from lib.utils import read_map, read_trans_center_map, parse_map
+from search.planner_utils import neighbor_table, distance_heuristic
+
+# 缓存内容的格式改变时递增, 旧的缓存文件随之失效
+MAP_CACHE_VERSION = 2
+
+class compiled_map:
+    """
+    The static structures of a map file, parsed once and stored in a
+    content-hashed .npz bundle in the cache folder (see default_cache_dir).
+    Attributes:
+        _abs, _players: the raw layers as read_map returns them
+        _map: the (m, n, 3) layered map of parse_map, without parcels
+        shelf_coords: (n_shelves, 2), the cell of shelf i+1 at row i
+        spawn_coords, home_coords: (k, 2) parcel spawns and AGV start cells,
+                                   the home of AGV i at row i
+        neighbors: the (m*n, 4) neighbor table of planner_utils
+        fields: None, or the (n_shelves, m, n) distance fields to the
+                shelves of loaded AGVs
+        field_grid: None, or the (m, n) road mask the fields were computed
+                    on, see planner_CA.heuristic_grid
+    """
+    KEYS = ["_abs", "_players", "_map", "shelf_coords", "spawn_coords", "home_coords", "neighbors"]
+
+    def __init__(self, arrays):
+        for key in self.KEYS:
+            setattr(self, key, arrays[key])
+        self.fields = arrays.get("fields")
+        self.field_grid = arrays.get("field_grid")
+
+    @classmethod
+    def build(cls, _abs, _players, distance_fields=False, field_grid=None):
+        _map = parse_map(_abs, _players)
+        shelves = _map[:,:,0]>0
+        shelf_coords = np.argwhere(shelves)[np.argsort(_map[:,:,0][shelves], kind="stable")]
+        homes = _map[:,:,2]>0
+        home_coords = np.argwhere(homes)[np.argsort(_map[:,:,2][homes], kind="stable")]
+        arrays = {"_abs": _abs, "_players": _players, "_map": _map,
+                  "shelf_coords": shelf_coords, "spawn_coords": np.argwhere(_map[:,:,0]==-2),
+                  "home_coords": home_coords, "neighbors": neighbor_table(_abs.shape)[0]}
+        if distance_fields:
+            grid = default_field_grid(_map) if field_grid is None else np.asarray(field_grid, dtype=bool)
+            heuristic = distance_heuristic(grid, max_goals=0)
+            # 距离不超过格子数, 小地图用int16保存
+            dtype = np.int16 if _abs.size<np.iinfo(np.int16).max else np.int32
+            fields = np.empty([len(shelf_coords), _abs.shape[0], _abs.shape[1]], dtype=dtype)
+            for i, end in enumerate(shelf_coords):
+                fields[i] = heuristic.field(end)
+            arrays["fields"] = fields
+            arrays["field_grid"] = grid
+        return cls(arrays)
+
+    def parse(self, _parcels=None):
+        """
+        The layered map with parcels, as parse_map(_abs, _players, _parcels).
+        """
+        _map = np.copy(self._map)
+        if _parcels is not None:
+            _map[:,:,1] = _parcels
+        return _map
+
+    def save(self, path):
+        arrays = {key: getattr(self, key) for key in self.KEYS}
+        if self.fields is not None:
+            arrays["fields"] = self.fields
+            arrays["field_grid"] = self.field_grid
+        # 先写临时文件再改名, 并发运行时其他进程不会读到写了一半的文件
+        tmp = path+".%d.tmp.npz" % os.getpid()
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+def default_field_grid(_map):
+    """
+    The road mask of the hierarchical heuristic of greedy_WHCA when every
+    AGV is on its home cell: walls, spawns and homes are blocked.
+    """
+    return (_map[:,:,0]!=-1) & (_map[:,:,0]!=-2) & (_map[:,:,2]<=0)
+
+def default_cache_dir():
+    """
+    $MAP_CACHE_DIR if set, otherwise grid-map-path-finding/maps in the user
+    cache folder ($XDG_CACHE_HOME or ~/.cache), so res/maps stays read-only.
+    """
+    if os.environ.get("MAP_CACHE_DIR"):
+        return os.environ["MAP_CACHE_DIR"]
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "grid-map-path-finding", "maps")
+
+def _cache_path(file_path, text, spawn_marks, distance_fields, field_grid, cache_dir):
+    key = hashlib.sha1()
+    key.update(text)
+    key.update(repr((MAP_CACHE_VERSION, None if spawn_marks is None else sorted(spawn_marks), bool(distance_fields))).encode())
+    if distance_fields and field_grid is not None:
+        grid = np.asarray(field_grid, dtype=bool)
+        key.update(repr(grid.shape).encode())
+        key.update(np.packbits(grid).tobytes())
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir, "%s-%s.npz" % (name, key.hexdigest()[:16]))
+
+def compile_map(file_path, spawn_marks=None, distance_fields=False, cache_dir=None, field_grid=None):
+    """
+    Returns the compiled_map of a res/maps file, or of a res/maps_trans_center
+    file if spawn_marks is given (see read_trans_center_map). The bundle is
+    keyed by the hash of the file content, so edited maps are compiled again,
+    and loaded from the cache when it exists.
+    distance_fields: also compute the distance fields to every shelf, which
+                     takes a BFS per shelf the first time
+    field_grid: the road mask of the fields, None for default_field_grid;
+                pass planner_CA.heuristic_grid(ge) when the AGVs are not on
+                their homes (e.g. after thin_players or set_state)
+    cache_dir: None for default_cache_dir()
+    """
+    with open(file_path, 'rb') as f:
+        text = f.read()
+    path = _cache_path(file_path, text, spawn_marks, distance_fields, field_grid, cache_dir)
+    if os.path.exists(path):
+        return compiled_map.load(path)
+    if spawn_marks is None:
+        _abs, _players = read_map(file_path)
+    else:
+        _abs, _players = read_trans_center_map(file_path, spawn_marks)
+    result = compiled_map.build(_abs, _players, distance_fields, field_grid)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    result.save(path)
+    return result
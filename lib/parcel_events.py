@@ -0,0 +1,93 @@
+import os
+import numpy as np
+
+EVENT_DTYPE = np.dtype([("step", "<i4"), ("x", "<i4"), ("y", "<i4"), ("shelf", "<i4"), ("deadline", "<i4")])
+
+class parcel_events:
+    """
+    Columnar parcel generation sequence: one structured array of
+    (step, x, y, shelf, deadline) events sorted by step, plus the offsets of
+    the first event of every step, so the events of a step are a slice.
+    The arrays can be memory-mapped, loading a card then costs the same for
+    any horizon.
+
+    seq[step] returns the events of a step as the old parcel_gen_seq lists
+    did, [(x, y, shelf, deadline), ...] or [(x, y, shelf), ...] without
+    deadlines.
+    """
+    def __init__(self, events, offsets, have_dl):
+        """
+        events: (n_events,) EVENT_DTYPE array sorted by step
+        offsets: (max_step+1,) int64, the events of step i are
+                 events[offsets[i]:offsets[i+1]]
+        have_dl: whether the deadlines are set (-1 otherwise)
+        """
+        self.events = events
+        self.offsets = offsets
+        self.have_dl = bool(have_dl)
+
+    @classmethod
+    def from_seq(cls, seq, have_dl):
+        """
+        Converts a parcel_gen_seq of the list format,
+        [[(x11,y11,shelf11,dl11)], [], [(x21,y21,shelf21,dl21), ...], ...].
+        """
+        counts = np.array([len(gens) for gens in seq], dtype=np.int64)
+        offsets = np.zeros(len(seq)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        events = np.zeros(offsets[-1], dtype=EVENT_DTYPE)
+        events["step"] = np.repeat(np.arange(len(seq)), counts)
+        events["deadline"] = -1
+        rows = [gen for gens in seq for gen in gens]
+        if len(rows)>0:
+            rows = np.array(rows, dtype=np.int64)
+            events["x"], events["y"], events["shelf"] = rows[:,0], rows[:,1], rows[:,2]
+            if have_dl:
+                events["deadline"] = rows[:,3]
+        return cls(events, offsets, have_dl)
+
+    def to_seq(self):
+        return [self[i] for i in range(len(self))]
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def at(self, step):
+        """
+        The structured events of a step, empty past the horizon.
+        """
+        if step<0 or step>=len(self):
+            return self.events[:0]
+        return self.events[self.offsets[step]:self.offsets[step+1]]
+
+    def __getitem__(self, step):
+        if step<0 or step>=len(self):
+            raise IndexError("step out of the parcel generation horizon")
+        events = self.at(step)
+        columns = [events["x"].tolist(), events["y"].tolist(), events["shelf"].tolist()]
+        if self.have_dl:
+            columns.append(events["deadline"].tolist())
+        return list(zip(*columns))
+
+    def save(self, root):
+        for name, array in [("parcel_events", self.events), ("parcel_offsets", self.offsets)]:
+            path = root+name+".npy"
+            # 覆盖正在内存映射的文件会使映射失效, 内容相同, 无需重写
+            if isinstance(array, np.memmap) and os.path.exists(path) and os.path.samefile(path, array.filename):
+                continue
+            np.save(path, array)
+
+    @classmethod
+    def load(cls, root, have_dl, mmap=True):
+        mode = "r" if mmap else None
+        return cls(np.load(root+"parcel_events.npy", mmap_mode=mode),
+                   np.load(root+"parcel_offsets.npy", mmap_mode=mode), have_dl)
+
+def as_parcel_events(seq, have_dl):
+    """
+    None, a parcel_events, or a parcel_gen_seq of the list format -> None or
+    a parcel_events.
+    """
+    if seq is None or isinstance(seq, parcel_events):
+        return seq
+    return parcel_events.from_seq(seq, have_dl)
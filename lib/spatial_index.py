@@ -0,0 +1,122 @@
+from heapq import heappush, heappop
+
+class grid_index:
+    """
+    Bucket grid over the cells of a map: every item (an AGV or a parcel id)
+    is stored in the bucket of its cell, so nearest-item queries only visit
+    the buckets around the query point instead of every item.
+    """
+    def __init__(self, shape, bucket_size=8):
+        """
+        shape: (m, n), the map shape
+        bucket_size: side of the square buckets, in cells
+        """
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.bucket_size = int(bucket_size)
+        self.n_bx = (self.shape[0]+self.bucket_size-1)//self.bucket_size
+        self.n_by = (self.shape[1]+self.bucket_size-1)//self.bucket_size
+        self._buckets = {} # (bx, by) -> {item, ...}
+        self._pos = {} # item -> (x, y)
+
+    def __len__(self):
+        return len(self._pos)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def _bucket(self, x, y):
+        return (x//self.bucket_size, y//self.bucket_size)
+
+    def insert(self, item, x, y):
+        x, y = int(x), int(y)
+        if item in self._pos:
+            self.remove(item)
+        self._pos[item] = (x, y)
+        self._buckets.setdefault(self._bucket(x, y), set()).add(item)
+
+    def remove(self, item):
+        if item not in self._pos:
+            return
+        key = self._bucket(*self._pos.pop(item))
+        bucket = self._buckets[key]
+        bucket.discard(item)
+        if len(bucket)==0:
+            del self._buckets[key]
+
+    def move(self, item, x, y):
+        x, y = int(x), int(y)
+        old = self._pos.get(item)
+        if old is not None and self._bucket(*old)==self._bucket(x, y):
+            self._pos[item] = (x, y)
+        else:
+            self.insert(item, x, y)
+
+    def position(self, item):
+        return self._pos[item]
+
+    def clear(self):
+        self._buckets = {}
+        self._pos = {}
+
+    def _ring(self, bx, by, r):
+        # 与 (bx, by) 切比雪夫距离恰为 r 的桶
+        if r==0:
+            yield (bx, by)
+            return
+        for i in range(bx-r, bx+r+1):
+            if i<0 or i>=self.n_bx: continue
+            if i==bx-r or i==bx+r:
+                for j in range(max(by-r, 0), min(by+r, self.n_by-1)+1):
+                    yield (i, j)
+            else:
+                if by-r>=0: yield (i, by-r)
+                if by+r<self.n_by: yield (i, by+r)
+
+    def _iter_manhattan(self, x, y, accept):
+        bx, by = self._bucket(x, y)
+        max_r = max(bx, by, self.n_bx-1-bx, self.n_by-1-by)
+        q = []
+        for r in range(max_r+1):
+            for key in self._ring(bx, by, r):
+                for item in self._buckets.get(key, ()):
+                    if accept is not None and not accept(item): continue
+                    ix, iy = self._pos[item]
+                    heappush(q, (abs(ix-x)+abs(iy-y), item))
+            # 更外圈的桶中的元素距离至少为 r*bucket_size+1
+            bound = r*self.bucket_size+1
+            while q and q[0][0]<bound:
+                yield heappop(q)
+        while q:
+            yield heappop(q)
+
+    def iter_nearest(self, x, y, accept=None, distance=None):
+        """
+        Yields (dist, item) in increasing (dist, item) order.
+        accept: None, or a predicate filtering the items
+        distance: None for the manhattan distance, or a function item -> a
+                  distance never shorter than the manhattan one (e.g. the
+                  path distance), in which case the items are ordered by it.
+        """
+        x, y = int(x), int(y)
+        if distance is None:
+            yield from self._iter_manhattan(x, y, accept)
+            return
+        q = []
+        for lower, item in self._iter_manhattan(x, y, accept):
+            while q and q[0][0]<lower:
+                yield heappop(q)
+            heappush(q, (distance(item), item))
+        while q:
+            yield heappop(q)
+
+    def nearest(self, x, y, k=1, accept=None, distance=None):
+        """
+        The k nearest items as a list of (dist, item).
+        """
+        result = []
+        if k<=0:
+            return result
+        for pair in self.iter_nearest(x, y, accept, distance):
+            result.append(pair)
+            if len(result)>=k: break
+        return result
@@ -20,38 +20,47 @@ def time_limit(seconds):
     finally:
         signal.alarm(0)
 
+def _split_map_text(text):
+    # 地图文件: 空行之前为地形, 之后为AGV初始位置, 返回两部分非空的行
+    lines = [line.strip() for line in text.splitlines()]
+    sep = lines.index("")
+    return [x for x in lines[:sep] if len(x)>0], [x for x in lines[sep+1:] if len(x)>0]
+
+def _parse_int_block(lines):
+    return np.array(",".join(lines).replace(",", " ").split(), dtype=int).reshape(len(lines), -1)
+
 def read_map(file_path):
-    data = []
     with open(file_path, 'r') as f:
-        for line in f:
-            if len(line.strip())>0:
-                data.append([int(x) for x in line.strip().split(",")])
-            else:
-                data.append([])
-    _abs = np.array(data[:data.index([])], dtype=int)
-    _players = np.array(data[data.index([])+1:], dtype=int)
-    return _abs, _players
+        abs_lines, player_lines = _split_map_text(f.read())
+    return _parse_int_block(abs_lines), _parse_int_block(player_lines)
 
 def parse_map(_abs, _players, _parcels = None):
-    _map = np.copy(-_abs)
-    _pid = np.copy(_players)
-    shelf_id = 1
-    player_id = 1
+    _map = -np.asarray(_abs, dtype=int)
+    _pid = np.array(_players, dtype=int)
     if _parcels is None:
         _parcels = np.zeros(_map.shape)
 
-    for i in range(_map.shape[0]):
-        for j in range(_map.shape[1]):
-            if _map[i,j]==-3:
-                _map[i,j] = shelf_id
-                shelf_id+=1
-            if _pid[i,j]==1:
-                _pid[i,j] = player_id
-                player_id+=1
+    # 按行优先的顺序给货架和AGV编号
+    shelves = _map==-3
+    _map[shelves] = np.arange(np.sum(shelves))+1
+    players = _pid==1
+    _pid[players] = np.arange(np.sum(players))+1
 
     _map = np.transpose(np.array([_map, _parcels, _pid]), [1,2,0])
     return _map.astype(int)
 
+def thin_players(_players, ratio):
+    """
+    Keeps round(ratio*n) of the n AGVs of a player layer, chosen at random,
+    renumbered 1..k in row-major order like parse_map does.
+    """
+    cells = np.argwhere(_players>0)
+    n_keep = int(np.round(len(cells)*ratio))
+    keep = np.sort(np.random.choice(len(cells), n_keep, replace=False))
+    result = np.zeros_like(_players)
+    result[cells[keep,0], cells[keep,1]] = np.arange(n_keep)+1
+    return result
+
 def init_parcels(_abs, num):
     _parcels = np.zeros(_abs.shape)
     n_shelves = np.sum(_abs==3)
@@ -124,24 +133,25 @@ def random_puzzle_abs(shape, road_ratio, num):
     _map = np.transpose(np.array([_abs, _parcels, _pid]), [1,2,0])
     return _map.astype(int)
 
+TRANS_CENTER_MARKS = "*0123456789abcdefghijklmnopqrstuvwxyz"
+
+def _parse_mark_block(lines):
+    # 每个格子是一个字符, 用查找表一次性把字符转换为 marks.index(x)-1
+    lut = np.full(256, -2, dtype=int)
+    for i, x in enumerate(TRANS_CENTER_MARKS):
+        lut[ord(x)] = i-1
+    chars = np.frombuffer("".join(x.replace(",", "") for x in lines).encode(), dtype=np.uint8)
+    values = lut[chars].reshape(len(lines), -1)
+    if np.any(values==-2):
+        raise ValueError("Unknown mark in the trans center map.")
+    return values
+
 def read_trans_center_map(file_path, spawn_marks):
-    marks = "*0123456789abcdefghijklmnopqrstuvwxyz"
-    data = []
     with open(file_path, 'r') as f:
-        for line in f:
-            if len(line.strip())>0:
-                data.append([marks.index(x)-1 for x in line.strip().split(",")])
-            else:
-                data.append([])
-    _abs = np.array(data[:data.index([])], dtype=int)
-    _players = np.array(data[data.index([])+1:], dtype=int)
-    for i in range(_abs.shape[0]):
-        for j in range(_abs.shape[1]):
-            if _abs[i,j]==-1:
-                _abs[i,j]=1
-            elif _abs[i,j]>0:
-                if _abs[i,j] in spawn_marks:
-                    _abs[i,j] = 2
-                else:
-                    _abs[i,j] = 3
+        abs_lines, player_lines = _split_map_text(f.read())
+    _abs = _parse_mark_block(abs_lines)
+    _players = _parse_mark_block(player_lines)
+    marked = _abs>0
+    _abs = np.where(_abs==-1, 1, _abs)
+    _abs[marked] = np.where(np.isin(_abs[marked], list(spawn_marks)), 2, 3)
     return _abs, _players
@@ -1,20 +1,203 @@
 import time
 import numpy as np
 
-from tqdm import trange
+from contextlib import contextmanager
+
 from lib.game_engine import game_engine
-from search.planner_utils import Astar, tup_dist
+from search.planner_utils import Astar, SIPP, tup_dist, distance_heuristic
+from search.planner_reservation import build_reservation_table
+from search.planner_HPA import hpa_graph
+from search.planner_assignment import assignment_solver
+from search.planner_parallel import speculative_pool, shared_reservation_table, route_keys
+from search.planner_profile import PROFILER
+
+class traversability_context:
+    """
+    The road grids navigate searches on. The static masks are computed once
+    per map and the dynamic ones (players, parcels, crowded parking area)
+    once per tick; an agent's grid is the shared grid of the tick with its
+    own parking cell patched in place, so no H*W array is allocated per
+    agent. The grids are valid for the engine and state_version they were
+    last updated from.
+    """
+    def __init__(self, ge, init_player_pos, init_player_grid):
+        self.homes = init_player_grid>0
+        self.init_player_pos = init_player_pos.astype(int)
+        self.terrain = None
+        self.engine = None
+        self.version = None
+
+    def is_current(self, ge):
+        return self.engine is ge and self.version==ge.state_version
+
+    def update(self, ge):
+        if ge.terrain is not self.terrain:
+            # set_state 可能换了地形
+            self.terrain = ge.terrain
+            self.walls = ge.terrain==-1
+            self.spawns = ge.terrain==-2
+        blocked = self.walls | (ge._map[:,:,2]>0)
+        self.free = {False: ~blocked, True: ~(blocked | self.spawns | (ge._map[:,:,1]>0))}
+        # 如果当前停在停车区的车数量超过1/2，那么有比较大的概率之后会撞上在停车区的车，因此需要在规划时避开
+        n_player_home = np.sum(np.all(self.init_player_pos==ge.players[:,:2], axis=1))
+        self.crowded = n_player_home/len(self.init_player_pos)>0.5
+        if self.crowded:
+            self.grids = {k: v & ~self.homes for k, v in self.free.items()}
+        else:
+            self.grids = self.free
+        self.engine = ge
+        self.version = ge.state_version
+
+    def patch(self, i, loaded):
+        """
+        (x, y, value) to set on the shared grid for agent i, None if its grid
+        is the shared one.
+        """
+        if not self.crowded:
+            return None
+        x, y = self.init_player_pos[i]
+        return (x, y, self.free[loaded][x,y])
+
+    @contextmanager
+    def view(self, i, loaded):
+        with patched(self.grids[loaded], self.patch(i, loaded)) as grid:
+            yield grid
+
+@contextmanager
+def patched(grid, patch):
+    if patch is None:
+        yield grid
+        return
+    x, y, value = patch
+    old = grid[x,y]
+    grid[x,y] = value
+    try:
+        yield grid
+    finally:
+        grid[x,y] = old
+
+def heuristic_grid(ge):
+    """
+    The road mask of the hierarchical heuristic: walls, spawns and the cells
+    of the AGVs at construction time are blocked.
+    """
+    return (ge.terrain!=-1) & (ge.terrain!=-2) & (ge.player_map==0)
+
+class route_planner:
+    """
+    The searches of greedy_WHCA.navigate, kept apart from the planner so that
+    the workers of the parallel mode can each hold a copy.
+    """
+    def __init__(self, max_step, low_level="astar", heuristic=None, hpa=None, hpa_parcels=None, hpa_open=None):
+        """
+        heuristic: distance_heuristic used when loaded, None for manhattan
+        hpa: {loaded: hpa_graph} for long trips, None to always search to the end
+        hpa_parcels, hpa_open: the floor parcels the loaded graph was built
+                               with and the cells open to loaded AGVs otherwise
+        """
+        self.max_step = max_step
+        self.low_level = low_level
+        self.heuristic = heuristic
+        self.hpa = hpa
+        self.hpa_parcels = hpa_parcels
+        self.hpa_open = hpa_open
+        self.grids = None
+
+    def sync_hpa(self, floor_parcels):
+        changed = np.argwhere(floor_parcels!=self.hpa_parcels)
+        if len(changed)>0:
+            values = ~floor_parcels[changed[:,0], changed[:,1]] & self.hpa_open[changed[:,0], changed[:,1]]
+            self.hpa[True].update(changed, values)
+            self.hpa_parcels = floor_parcels
+
+    def search(self, grid, start, end, loaded, reservation, isRand):
+        """
+        Returns (route, moves, isSubgoal), isSubgoal telling if the route only
+        leads to a waypoint of the abstract path.
+        """
+        search = SIPP if self.low_level=="sipp" else Astar
+        # 远距离目标先在抽象图上规划, 只对预约窗口覆盖的部分做逐格搜索
+        isSubgoal = False
+        if self.hpa is not None and not isRand and tup_dist(start, end)>self.max_step:
+            with PROFILER.phase("whca.hpa_subgoal"):
+                subgoal = self.hpa[loaded].subgoal(start, end, self.max_step)
+            if subgoal is not None and tup_dist(subgoal, end)>0:
+                route, moves = search(grid, start, subgoal, reservation=reservation)
+                isSubgoal = len(moves)>0
+
+        if not isSubgoal:
+            if loaded and self.heuristic is not None:
+                route, moves = search(grid, start, end, reservation=reservation, _heuristic=self.heuristic)
+            else:
+                route, moves = search(grid, start, end, reservation=reservation)
+        return route, moves, isSubgoal
+
+    def prepare(self, layers):
+        # 并行模式下每个tick由主进程传入: 空载和载货的道路网格, 使用HPA时还有地上的包裹
+        self.grids = {False: layers[0], True: layers[1]}
+        if len(layers)>2:
+            self.sync_hpa(layers[2])
+
+    def plan(self, reservation, loaded, patch, start, end, isRand):
+        with patched(self.grids[loaded], patch) as grid:
+            return self.search(grid, start, end, loaded, reservation, isRand)
 
 class greedy_WHCA:
     """
     This class actually implements the windowed cooperative a*. The window size
     is defined in max_step.
     """
-    def __init__(self, ge, max_step, isHierachical=False, isPuzzle=False, max_stay=3, assignment_policy="greedy"):
+    def __init__(self, ge, max_step, isHierachical=False, isPuzzle=False, max_stay=3, assignment_policy="greedy", low_level="astar", useHPA=False, cluster_size=10, replan="full", n_workers=1, parallel_min_searches=128, distance_fields=None):
         """
-        assignment_policy: "greedy" or "random"
+        assignment_policy: "greedy", "random", or "optimal" to match the idle
+                           AGVs and the waiting parcels at the minimum total
+                           path length (plus the steps left before the
+                           deadlines if any)
+        low_level: "astar", or "sipp" for the safe interval search, which can
+                   wait for reserved cells to clear
+        useHPA: plan long trips on an HPA* abstract graph and only refine the
+                part covered by the reservation window, for XL/XXL maps
+        cluster_size: side of the HPA* clusters
+        replan: "full" searches every plan again each tick, "keep_parked"
+                keeps the one-step wait of parked AGVs (idle, empty, on their
+                start cell), which a new search could only reproduce, and
+                searches the others from scratch as "full" does; both modes
+                return the same plans. Search trees are not kept across
+                ticks (no D* Lite/LPA*): the searches run over (cell, time)
+                against a reservation table that shifts every tick, and
+                even an exact distance to the goal on the current grid only
+                saves 10-17% of their expansions
+        n_workers: >1 searches the replanning AGVs concurrently in a process
+                   pool against a snapshot of the reservation table, then
+                   commits them in priority order, searching again only the
+                   ones whose search read entries changed by the AGVs
+                   committed before them, so the plans are the same as the
+                   sequential ones. Call close() to stop the pool.
+        parallel_min_searches: ticks with fewer searches run sequentially even
+                   if n_workers>1. A search costs 30-70 us, while a pooled
+                   tick pays a few ms of pickling and repairs: M/L maps
+                   (13-25 searches per tick, about 1 ms) run 3x slower with
+                   the pool, only XL/XXL maps (175-300 searches) have enough
+                   work to share
+        distance_fields: None, or a compiled map holding the distance fields
+                         of the hierarchical heuristic, see
+                         lib.map_cache.compile_map(distance_fields=True,
+                         field_grid=heuristic_grid(ge)); ignored if they
+                         were computed on another grid
         """
+        self.n_workers = n_workers
+        self.parallel_min_searches = parallel_min_searches
+        self.pool = None
+        if replan not in ("full", "keep_parked"):
+            raise ValueError("Unknown replan mode: "+str(replan))
+        self.replan = replan
+        self.low_level = low_level
         self.assignment_policy = assignment_policy
+        if self.assignment_policy=="optimal":
+            # 空载的AGV只被墙壁阻挡, 分配代价取到包裹的真实距离
+            self.assign_heuristic = distance_heuristic(ge._map[:,:,0]!=-1)
+            self.assign_solver = assignment_solver()
+            self.assign_deadlines = {}
         self.max_stay = max_stay
         self.max_step = max_step
         self.isPuzzle = isPuzzle
@@ -22,85 +205,133 @@ class greedy_WHCA:
         if self.isHierachical:
             # 当身上无货物时用manhattan已经可以比较好的估计了，无需heuristic，只有当身上有货时需要
             self.heuristic = self.build_heuristic(ge)
+            if distance_fields is not None and distance_fields.fields is not None:
+                self.heuristic.preload(distance_fields.shelf_coords, distance_fields.fields, distance_fields.field_grid)
+        self.useHPA = useHPA
+        if self.useHPA:
+            self.hpa, hpa_parcels = self.build_hpa(ge, cluster_size)
+        self.router = route_planner(self.max_step, low_level,
+                                    heuristic=self.heuristic if self.isHierachical else None,
+                                    hpa=self.hpa if self.useHPA else None,
+                                    hpa_parcels=hpa_parcels if self.useHPA else None,
+                                    hpa_open=ge._map[:,:,0]>=0)
         self.assignment = np.zeros(len(ge.players)).astype(int)
-        self.reservation = np.zeros([ge._map.shape[0], ge._map.shape[1], self.max_step+1]).astype(int)
+        if n_workers>1:
+            # 并行模式下工作进程直接读取共享内存中的预约表
+            self.reservation = shared_reservation_table(ge._map.shape[:2], self.max_step+1)
+        else:
+            self.reservation = build_reservation_table(ge._map.shape[:2], self.max_step+1, len(ge.players))
+        self.reserved = [None for _ in range(len(ge.players))] # (route, start tick) of each agent
         self.shelf_coords = self.find_shelf_coords(ge)
         self.moves_list = []
         self.n_stay = np.zeros([len(ge.players), 3]).astype(int)
         self.init_player_pos = np.copy(ge.players[:,:2])
         self.init_player_grid = np.copy(ge._map[:,:,2])
+        self.context = None
         parcel_coords = self.find_parcel_coords(ge)
         self.assign(parcel_coords, ge)
         # print(self.assignment)
         for i,player in enumerate(ge.players):
             x, y, parcel = player
             route, moves = self.navigate(i, int(x), int(y), int(parcel), parcel_coords, ge, False)
-            for j in range(0, len(route)):
-                self.reservation[route[j][0],route[j][1],j] = (i+1)
+            self.reserve(i, route)
             self.moves_list.append(moves)
 
     def build_heuristic(self, ge):
-        heuristic = np.zeros([ge._map.shape[0],ge._map.shape[1],ge._map.shape[0],ge._map.shape[1]], dtype=int)
+        # 只为实际会用到的目标点(货架)按需构建距离场, 不再预先计算所有点对
+        return distance_heuristic(heuristic_grid(ge))
 
-        grid = np.zeros(ge._map.shape[:2], dtype=int)
-        grid += (ge._map[:,:,0]==-1)
-        grid += (ge._map[:,:,2]>0)
-        grid += ge._map[:,:,0]==-2
-        grid = (grid==0)
+    def build_hpa(self, ge, cluster_size):
+        # 空载时只有墙壁是障碍, 载货时包裹重生点和地上的包裹也是障碍, 其他AGV由底层搜索处理
+        empty = ge._map[:,:,0]!=-1
+        floor_parcels = self.find_floor_parcels(ge)
+        loaded = empty & (ge._map[:,:,0]!=-2) & ~floor_parcels
+        return {False: hpa_graph(empty, cluster_size), True: hpa_graph(loaded, cluster_size)}, floor_parcels
 
-        # 此代码极为不堪入目!!!
-        print("Initializing the A* heuristic...")
-        ijs = []
-        for i in range(ge._map.shape[0]):
-            for j in range(ge._map.shape[1]):
-                ijs.append((i,j))
+    def find_floor_parcels(self, ge):
+        # 不在AGV身上的包裹
+        floor_parcels = ge._map[:,:,1]>0
+        carriers = ge.players[ge.players[:,2]>0][:,:2].astype(int)
+        floor_parcels[carriers[:,0], carriers[:,1]] = False
+        return floor_parcels
 
-        for index in trange(len(ijs)):
-            i0,j0 = ijs[index]
-            for i1,j1 in ijs:
-                route, _ = Astar(grid, (i0,j0), (i1,j1))
-                heuristic[i0,j0,i1,j1] = len(route)-1
-
-        return heuristic
+    def update_hpa(self, ge):
+        self.router.sync_hpa(self.find_floor_parcels(ge))
 
     def pop_moves(self, ge):
         # print(ge._map[:,:,2])
-        parcel_coords = self.find_parcel_coords(ge)
-        self.assign(parcel_coords, ge)
+        if self.useHPA:
+            with PROFILER.phase("whca.update_hpa"):
+                self.update_hpa(ge)
+        with PROFILER.phase("whca.assign"):
+            parcel_coords = self.find_parcel_coords(ge)
+            self.assign(parcel_coords, ge)
         # print(self.assignment)
         # self.reservation = np.zeros([ge._map.shape[0], ge._map.shape[1], self.max_step]).astype(int)
         # self.moves_list = []
-        for i,player in enumerate(ge.players):
-            x, y, parcel = player
+        # 先按优先级顺序确定需要重新规划的AGV及其目标, 随机数的使用顺序与逐个规划时相同;
+        # 其他AGV提交新路线不会改变某AGV当前位置在t=0的占用, 因此是否需要重新规划与顺序无关
+        with PROFILER.phase("whca.targets"):
+            tasks = [] # (i, x, y, parcel, end, isRand), end None for a parked AGV
+            for i,player in enumerate(ge.players):
+                x, y, parcel = player
 
-            # 后一个判断条件是判断这一步是否符合预期，与预先的预期不同则重新规划
-            if len(self.moves_list[i])>0 and (i+1)==self.reservation[int(x), int(y), 0]:
-                continue
+                # 后一个判断条件是判断这一步是否符合预期，与预先的预期不同则重新规划
+                if len(self.moves_list[i])>0 and (i+1)==self.reservation.agent_at(x, y, 0):
+                    continue
 
-            isRandMove=False
-            if self.n_stay[i][0]==int(x) and self.n_stay[i][1]==int(y):
-                self.n_stay[i][2]+=1
-                if self.n_stay[i][2]>=self.max_stay:
-                    if self.n_stay[i][0]!=self.init_player_pos[i][0] or self.n_stay[i][1]!=self.init_player_pos[i][1]:
-                        isRandMove=True
-            else:
-                self.n_stay[i][0]=int(x)
-                self.n_stay[i][1]=int(y)
-                self.n_stay[i][2]=0
+                isRandMove=False
+                if self.n_stay[i][0]==int(x) and self.n_stay[i][1]==int(y):
+                    self.n_stay[i][2]+=1
+                    if self.n_stay[i][2]>=self.max_stay:
+                        if self.n_stay[i][0]!=self.init_player_pos[i][0] or self.n_stay[i][1]!=self.init_player_pos[i][1]:
+                            isRandMove=True
+                else:
+                    self.n_stay[i][0]=int(x)
+                    self.n_stay[i][1]=int(y)
+                    self.n_stay[i][2]=0
+
+                x, y, parcel = int(x), int(y), int(parcel)
+                if isRandMove:
+                    tasks.append((i, x, y, parcel, self.target(i, x, y, parcel, parcel_coords, ge, True), True))
+                elif self.replan=="keep_parked" and self.is_parked(i, x, y, parcel):
+                    tasks.append((i, x, y, parcel, None, False))
+                else:
+                    tasks.append((i, x, y, parcel, self.target(i, x, y, parcel, parcel_coords, ge, False), False))
 
-            if isRandMove:
-                route, moves_i = self.navigate(i, int(x), int(y), int(parcel), parcel_coords, ge, True)
+        # 并行搜索的路线只有在其读取过的预约没有被之前提交的AGV改动时才沿用, 否则重新搜索
+        with PROFILER.phase("whca.speculate"):
+            speculated = self.speculate(ge, tasks)
+        dirty = set()
+        for i, x, y, parcel, end, isRand in tasks:
+            if end is None:
+                # 停在起始位置且没有任务的AGV, 重新搜索的结果必然是原地等待, 直接沿用
+                route, moves_i = [(x, y), (x, y)], [(0,0,0)]
             else:
-                route, moves_i = self.navigate(i, int(x), int(y), int(parcel), parcel_coords, ge, False)
-            for j in range(0, len(route)):
-                self.reservation[route[j][0],route[j][1],j] = (i+1)
+                if i in speculated and dirty.isdisjoint(speculated[i][1]):
+                    route, moves_i, isSubgoal = speculated[i][0]
+                else:
+                    if PROFILER.enabled and i in speculated:
+                        PROFILER.count("whca.repairs")
+                    with self.traversability(ge).view(i, parcel!=0) as grid, PROFILER.phase("whca.navigate"):
+                        route, moves_i, isSubgoal = self.router.search(grid, (x,y), end, parcel!=0, self.reservation, isRand)
+                route, moves_i = self.finish(i, x, y, route, moves_i, isRand, isSubgoal)
+            if PROFILER.enabled:
+                PROFILER.count("whca.replans", i)
+                if end is None: PROFILER.count("whca.parked_reuses")
+            with PROFILER.phase("whca.reserve"):
+                if len(speculated)>0:
+                    if self.reserved[i] is not None:
+                        dirty.update(route_keys(self.reservation, *self.reserved[i]))
+                    dirty.update(route_keys(self.reservation, route, self.reservation.now))
+                self.reserve(i, route)
             self.moves_list[i] = moves_i
             # self.moves_list.append(moves_i)
 
         moves = [m.pop() for m in self.moves_list]
 
-        new_res = np.zeros([self.reservation.shape[0], self.reservation.shape[1], 1]).astype(int)
-        self.reservation = np.concatenate((self.reservation[:,:,1:], new_res), axis=2)
+        with PROFILER.phase("whca.advance"):
+            self.reservation.advance()
 
         for i in range(len(ge.players)):
             if moves[i][2]>0 and ge.players[i][2]>0:
@@ -108,38 +339,75 @@ class greedy_WHCA:
 
         return True, moves
 
+    def speculate(self, ge, tasks):
+        """
+        Searches the AGVs of tasks concurrently against the current
+        reservation table. Returns {i: ((route, moves, isSubgoal), reads)},
+        empty when running sequentially.
+        """
+        searches = [task for task in tasks if task[4] is not None]
+        if self.n_workers<=1 or len(searches)<max(2, self.parallel_min_searches):
+            return {}
+        if self.pool is None:
+            self.pool = speculative_pool(self.n_workers, self.router)
+        context = self.traversability(ge)
+        jobs = []
+        for i, x, y, parcel, end, isRand in searches:
+            # 只传 python 的 int 和 bool, 比 numpy 标量和数组的序列化小得多
+            patch = context.patch(i, parcel!=0)
+            if patch is not None:
+                patch = (int(patch[0]), int(patch[1]), bool(patch[2]))
+            jobs.append((i, (parcel!=0, patch, (x,y), (int(end[0]), int(end[1])), isRand)))
+        layers = [context.grids[False], context.grids[True]]
+        if self.router.hpa is not None:
+            layers.append(self.router.hpa_parcels)
+        return self.pool.run(self.reservation, layers, jobs)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def reserve(self, i, route):
+        # 先释放该AGV旧规划中尚未过期的占用, 再占用新路线
+        if self.reserved[i] is not None:
+            self.reservation.release(self.reserved[i][0], i+1, self.reserved[i][1])
+        start = self.reservation.reserve(route, i+1)
+        self.reserved[i] = (route, start)
+
     def assign(self, parcel_coords, ge):
         if self.assignment_policy=="greedy":
+            # 最近的AGV/包裹由引擎维护的空间索引查询, 无需计算并排序所有距离
+            assigned = set(self.assignment.tolist())
             if ge.step_left is None:
-                if np.sum(ge._map[:,:,1]>0)<=len(ge.players):
+                if ge.n_parcels<=len(ge.players):
                     # print("Parcel First")
                     for i, par in enumerate(parcel_coords):
-                        if par[0]>=0 and (i+1) not in self.assignment:
-                            player_dists = [(j, tup_dist(par, ge.players[j])) for j in range(len(ge.players)) if self.assignment[j]==0]
-                            player_sorted = sorted(player_dists, key = lambda x: x[1])
-                            if len(player_sorted)>0:
-                                self.assignment[player_sorted[0][0]]=i+1
+                        if par[0]>=0 and (i+1) not in assigned:
+                            j = self.nearest_idle(ge, par)
+                            if j is not None:
+                                self.assignment[j]=i+1
+                                assigned.add(i+1)
                 else:
                     # print("AGV First")
                     for player_i in range(len(self.assignment)):
                         if self.assignment[player_i]>0: continue
                         x,y,_ = ge.players[player_i]
-                        parcel_seq = [(tup_dist(parcel_coords[i], (x,y)), i) for i in range(len(parcel_coords)) if parcel_coords[i][0]>=0]
-                        parcel_seq = sorted(parcel_seq, key=lambda x: x[0])
-                        ends = [x[1] for x in parcel_seq]
-                        for end_i in ends:
-                            if (end_i+1) in self.assignment: continue
+                        for _, end_i in ge.parcel_index.iter_nearest(x, y, accept=lambda k: (k+1) not in assigned):
                             self.assignment[player_i]=end_i+1
+                            assigned.add(end_i+1)
                             break
             else:
                 parcel_seq = [(i, par, ge.step_left[i]) for i, par in enumerate(parcel_coords)]
                 parcel_seq = sorted(parcel_seq, key = lambda x: x[2])
                 for i, par, _ in parcel_seq:
-                    if par[0]>=0 and (i+1) not in self.assignment:
-                        player_dists = [(j, tup_dist(par, ge.players[j])) for j in range(len(ge.players)) if self.assignment[j]==0]
-                        player_sorted = sorted(player_dists, key = lambda x: x[1])
-                        if len(player_sorted)>0:
-                            self.assignment[player_sorted[0][0]]=i+1
+                    if par[0]>=0 and (i+1) not in assigned:
+                        j = self.nearest_idle(ge, par)
+                        if j is not None:
+                            self.assignment[j]=i+1
+                            assigned.add(i+1)
+        elif self.assignment_policy=="optimal":
+            self.assign_optimal(parcel_coords, ge)
         elif self.assignment_policy=="random":
             for player_i in range(len(self.assignment)):
                 if self.assignment[player_i]>0: continue
@@ -152,7 +420,51 @@ class greedy_WHCA:
         else:
             raise ValueError("Invalid assignment policy.")
 
+    def traversability(self, ge):
+        if self.context is None:
+            self.context = traversability_context(ge, self.init_player_pos, self.init_player_grid)
+        if not self.context.is_current(ge):
+            with PROFILER.phase("whca.grid"):
+                self.context.update(ge)
+        return self.context
+
+    def nearest_idle(self, ge, par):
+        for _, j in ge.player_index.iter_nearest(par[0], par[1], accept=lambda j: self.assignment[j]==0):
+            return j
+        return None
+
+    def assign_optimal(self, parcel_coords, ge):
+        carried = set(ge.players[:,2].astype(int).tolist())
+        assigned = set(self.assignment.tolist())
+        idle = [i for i in range(len(ge.players)) if self.assignment[i]==0 and ge.players[i][2]==0]
+        waiting = [k for k in range(len(parcel_coords))
+                   if parcel_coords[k][0]>=0 and (k+1) not in assigned and (k+1) not in carried]
+        if len(idle)==0 or len(waiting)==0:
+            return
+
+        pos = ge.players[idle][:,:2].astype(int)
+        cost = np.empty([len(idle), len(waiting)])
+        for j, k in enumerate(waiting):
+            cost[:,j] = self.assign_heuristic.field(parcel_coords[k])[pos[:,0], pos[:,1]]
+        shift = None
+        if ge.step_left is not None:
+            # 包裹多于AGV时, 优先分配截止时间近的包裹
+            deadlines = np.maximum(ge.step_left[waiting], 0)
+            cost += deadlines[None,:]
+            shift = np.array([d-self.assign_deadlines.get(k, d) for k, d in zip(waiting, deadlines)])
+            self.assign_deadlines = dict(zip(waiting, deadlines))
+
+        for i, k in self.assign_solver.solve(idle, waiting, cost, shift).items():
+            self.assignment[i] = k+1
+
     def navigate(self, i, x, y, parcel, parcel_coords, ge, isRand):
+        end = self.target(i, x, y, parcel, parcel_coords, ge, isRand)
+        # 静态障碍每张地图只算一次, 动态障碍每个tick只算一次, 这里只修改该AGV自己的停车格
+        with self.traversability(ge).view(i, parcel!=0) as grid:
+            route, moves, isSubgoal = self.router.search(grid, (x,y), end, parcel!=0, self.reservation, isRand)
+        return self.finish(i, x, y, route, moves, isRand, isSubgoal)
+
+    def target(self, i, x, y, parcel, parcel_coords, ge, isRand):
         ass = self.assignment[i]
         if isRand:
             new_x = int(min(max(x+np.random.randint(7)-3, 0), ge._map.shape[0]-1))
@@ -171,26 +483,10 @@ class greedy_WHCA:
                     end = parcel_coords[ass-1]
             else:
                 end = self.shelf_coords[parcel-1]
+        return end
 
-        grid = np.zeros(self.reservation.shape[:2])
-
-        # 如果当前停在停车区的车数量超过1/2，那么有比较大的概率之后会撞上在停车区的车，因此需要在规划时避开
-        n_player_home = np.sum(np.sum(np.abs(self.init_player_pos-ge.players[:,:2]), axis=1)==0)
-        if n_player_home/len(self.init_player_pos)>0.5:
-            grid += self.init_player_grid*(self.init_player_grid!=(i+1))
-
-        grid += (ge._map[:,:,0]==-1)
-        grid += (ge._map[:,:,2]>0)
-        if parcel != 0:
-            grid += ge._map[:,:,1]>0
-            grid += ge._map[:,:,0]==-2
-        grid = (grid==0)
-
-        if parcel != 0 and self.isHierachical:
-            route, moves = Astar(grid, (x,y), end, reservation=self.reservation, _heuristic=self.heuristic)
-        else:
-            route, moves = Astar(grid, (x,y), end, reservation=self.reservation)
-
+    def finish(self, i, x, y, route, moves, isRand, isSubgoal):
+        ass = self.assignment[i]
         if isRand:
             if len(moves)>0:
                 moves = [(m[0], m[1], 0) for m in moves]
@@ -200,7 +496,7 @@ class greedy_WHCA:
         else:
             if len(moves)>0:
                 moves = [(m[0], m[1], 0) for m in moves]
-                if ass!=0:
+                if ass!=0 and not isSubgoal:
                     route.append(route[-1])
                     moves.append((0,0,1))
             else:
@@ -217,18 +513,13 @@ class greedy_WHCA:
             moves = moves[-self.max_step:]
         return route, moves
 
+    def is_parked(self, i, x, y, parcel):
+        return (parcel==0 and self.assignment[i]==0 and not self.isPuzzle and
+                int(x)==self.init_player_pos[i][0] and int(y)==self.init_player_pos[i][1])
+
     def find_parcel_coords(self, ge):
-        parcel_coords = np.zeros([np.max(ge._map[:,:,0]),2])-1
-        for i in range(ge._map.shape[0]):
-            for j in range(ge._map.shape[1]):
-                if ge._map[i,j,1]>0:
-                    parcel_coords[ge._map[i,j,1]-1] = np.array([i,j])
-        return parcel_coords.astype(int)
+        # 由 game_engine 增量维护, 无需每步扫描整张地图
+        return ge.parcel_coords
 
     def find_shelf_coords(self, ge):
-        shelf_coords = np.zeros([np.sum(ge._map[:,:,0]>0),2])-1
-        for i in range(ge._map.shape[0]):
-            for j in range(ge._map.shape[1]):
-                if ge._map[i,j,0]>0:
-                    shelf_coords[ge._map[i,j,0]-1] = np.array([i,j])
-        return shelf_coords.astype(int)
+        return ge.shelf_coords
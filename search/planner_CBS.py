@@ -1,105 +1,228 @@
 import numpy as np
-import copy
 import time
-from queue import PriorityQueue
+from heapq import heappush, heappop
 
 from lib.game_engine import game_engine
-from search.planner_utils import tup_equal, tup_dist, parse_moves, Astar
-
-def build_moving_plan(map, startings, endings, deadlines=None):
-
-    def validate(solution):
-        conflicts = set([])
-        max_length = cost(solution)
-        for i_step in range(max_length):
-            moves = []
-            for i_sol in range(len(solution)):
-                if len(solution[i_sol])<=i_step:
-                    moves.append(solution[i_sol][-1])
-                else:
-                    moves.append(solution[i_sol][i_step])
-            if i_step>0:
-                moves_prev = []
-                for i_sol in range(len(solution)):
-                    if len(solution[i_sol])<=(i_step-1):
-                        moves_prev.append(solution[i_sol][-1])
-                    else:
-                        moves_prev.append(solution[i_sol][i_step-1])
-
-            flag = False
-            for i_sol in range(len(solution)):
-                if i_sol<(len(solution)-1):
-                    the_rest = moves[:i_sol]+moves[(i_sol+1):]
-                else:
-                    the_rest = moves[:i_sol]
-
-                if moves[i_sol] in the_rest:
-                    flag = True
-                    conflicts.add((i_sol, moves[i_sol], i_step))
-
-            # 判断路线中是否有二元环
-            # if i_step>0:
-            #     for i_sol in range(len(solution)):
-            #         if i_sol<(len(solution)-1):
-            #             the_rest = moves_prev[:i_sol]+[(-1,-1)]+moves_prev[(i_sol+1):]
-            #         else:
-            #             the_rest = moves_prev[:i_sol]+[(-1,-1)]
-            #         if moves[i_sol] in the_rest:
-            #             candidate = the_rest.index(moves[i_sol])
-            #             if tup_equal(moves[candidate], moves_prev[i_sol]):
-            #                 flag = True
-            #                 conflicts.add((i_sol, moves[i_sol], i_step))
-
-            # 判断路线中是否有环
-            if i_step>0:
-                for i_sol in range(len(solution)):
-                    if i_sol<(len(solution)-1):
-                        the_rest = moves_prev[:i_sol]+[(-1,-1)]+moves_prev[(i_sol+1):]
-                    else:
-                        the_rest = moves_prev[:i_sol]+[(-1,-1)]
-                    if moves[i_sol] in the_rest:
-                        ring = [i_sol]
-                        new_i_sol = the_rest.index(moves[i_sol])
-                        ring_flag = True
-                        while new_i_sol not in ring:
-                            ring.append(new_i_sol)
-                            i_sol = new_i_sol
-                            if i_sol<(len(solution)-1):
-                                the_rest = moves_prev[:i_sol]+[(-1,-1)]+moves_prev[(i_sol+1):]
-                            else:
-                                the_rest = moves_prev[:i_sol]+[(-1,-1)]
-                            if moves[i_sol] in the_rest:
-                                new_i_sol = the_rest.index(moves[i_sol])
-                            else:
-                                ring_flag = False
-                                break
-                        if ring_flag:
-                            flag = True
-                            conflicts.add((i_sol, moves[i_sol], i_step))
-
-            if flag: break
-
-        return list(conflicts)
-
-    def cost(solution):
-        return np.max([len(x) for x in solution])
+from search.planner_utils import tup_equal, tup_dist, parse_moves, Astar, SIPP, focal_Astar, focal_queue
+from search.planner_reservation import build_reservation_table
+from search.planner_profile import PROFILER
+
+class ct_node:
+    """
+    A node of the CBS constraint tree. Only the delta to the parent is
+    stored: the constrained agent, the one new constraint and the replanned
+    route of that agent. The root holds the initial solution. Solutions and
+    constraint sets are rebuilt by walking the parent pointers, so creating
+    a node costs O(path length) instead of deep-copying every path and
+    constraint list.
+    """
+    __slots__ = ("parent", "agent", "constraint", "route", "routes", "lb", "depth", "_occupancy")
+
+    def __init__(self, parent, agent=None, constraint=None, route=None, solution=None, lb=None):
+        self.parent = parent
+        self.agent = agent
+        self.constraint = constraint
+        self.route = route
+        self.routes = solution # only set on the root
+        self.lb = lb # ECBS lower bound of route, a list for the root
+        self.depth = 0 if parent is None else parent.depth+1
+        self._occupancy = None
+
+    def solution(self):
+        replaced = {}
+        node = self
+        while node.parent is not None:
+            if node.agent not in replaced:
+                replaced[node.agent] = node.route
+            node = node.parent
+        solution = list(node.routes)
+        for agent, route in replaced.items():
+            solution[agent] = route
+        return solution
+
+    def occupancy(self, solution):
+        """
+        Per-timestep occupancy maps of the node's solution, derived from the
+        parent's ones: only the steps where the replanned route differs from
+        the old one are copied, the others are shared with the parent.
+        """
+        if self._occupancy is None:
+            if self.parent is None:
+                self._occupancy = build_occupancy(solution)
+            else:
+                parent_solution = list(solution)
+                parent_solution[self.agent] = self.parent.route_of(self.agent)
+                self._occupancy = update_occupancy(self.parent.occupancy(parent_solution), self.agent,
+                                                   parent_solution[self.agent], self.route, cost(solution))
+        return self._occupancy
+
+    def lower_bounds(self):
+        replaced = {}
+        node = self
+        while node.parent is not None:
+            if node.agent not in replaced:
+                replaced[node.agent] = node.lb
+            node = node.parent
+        lbs = list(node.lb)
+        for agent, lb in replaced.items():
+            lbs[agent] = lb
+        return lbs
+
+    def route_of(self, agent):
+        node = self
+        while node.parent is not None:
+            if node.agent==agent:
+                return node.route
+            node = node.parent
+        return node.routes[agent]
+
+    def constraints(self, agent):
+        result = []
+        node = self
+        while node.parent is not None:
+            if node.agent==agent:
+                result.append(node.constraint)
+            node = node.parent
+        result.reverse()
+        return result
+
+def cost(solution):
+    return np.max([len(x) for x in solution])
+
+def _at(route, t):
+    return route[t] if t<len(route) else route[-1]
+
+def build_occupancy(solution):
+    """
+    Returns, for every timestep of the solution, a dict cell -> tuple of the
+    agents on that cell. Agents stay at their last cell once arrived.
+    """
+    occupancy = []
+    for t in range(cost(solution)):
+        occ = {}
+        for i, route in enumerate(solution):
+            cell = _at(route, t)
+            occ[cell] = occ.get(cell, ())+(i,)
+        occupancy.append(occ)
+    return occupancy
+
+def update_occupancy(occupancy, agent, old_route, new_route, n_steps):
+    """
+    The occupancy after replacing agent's old_route by new_route, sharing the
+    maps of the unchanged steps with the given occupancy.
+    """
+    result = []
+    for t in range(n_steps):
+        base = occupancy[min(t, len(occupancy)-1)]
+        old_cell, new_cell = _at(old_route, t), _at(new_route, t)
+        if t<len(occupancy) and old_cell==new_cell:
+            result.append(base)
+            continue
+        occ = dict(base)
+        if old_cell!=new_cell:
+            rest = tuple(x for x in occ[old_cell] if x!=agent)
+            if len(rest)>0:
+                occ[old_cell] = rest
+            else:
+                del occ[old_cell]
+            occ[new_cell] = occ.get(new_cell, ())+(agent,)
+        result.append(occ)
+    return result
+
+def find_conflicts(solution, occupancy):
+    """
+    Returns the conflicts (agent, cell, t) of the earliest conflicting
+    timestep: agents sharing a cell, and rings of agents each moving into the
+    cell another one of the ring left (swaps included). Every step costs
+    O(agents) hash lookups.
+    """
+    for t, occ in enumerate(occupancy):
+        conflicts = set()
+        for cell, agents in occ.items():
+            if len(agents)>1:
+                for i in agents:
+                    conflicts.add((i, cell, t))
+
+        # 判断路线中是否有环
+        if t>0:
+            prev = occupancy[t-1]
+            cells = [_at(route, t) for route in solution]
+            succ = []
+            for i, cell in enumerate(cells):
+                j = -1
+                for k in prev.get(cell, ()):
+                    if k!=i:
+                        j = k
+                        break
+                succ.append(j)
+            state = [0]*len(solution) # 0 unvisited, 1 on the current walk, 2 done
+            for i in range(len(solution)):
+                walk = []
+                j = i
+                while j>=0 and state[j]==0:
+                    state[j] = 1
+                    walk.append(j)
+                    j = succ[j]
+                if j>=0 and state[j]==1:
+                    for k in walk[walk.index(j):]:
+                        conflicts.add((k, cells[k], t))
+                for k in walk:
+                    state[k] = 2
+
+        if len(conflicts)>0:
+            return list(conflicts)
+    return []
+
+def count_conflicts(occupancy):
+    """
+    Number of extra agents sharing a cell, summed over all timesteps. Used to
+    order the focal list of ECBS.
+    """
+    n = 0
+    for occ in occupancy:
+        for agents in occ.values():
+            n += len(agents)-1
+    return n
+
+def build_moving_plan(map, startings, endings, deadlines=None, w=None, low_level="astar"):
+    """
+    Plans conflict-free routes from startings to endings with CBS, minimizing
+    the makespan. If w (>=1) is given, runs ECBS instead: focal search at both
+    levels prefers routes and nodes with fewer conflicts, and the makespan of
+    the result is at most w times the optimal one.
+    low_level: "astar", or "sipp" to replan the constrained agents with the
+               safe interval search. SIPP waits natively and only accepts a
+               goal the agent can stay on, so its routes need no padding.
+               ECBS always uses the focal search.
+    """
 
     def build_reservation(constraint):
-        reservation = np.zeros([map.shape[0], map.shape[1], np.max([x[2] for x in constraint])+1], dtype=int)
+        reservation = build_reservation_table(map.shape, np.max([x[2] for x in constraint])+1, len(constraint))
         for c in constraint:
-            reservation[c[1][0], c[1][1], c[2]] = 1
+            reservation.reserve_cell(c[1][0], c[1][1], c[2], 1)
         return reservation
 
-    def low_level(start, end, reservation, deadline=None):
-        route = Astar(map, start, end, reservation=reservation)[0]
+    def search(start, end, reservation=None, conflicts=None):
+        # returns (route, lower bound of the route length)
+        if w is None:
+            if low_level=="sipp" and reservation is not None:
+                route = SIPP(map, start, end, reservation=reservation, stay=True)[0]
+            else:
+                route = Astar(map, start, end, reservation=reservation)[0]
+            return route, len(route)
+        route, _, lb = focal_Astar(map, start, end, w, conflicts=conflicts, reservation=reservation)
+        return route, (0 if lb is None else lb+1)
+
+    def plan_agent(start, end, reservation, deadline=None, conflicts=None):
+        route, lb = search(start, end, reservation, conflicts)
         if len(route)==0:
-            return None, []
+            return None, [], lb
         if deadline is not None and len(route)>deadline:
-            return None, []
-        if len(route)>=reservation.shape[2]:
-            return route, []
+            return None, [], lb
+        if len(route)>=reservation.window or (w is None and low_level=="sipp"):
+            return route, [], lb
         else:
-            for i in range(len(route), reservation.shape[2]):
+            for i in range(len(route), reservation.window):
                 node = route[-1]
                 new_nodes = [(int(node[0]), int(node[1])),
                              (int(node[0]-1), int(node[1])),
@@ -108,63 +231,99 @@ def build_moving_plan(map, startings, endings, deadlines=None):
                              (int(node[0]), int(node[1]+1))]
                 flag = False
                 for new_node in new_nodes:
-                    if new_node[0]<0 or new_node[1]<0 or new_node[0]>=reservation.shape[0] or new_node[1]>=reservation.shape[1]: continue
-                    if reservation[node[0], node[1], i]==0:
+                    if new_node[0]<0 or new_node[1]<0 or new_node[0]>=map.shape[0] or new_node[1]>=map.shape[1]: continue
+                    if reservation.agent_at(node[0], node[1], i)==0:
                         route.append(new_node)
                         flag = True
                         break
                 if not flag:
                     # return None, [node[0], node[1], i-1]
-                    return None, []
-            return route, []
+                    return None, [], lb
+            return route, [], lb
+
+    def replan(node, c, conflicts=None):
+        deadline = None if deadlines is None else deadlines[c[0]]
+        res = build_reservation(node.constraints(c[0])+[c])
+        new_route, new_conflict, lb = plan_agent(startings[c[0]], endings[c[0]], res, deadline, conflicts)
+        while len(new_conflict)>0:
+            res.reserve_cell(new_conflict[0], new_conflict[1], new_conflict[2], 1)
+            new_route, new_conflict, lb = plan_agent(startings[c[0]], endings[c[0]], res, deadline, conflicts)
+        return new_route, lb
+
+    def conflict_counter(occupancy, agent):
+        # 其他AGV在 (x,y,t) 的数量, 供 ECBS 底层的 focal search 使用
+        def conflicts(x, y, t):
+            agents = occupancy[min(t, len(occupancy)-1)].get((x, y), ())
+            return len(agents)-(agent in agents)
+        return conflicts
 
     assert len(startings)==len(endings)
-    q = PriorityQueue() # (cost, solution)
-    constraints = [[] for _ in range(len(startings))]
-    solution = [Astar(map, startings[i], endings[i])[0] for i in range(len(startings))]
-    q.put((cost(solution), solution, constraints))
-
-    while q.qsize()>0:
-        _, solution, constraints = q.get()
-        conflicts = validate(solution)
+
+    if w is None:
+        q = [] # (cost, node_id, ct_node)
+        root = ct_node(None, solution=[search(startings[i], endings[i])[0] for i in range(len(startings))])
+        n_nodes = 0
+        heappush(q, (cost(root.solution()), n_nodes, root))
+    else:
+        q = focal_queue(w) # lower bound: max lb of the agents, focal: (n_conflicts, cost)
+        routes, lbs = [], []
+        for i in range(len(startings)):
+            occupancy = build_occupancy(routes) if len(routes)>0 else [{}]
+            route, lb = search(startings[i], endings[i], conflicts=conflict_counter(occupancy, i))
+            routes.append(route)
+            lbs.append(lb)
+        root = ct_node(None, solution=routes, lb=lbs)
+        q.push(max(lbs), cost(routes), (count_conflicts(root.occupancy(routes)), cost(routes)), root)
+
+    while len(q)>0:
+        if w is None:
+            _, _, node = heappop(q)
+        else:
+            node, _ = q.pop()
+        if PROFILER.enabled:
+            PROFILER.count("cbs.expanded")
+        solution = node.solution()
+        occupancy = node.occupancy(solution)
+        conflicts = find_conflicts(solution, occupancy)
         if len(conflicts)==0:
             return solution
         for c in conflicts:
-            new_constraint_i = copy.deepcopy(constraints[c[0]]+[c])
-            res = build_reservation(new_constraint_i)
-            new_constraints = copy.deepcopy(constraints)
-            new_constraints[c[0]] = new_constraint_i
-
-            new_solution = copy.deepcopy(solution)
-            if deadlines is None:
-                new_route, new_conflict = low_level(startings[c[0]], endings[c[0]], res)
-            else:
-                new_route, new_conflict = low_level(startings[c[0]], endings[c[0]], res, deadlines[c[0]])
-            while len(new_conflict)>0:
-                res[new_conflict[0], new_conflict[1], new_conflict[2]] = 1
-                if deadlines is None:
-                    new_route, new_conflict = low_level(startings[c[0]], endings[c[0]], res)
-                else:
-                    new_route, new_conflict = low_level(startings[c[0]], endings[c[0]], res, deadlines[c[0]])
+            counter = None if w is None else conflict_counter(occupancy, c[0])
+            new_route, lb = replan(node, c, counter)
             if new_route is None:
                 continue
+            child = ct_node(node, agent=c[0], constraint=c, route=new_route, lb=lb)
+            if PROFILER.enabled:
+                PROFILER.count("cbs.generated")
+            new_solution = list(solution)
             new_solution[c[0]] = new_route
-            q.put((cost(new_solution), new_solution, new_constraints))
+            if w is None:
+                n_nodes += 1
+                heappush(q, (cost(new_solution), n_nodes, child))
+            else:
+                n_conflicts = count_conflicts(child.occupancy(new_solution))
+                q.push(max(child.lower_bounds()), cost(new_solution), (n_conflicts, cost(new_solution)), child)
 
     return None
 
 class CBS:
 
-    def __init__(self, ge):
+    def __init__(self, ge, suboptimality=None, low_level="astar"):
+        """
+        suboptimality: None for optimal CBS, or a factor w>=1 to run the
+                       bounded-suboptimal ECBS (makespan <= w*optimal).
+        low_level: "astar" or "sipp", the search replanning constrained agents.
+        """
         map = ge._map[:,:,0]>=0
-        startings = sorted([(int(x[0]), int(x[1])) for x in np.argwhere(ge._map[:,:,1]>0)], key=lambda x: ge._map[x[0],x[1],1])
-        endings = sorted([(int(x[0]), int(x[1])) for x in np.argwhere(ge._map[:,:,0]>0)], key=lambda x: ge._map[x[0],x[1],0])
+        startings = [(int(x[0]), int(x[1])) for x in ge.parcel_coords if x[0]>=0]
+        endings = [(int(x[0]), int(x[1])) for x in ge.shelf_coords]
         if ge.step_left is not None:
             self.deadlines = ge.step_left-1
         else:
             self.deadlines = None
 
-        tmp_sol = build_moving_plan(map, startings, endings, self.deadlines)
+        with PROFILER.phase("cbs.plan"):
+            tmp_sol = build_moving_plan(map, startings, endings, self.deadlines, suboptimality, low_level)
         if tmp_sol is None:
             self.solution = [[(0,0,0)] for _ in range(len(ge.players))]
         else:
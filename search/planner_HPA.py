@@ -0,0 +1,221 @@
+import numpy as np
+from collections import deque
+from heapq import heappush, heappop
+
+from search.planner_utils import neighbor_table
+
+class hpa_graph:
+    """
+    HPA* abstraction of a m*n grid. The grid is split into square clusters;
+    every maximal run of open cells along the border of two clusters gets
+    one or two entrances, and the distances between the entrances of a
+    cluster are precomputed with a BFS restricted to the cluster. Long-range
+    queries are answered on this abstract graph, which only holds the
+    entrances, and only the first stretch of the abstract path needs to be
+    refined on the cell grid.
+    """
+    def __init__(self, grid, cluster_size=10):
+        """
+        grid : m*n np bool matrix, True for road, False for block
+        cluster_size: side of the square clusters
+        """
+        self.grid = np.array(grid, dtype=bool)
+        self.m, self.n = self.grid.shape
+        self.cluster_size = int(cluster_size)
+        self.cm = (self.m+self.cluster_size-1)//self.cluster_size
+        self.cn = (self.n+self.cluster_size-1)//self.cluster_size
+        self.road = self.grid.ravel().tolist()
+        _, self.neighbors, self.xs, self.ys = neighbor_table(self.grid.shape)
+
+        self.borders = {} # (cluster, cluster) -> [(cell, cell), ...] entrance pairs
+        self.inter = {} # cell -> {cell, ...} across a border, cost 1
+        self.intra = {} # cluster -> {cell: [(cell, dist), ...]} inside the cluster
+        for c in range(self.cm*self.cn):
+            for other in self._right_and_down(c):
+                self._build_border(c, other)
+        for c in range(self.cm*self.cn):
+            self._build_cluster(c)
+
+    def cluster_of(self, cell):
+        return (self.xs[cell]//self.cluster_size)*self.cn+self.ys[cell]//self.cluster_size
+
+    def _right_and_down(self, c):
+        cx, cy = divmod(c, self.cn)
+        result = []
+        if cy+1<self.cn: result.append(c+1)
+        if cx+1<self.cm: result.append(c+self.cn)
+        return result
+
+    def _adjacent(self, c):
+        cx, cy = divmod(c, self.cn)
+        result = self._right_and_down(c)
+        if cy>0: result.append(c-1)
+        if cx>0: result.append(c-self.cn)
+        return result
+
+    def nodes(self, c):
+        """
+        The entrance cells of cluster c.
+        """
+        result = set()
+        for other in self._adjacent(c):
+            key = (min(c, other), max(c, other))
+            for a, b in self.borders.get(key, []):
+                result.add(a if self.cluster_of(a)==c else b)
+        return result
+
+    def _build_border(self, c1, c2):
+        """
+        (Re)computes the entrances between c1 and its right or lower
+        neighbor c2.
+        """
+        s, n = self.cluster_size, self.n
+        x1, y1 = divmod(c1, self.cn)
+        if c2==c1+1:
+            # 竖直边界: c1 的最右一列与 c2 的最左一列
+            y = (y1+1)*s-1
+            pairs = [(x*n+y, x*n+y+1) for x in range(x1*s, min((x1+1)*s, self.m))]
+        else:
+            x = (x1+1)*s-1
+            pairs = [(x*n+y, (x+1)*n+y) for y in range(y1*s, min((y1+1)*s, self.n))]
+
+        for a, b in self.borders.get((c1, c2), []):
+            self.inter[a].discard(b)
+            self.inter[b].discard(a)
+        entrances = []
+        run = []
+        for a, b in pairs+[(None, None)]:
+            if a is not None and self.road[a] and self.road[b]:
+                run.append((a, b))
+                continue
+            if len(run)>0:
+                # 较短的开口取中点, 较长的开口取两端
+                if len(run)<6:
+                    entrances.append(run[len(run)//2])
+                else:
+                    entrances.extend([run[0], run[-1]])
+                run = []
+        self.borders[(c1, c2)] = entrances
+        for a, b in entrances:
+            self.inter.setdefault(a, set()).add(b)
+            self.inter.setdefault(b, set()).add(a)
+
+    def _bfs(self, source, c):
+        """
+        Distances from source to the cells of cluster c, moving inside c only.
+        The source itself does not need to be open.
+        """
+        dist = {source: 0}
+        q = deque([source])
+        while len(q)>0:
+            cell = q.popleft()
+            d = dist[cell]+1
+            for nc in self.neighbors[cell]:
+                if nc in dist or not self.road[nc] or self.cluster_of(nc)!=c: continue
+                dist[nc] = d
+                q.append(nc)
+        return dist
+
+    def _build_cluster(self, c):
+        edges = {}
+        nodes = self.nodes(c)
+        for node in nodes:
+            dist = self._bfs(node, c)
+            edges[node] = [(other, dist[other]) for other in nodes if other!=node and other in dist]
+        self.intra[c] = edges
+
+    def update(self, cells, values):
+        """
+        Sets grid[cells] = values (cells: iterable of (x,y)) and rebuilds
+        only the borders and entrance distances of the clusters involved,
+        e.g. when parcels appear or vanish.
+        """
+        dirty = set()
+        for (x, y), value in zip(cells, values):
+            cell = int(x)*self.n+int(y)
+            if self.road[cell]==bool(value): continue
+            self.road[cell] = bool(value)
+            self.grid[int(x), int(y)] = bool(value)
+            dirty.add(self.cluster_of(cell))
+        if len(dirty)==0: return
+
+        rebuild = set(dirty)
+        for c in dirty:
+            for other in self._adjacent(c):
+                key = (min(c, other), max(c, other))
+                old = self.borders.get(key, [])
+                self._build_border(*key)
+                if self.borders[key]!=old:
+                    rebuild.add(other)
+        for c in rebuild:
+            self._build_cluster(c)
+
+    def abstract_path(self, start, end):
+        """
+        Returns the waypoints [(x, y, dist from start), ...] of the shortest
+        path from start to end on the abstract graph, ending with end, or
+        None if end cannot be reached.
+        """
+        n = self.n
+        s_cell = int(start[0])*n+int(start[1])
+        e_cell = int(end[0])*n+int(end[1])
+        sc, ec = self.cluster_of(s_cell), self.cluster_of(e_cell)
+        if not self.road[e_cell]:
+            return None
+
+        # 将起点和终点临时接入所在簇的入口
+        s_dist = self._bfs(s_cell, sc)
+        e_dist = self._bfs(e_cell, ec)
+        to_end = {node: e_dist[node] for node in self.nodes(ec) if node in e_dist}
+
+        def successors(cell):
+            if cell==s_cell:
+                result = [(node, s_dist[node]) for node in self.nodes(sc) if node in s_dist]
+                if e_cell in s_dist:
+                    result.append((e_cell, s_dist[e_cell]))
+                # 起点本身可能就是入口, 保留它跨越边界的边
+                result.extend((other, 1) for other in self.inter.get(cell, ()))
+                return result
+            result = list(self.intra[self.cluster_of(cell)].get(cell, []))
+            result.extend((other, 1) for other in self.inter.get(cell, ()))
+            if cell in to_end:
+                result.append((e_cell, to_end[cell]))
+            return result
+
+        ex, ey = self.xs[e_cell], self.ys[e_cell]
+        g = {s_cell: 0}
+        parent = {s_cell: -1}
+        q = [(0, 0, s_cell)]
+        closed = set()
+        while q:
+            _, dist, cell = heappop(q)
+            if cell in closed: continue
+            if cell==e_cell:
+                waypoints = []
+                while cell>=0:
+                    waypoints.append((self.xs[cell], self.ys[cell], g[cell]))
+                    cell = parent[cell]
+                waypoints.reverse()
+                return waypoints[1:]
+            closed.add(cell)
+            for nc, cost in successors(cell):
+                new_dist = dist+cost
+                if nc in closed or g.get(nc, new_dist+1)<=new_dist: continue
+                g[nc] = new_dist
+                parent[nc] = cell
+                heappush(q, (new_dist+abs(self.xs[nc]-ex)+abs(self.ys[nc]-ey), new_dist, nc))
+        return None
+
+    def subgoal(self, start, end, horizon):
+        """
+        The first waypoint of the abstract path at least horizon steps away
+        from start, i.e. the part of the path the reservation window covers
+        ends there. Returns end if it is closer, None if it is unreachable.
+        """
+        waypoints = self.abstract_path(start, end)
+        if waypoints is None:
+            return None
+        for x, y, dist in waypoints:
+            if dist>=horizon:
+                return (x, y)
+        return (int(end[0]), int(end[1]))
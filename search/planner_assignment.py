@@ -0,0 +1,110 @@
+import numpy as np
+
+class assignment_solver:
+    """
+    Minimum-cost assignment of rows to columns (e.g. idle AGVs to waiting
+    parcels) with the Hungarian method, the inner loops vectorized over the
+    columns. The smaller side is always matched completely. Rows and columns
+    are identified by keys, and the column potentials and the matching are
+    kept between calls: pairs that are still tight for the new costs are
+    kept, so when only a few rows or columns changed, only those are
+    augmented again instead of solving from scratch.
+    """
+    def __init__(self):
+        # 两种方向(行少于列 / 列少于行转置后求解)各自保存 (列势能, 匹配)
+        self.state = {False: ({}, {}), True: ({}, {})}
+
+    def solve(self, rows, cols, cost, col_shift=None):
+        """
+        rows: list of row keys
+        cols: list of column keys
+        cost: (len(rows), len(cols)) array
+        col_shift: None, or the (len(cols),) amounts by which whole columns of
+                   the cost changed since the last call (e.g. a deadline term),
+                   moved into the potentials so the old pairs stay tight.
+        Returns {row key: column key} for the matched pairs.
+        """
+        if len(rows)==0 or len(cols)==0:
+            return {}
+        cost = np.asarray(cost, dtype=float)
+        if len(rows)<=len(cols):
+            return self._solve(False, rows, cols, cost, col_shift)
+        # 行多于列时转置, 整列的平移变为整行的平移, 不影响匹配
+        result = self._solve(True, cols, rows, cost.T, None)
+        return {row: col for col, row in result.items()}
+
+    def _solve(self, transposed, rows, cols, C, col_shift):
+        n, m = C.shape
+        old_v, old_match = self.state[transposed]
+        col_index = {key: j for j, key in enumerate(cols)}
+
+        # 列多于行时, 未匹配列的势能须为最大值(0)且已匹配列不大于0, 否则增广后不保证最优;
+        # 方阵时所有列最终都会被匹配, 势能可以原样沿用
+        square = n==m
+        v = np.zeros(m)
+        row_of_col = -np.ones(m, dtype=int)
+        for i, key in enumerate(rows):
+            j = col_index.get(old_match.get(key), -1)
+            if j>=0 and row_of_col[j]<0:
+                row_of_col[j] = i
+        for j, key in enumerate(cols):
+            if key in old_v and (square or row_of_col[j]>=0):
+                v[j] = old_v[key]+(col_shift[j] if col_shift is not None else 0)
+        if not square:
+            kept = row_of_col>=0
+            if np.any(kept):
+                v[kept] -= max(v[kept].max(), 0)
+        while True:
+            u = (C-v[None,:]).min(axis=1)
+            cols_kept = np.nonzero(row_of_col>=0)[0]
+            rows_kept = row_of_col[cols_kept]
+            loose = np.abs(C[rows_kept, cols_kept]-u[rows_kept]-v[cols_kept])>1e-9
+            if not np.any(loose):
+                break
+            row_of_col[cols_kept[loose]] = -1
+            if not square:
+                v[cols_kept[loose]] = 0
+
+        matched = np.zeros(n, dtype=bool)
+        matched[row_of_col[row_of_col>=0]] = True
+        for i in np.nonzero(~matched)[0]:
+            self._augment(C, u, v, row_of_col, i)
+
+        result = {}
+        for j in np.nonzero(row_of_col>=0)[0]:
+            result[rows[row_of_col[j]]] = cols[j]
+        self.state[transposed] = ({cols[j]: v[j] for j in range(m)}, result)
+        return result
+
+    def _augment(self, C, u, v, row_of_col, i):
+        """
+        Finds the shortest augmenting path from the free row i over the
+        reduced costs C-u-v (Dijkstra, one column settled per iteration) and
+        flips it, updating the potentials so they stay feasible.
+        """
+        m = C.shape[1]
+        minv = np.full(m, np.inf)
+        way = -np.ones(m, dtype=int) # column preceding each column on the path
+        used = np.zeros(m, dtype=bool)
+        used_rows = [i]
+        cur_row, prev_col = i, -1
+        while True:
+            reduced = C[cur_row]-u[cur_row]-v
+            better = ~used & (reduced<minv)
+            minv[better] = reduced[better]
+            way[better] = prev_col
+            j = int(np.argmin(np.where(used, np.inf, minv)))
+            delta = minv[j]
+            u[used_rows] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            used[j] = True
+            if row_of_col[j]<0:
+                break
+            cur_row, prev_col = row_of_col[j], j
+            used_rows.append(cur_row)
+        # 沿路径回溯翻转匹配
+        while j>=0:
+            prev = way[j]
+            row_of_col[j] = row_of_col[prev] if prev>=0 else i
+            j = prev
@@ -0,0 +1,185 @@
+import weakref
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from search.planner_reservation import reservation_table
+
+_attached = {} # 工作进程中已打开的共享内存, 按名字缓存
+
+def _release(shm):
+    shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        # 仍有数组引用该内存, 进程退出时释放
+        pass
+
+class shared_array:
+    """
+    An ndarray in shared memory. Pickling it only sends the name of the
+    block, the receiving process maps the same memory (once) instead of
+    copying the data. The block is unlinked when the creating object is
+    collected or close() is called.
+    """
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        self.shape = tuple(int(v) for v in shape)
+        self.dtype = dtype
+        self.shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(self.shape))*dtype.itemsize, 1))
+        self.array = np.ndarray(self.shape, dtype=dtype, buffer=self.shm.buf)
+        self.array[...] = 0
+        self._finalizer = weakref.finalize(self, _release, self.shm)
+
+    def __getstate__(self):
+        return {"name": self.shm.name, "shape": self.shape, "dtype": self.dtype.str}
+
+    def __setstate__(self, state):
+        self.shape = state["shape"]
+        self.dtype = np.dtype(state["dtype"])
+        if state["name"] not in _attached:
+            _attached[state["name"]] = shared_memory.SharedMemory(name=state["name"])
+        self.shm = _attached[state["name"]]
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        self._finalizer = None
+
+    def close(self):
+        if self._finalizer is not None:
+            self.array = None
+            self._finalizer()
+
+class shared_reservation_table(reservation_table):
+    """
+    reservation_table whose ring buffer is a shared_array: sending it to the
+    workers of a speculative_pool costs the ring position only, the workers
+    read the entries of the planner's table directly. Only the creating
+    process may write to it.
+    """
+    def __init__(self, shape, window):
+        super().__init__(shape, window)
+        self._buffer = shared_array(self._data.shape, self._data.dtype)
+        self._data = self._buffer.array
+
+    def __getstate__(self):
+        return {"shape": self.shape, "window": self.window, "now": self.now,
+                "_offset": self._offset, "_buffer": self._buffer}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._data = self._buffer.array
+        self._touched = None
+
+class recording_reservation:
+    """
+    Read-only view of a reservation table recording every (cell, t) entry a
+    search looks at, as keys t*n_cells+cell. The searches are deterministic,
+    so a route planned on this view is also the route the search returns on
+    any table agreeing with it on the recorded entries.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.shape = table.shape
+        self.window = table.window
+        self.now = table.now
+        self.n_cells = self.shape[0]*self.shape[1]
+        self.reads = set()
+
+    def is_reserved(self, cell, t):
+        self.reads.add(t*self.n_cells+cell)
+        return self.table.is_reserved(cell, t)
+
+    def is_blocked(self, cell, t):
+        key = t*self.n_cells+cell
+        self.reads.add(key)
+        self.reads.add(key+self.n_cells)
+        return self.table.is_blocked(cell, t)
+
+    def is_swap(self, cell, new_cell, t):
+        self.reads.add(t*self.n_cells+new_cell)
+        self.reads.add((t+1)*self.n_cells+cell)
+        return self.table.is_swap(cell, new_cell, t)
+
+    def agent_at(self, x, y, t):
+        self.reads.add(t*self.n_cells+int(x)*self.shape[1]+int(y))
+        return self.table.agent_at(x, y, t)
+
+def route_keys(table, route, start):
+    """
+    The (cell, t) keys, as recorded by recording_reservation, a route reserved
+    at absolute tick start covers in the current window of table.
+    """
+    n_cells = table.shape[0]*table.shape[1]
+    keys = []
+    for j in range(len(route)):
+        t = start+j-table.now
+        if t<0: continue
+        if t>=table.window: break
+        keys.append(t*n_cells+int(route[j][0])*table.shape[1]+int(route[j][1]))
+    return keys
+
+_planner = None
+
+def _init_worker(planner):
+    global _planner
+    _planner = planner
+
+def _run_batch(job):
+    table, layers, tasks = job
+    # 规划时会临时修改网格, 先复制到本进程, 不影响其他进程读取的共享内存
+    _planner.prepare([np.copy(layer) for layer in layers.array])
+    results = []
+    for key, args in tasks:
+        reservation = recording_reservation(table)
+        results.append((key, _planner.plan(reservation, *args), reservation.reads))
+    return results
+
+class speculative_pool:
+    """
+    Process pool searching batches of agents concurrently against the
+    current reservation table. Every worker holds a copy of the planner,
+    which must provide prepare(layers), called with copies of the per-tick
+    grids before each batch, and plan(reservation, *args).
+    The planner is sent once, to the initializer. The table should be a
+    shared_reservation_table and the per-tick grids are written to a
+    shared_array, so a batch only pickles its tasks.
+    """
+    def __init__(self, n_workers, planner):
+        self.n_workers = n_workers
+        self.layers = None
+        self.executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(planner,))
+
+    def share(self, layers):
+        """
+        Writes the per-tick (m, n) grids to the shared block.
+        """
+        layers = np.asarray(layers)
+        if self.layers is None or self.layers.shape!=layers.shape or self.layers.dtype!=layers.dtype:
+            if self.layers is not None:
+                self.layers.close()
+            self.layers = shared_array(layers.shape, layers.dtype)
+        self.layers.array[...] = layers
+        return self.layers
+
+    def run(self, table, layers, tasks):
+        """
+        layers: the per-tick grids, a list of (m, n) arrays of one dtype
+        tasks: [(key, args), ...] in priority order
+        Returns {key: (result, reads)}, reads being the entries of table the
+        search of key looked at.
+        """
+        layers = self.share(layers)
+        # 轮流分配到各批次, 使各进程的任务量相近
+        batches = [tasks[k::self.n_workers] for k in range(self.n_workers)]
+        jobs = [(table, layers, batch) for batch in batches if len(batch)>0]
+        results = {}
+        for batch in self.executor.map(_run_batch, jobs):
+            for key, result, reads in batch:
+                results[key] = (result, reads)
+        return results
+
+    def close(self):
+        self.executor.shutdown()
+        if self.layers is not None:
+            self.layers.close()
+            self.layers = None
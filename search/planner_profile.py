@@ -0,0 +1,165 @@
+"""
+Switchable instrumentation of the planners:
+
+    from search import planner_profile
+    planner_profile.enable()
+    ... run greedy_WHCA / CBS ...
+    planner_profile.PROFILER.save_json("profile.json")
+    planner_profile.PROFILER.save_chrome_trace("trace.json") # chrome://tracing, Perfetto
+    planner_profile.disable()
+
+When disabled, a phase is a shared no-op context manager, the search entry
+points cost one attribute check, and the counters are not touched. Nothing
+is patched, so an exception between enable() and disable() only leaves the
+counters running.
+"""
+import functools
+import json
+import time
+
+from collections import Counter
+
+class _null_phase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_PHASE = _null_phase()
+
+class _phase:
+    __slots__ = ("profiler", "name", "t0")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        t1 = time.perf_counter()
+        self.profiler.add_time(self.name, self.t0, t1)
+        return False
+
+class profiler:
+    """
+    Per-phase timers, named counters (optionally per key, e.g. per agent)
+    and per-call search statistics. The searches of planner_utils count
+    their own pushes and pops (pops include the stale entries skipped by
+    lazy deletion) in pushed/popped while enabled.
+    """
+    def __init__(self, max_events=200000):
+        """
+        max_events: the number of trace events kept for the chrome trace,
+                    later ones are only aggregated
+        """
+        self.enabled = False
+        self.max_events = max_events
+        self.reset()
+
+    def reset(self):
+        self.phases = {} # name -> [count, total_s, max_s]
+        self.counters = {} # name -> Counter(key -> n)
+        self.searches = {} # name -> [calls, found, pushed, popped, total_s]
+        self.events = []
+        self.n_dropped = 0
+        self.pushed = 0
+        self.popped = 0
+        self._origin = time.perf_counter()
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _phase(self, name)
+
+    def add_time(self, name, t0, t1, args=None):
+        stat = self.phases.get(name)
+        if stat is None:
+            stat = self.phases[name] = [0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += t1-t0
+        stat[2] = max(stat[2], t1-t0)
+        self._event(name, t0, t1, args)
+
+    def count(self, name, key=None, n=1):
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = Counter()
+        counter[key] += n
+
+    def call_search(self, name, func, args, kwargs):
+        pushed, popped = self.pushed, self.popped
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        t1 = time.perf_counter()
+        stat = self.searches.get(name)
+        if stat is None:
+            stat = self.searches[name] = [0, 0, 0, 0, 0.0]
+        found = len(result[0])>0
+        stat[0] += 1
+        stat[1] += found
+        stat[2] += self.pushed-pushed
+        stat[3] += self.popped-popped
+        stat[4] += t1-t0
+        self._event(name, t0, t1, {"pushed": self.pushed-pushed, "expanded": self.popped-popped, "found": found})
+        return result
+
+    def _event(self, name, t0, t1, args):
+        if len(self.events)>=self.max_events:
+            self.n_dropped += 1
+            return
+        event = {"name": name, "ph": "X", "pid": 0, "tid": 0,
+                 "ts": (t0-self._origin)*1e6, "dur": (t1-t0)*1e6}
+        if args is not None:
+            event["args"] = args
+        self.events.append(event)
+
+    def summary(self):
+        phases = {}
+        for name, (count, total, longest) in self.phases.items():
+            phases[name] = {"count": count, "total_s": total, "mean_ms": total*1000/count, "max_ms": longest*1000}
+        searches = {}
+        for name, (calls, found, pushed, popped, total) in self.searches.items():
+            searches[name] = {"calls": calls, "found": found, "pushed": pushed, "expanded": popped,
+                              "expanded_per_call": popped/calls, "total_s": total, "mean_ms": total*1000/calls}
+        counters = {}
+        for name, counter in self.counters.items():
+            if list(counter.keys())==[None]:
+                counters[name] = counter[None]
+            else:
+                counters[name] = {str(k): v for k, v in sorted(counter.items(), key=lambda x: str(x[0]))}
+        return {"phases": phases, "searches": searches, "counters": counters, "dropped_events": self.n_dropped}
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+PROFILER = profiler()
+
+def enable(reset=True):
+    if reset:
+        PROFILER.reset()
+    PROFILER.enabled = True
+
+def disable():
+    PROFILER.enabled = False
+
+def profiled_search(name):
+    """
+    Decorator recording the calls of a search returning (route, ...).
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            return PROFILER.call_search(name, func, args, kwargs)
+        return wrapper
+    return decorate
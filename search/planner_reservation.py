@@ -0,0 +1,211 @@
+import numpy as np
+
+class reservation_table:
+    """
+    Space-time reservation table of a m*n grid over a window of time steps.
+    The time axis is circular: t=0 is always the current tick, and advance()
+    shifts the horizon by one step by recycling the expired slice instead of
+    copying the whole table. Only the cells actually reserved in the expired
+    slice are cleared, so advancing is O(reserved cells), not O(m*n*window).
+    """
+    def __init__(self, shape, window):
+        """
+        shape : (m, n), the grid shape
+        window: number of time steps covered, i.e. max_step+1
+        """
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.window = int(window)
+        self.now = 0 # absolute tick of t=0
+        self._offset = 0 # ring slot of t=0
+        self._data = np.zeros([self.window, self.shape[0]*self.shape[1]], dtype=np.int32)
+        self._touched = [[] for _ in range(self.window)]
+
+    def _slot(self, t):
+        return (self._offset+t)%self.window
+
+    def reserve(self, route, agent_id):
+        """
+        Reserves route[t] at time t for agent_id (agent_id>0). Steps beyond
+        the window are ignored. Returns the absolute tick of route[0], which
+        is needed to release the route later.
+        """
+        n = self.shape[1]
+        for t in range(min(len(route), self.window)):
+            cell = int(route[t][0])*n+int(route[t][1])
+            slot = self._slot(t)
+            self._data[slot, cell] = agent_id
+            self._touched[slot].append(cell)
+        return self.now
+
+    def reserve_cell(self, x, y, t, agent_id):
+        """
+        Reserves a single cell at time t, e.g. for a CBS vertex constraint.
+        """
+        if t<0 or t>=self.window: return
+        cell = int(x)*self.shape[1]+int(y)
+        slot = self._slot(t)
+        self._data[slot, cell] = agent_id
+        self._touched[slot].append(cell)
+
+    def release(self, route, agent_id, start):
+        """
+        Clears the reservations agent_id still holds along a route reserved
+        at absolute tick start. Entries overwritten by other agents are kept.
+        """
+        n = self.shape[1]
+        for j in range(len(route)):
+            t = start+j-self.now
+            if t<0: continue
+            if t>=self.window: break
+            cell = int(route[j][0])*n+int(route[j][1])
+            slot = self._slot(t)
+            if self._data[slot, cell]==agent_id:
+                self._data[slot, cell] = 0
+
+    def agent_at(self, x, y, t):
+        """
+        Returns the id of the agent holding (x,y) at time t, 0 if it is free.
+        """
+        if t<0 or t>=self.window: return 0
+        return int(self._data[self._slot(t), int(x)*self.shape[1]+int(y)])
+
+    def is_reserved(self, cell, t):
+        """
+        Vertex check of a flat cell index at time t.
+        """
+        if t>=self.window: return False
+        return self._data[(self._offset+t)%self.window, cell]>0
+
+    def is_blocked(self, cell, t):
+        """
+        The strict check used by Astar: a cell entered at t+1 must be free at
+        both t and t+1. Moves leaving the window are never blocked.
+        """
+        if t+1>=self.window: return False
+        return self._data[(self._offset+t)%self.window, cell]+self._data[(self._offset+t+1)%self.window, cell]>0
+
+    def advance(self):
+        """
+        Moves the horizon one step forward. The old t=0 slice becomes the
+        new, empty, last slice.
+        """
+        slot = self._offset
+        if len(self._touched[slot])>0:
+            self._data[slot, self._touched[slot]] = 0
+            self._touched[slot] = []
+        self._offset = (self._offset+1)%self.window
+        self.now += 1
+
+    def to_array(self):
+        """
+        Returns the dense (m, n, window) array in time order, as the old
+        reservation arrays were laid out.
+        """
+        order = [self._slot(t) for t in range(self.window)]
+        return np.transpose(self._data[order].reshape(self.window, self.shape[0], self.shape[1]), [1,2,0])
+
+    def is_swap(self, cell, new_cell, t):
+        """
+        Edge check: True if an agent holds new_cell at t and cell at t+1, so
+        moving cell->new_cell between t and t+1 would swap with it.
+        """
+        if t+1>=self.window: return False
+        agent = self._data[(self._offset+t)%self.window, new_cell]
+        return agent>0 and self._data[(self._offset+t+1)%self.window, cell]==agent
+
+class sparse_reservation_table:
+    """
+    Hashed space-time reservation table with the same interface as
+    reservation_table. Only the reserved (cell, t) entries are stored, keyed
+    by absolute tick, so memory and advance() cost scale with the number of
+    agents times the window rather than with the grid area. Edge (swap)
+    reservations are recorded explicitly for every move of a reserved route.
+    """
+    def __init__(self, shape, window):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.window = int(window)
+        self.now = 0
+        self._n_cells = self.shape[0]*self.shape[1]
+        self._vertices = {} # abs_t*n_cells+cell -> agent_id
+        self._edges = {} # (cell, new_cell, abs_t) -> agent_id
+        self._keys = {} # abs_t -> [(vertex_key, edge_key), ...], used to purge expired entries
+
+    def reserve(self, route, agent_id):
+        n = self.shape[1]
+        end = min(len(route), self.window)
+        for t in range(end):
+            cell = int(route[t][0])*n+int(route[t][1])
+            key = (self.now+t)*self._n_cells+cell
+            self._vertices[key] = agent_id
+            edge = None
+            if t+1<end:
+                new_cell = int(route[t+1][0])*n+int(route[t+1][1])
+                if new_cell!=cell:
+                    edge = (cell, new_cell, self.now+t)
+                    self._edges[edge] = agent_id
+            self._keys.setdefault(self.now+t, []).append((key, edge))
+        return self.now
+
+    def reserve_cell(self, x, y, t, agent_id):
+        if t<0 or t>=self.window: return
+        key = (self.now+t)*self._n_cells+int(x)*self.shape[1]+int(y)
+        self._vertices[key] = agent_id
+        self._keys.setdefault(self.now+t, []).append((key, None))
+
+    def release(self, route, agent_id, start):
+        n = self.shape[1]
+        for j in range(len(route)):
+            abs_t = start+j
+            if abs_t<self.now: continue
+            if abs_t-self.now>=self.window: break
+            cell = int(route[j][0])*n+int(route[j][1])
+            key = abs_t*self._n_cells+cell
+            if self._vertices.get(key, 0)==agent_id:
+                del self._vertices[key]
+            if j+1<len(route):
+                edge = (cell, int(route[j+1][0])*n+int(route[j+1][1]), abs_t)
+                if self._edges.get(edge, 0)==agent_id:
+                    del self._edges[edge]
+
+    def agent_at(self, x, y, t):
+        if t<0 or t>=self.window: return 0
+        return self._vertices.get((self.now+t)*self._n_cells+int(x)*self.shape[1]+int(y), 0)
+
+    def is_reserved(self, cell, t):
+        if t>=self.window: return False
+        return ((self.now+t)*self._n_cells+cell) in self._vertices
+
+    def is_blocked(self, cell, t):
+        if t+1>=self.window: return False
+        key = (self.now+t)*self._n_cells+cell
+        return key in self._vertices or (key+self._n_cells) in self._vertices
+
+    def is_swap(self, cell, new_cell, t):
+        if t+1>=self.window: return False
+        return (new_cell, cell, self.now+t) in self._edges
+
+    def advance(self):
+        for key, edge in self._keys.pop(self.now, []):
+            self._vertices.pop(key, None)
+            if edge is not None:
+                self._edges.pop(edge, None)
+        self.now += 1
+
+    def to_array(self):
+        data = np.zeros([self.window, self._n_cells], dtype=np.int32)
+        for key, agent_id in self._vertices.items():
+            abs_t, cell = divmod(key, self._n_cells)
+            data[abs_t-self.now, cell] = agent_id
+        return np.transpose(data.reshape(self.window, self.shape[0], self.shape[1]), [1,2,0])
+
+# 预期占用的格子比例低于该值时使用稀疏的哈希表
+SPARSE_DENSITY = 1/32
+
+def build_reservation_table(shape, window, n_agents):
+    """
+    Picks the reservation backend by the expected density of reserved cells:
+    at most n_agents of the m*n cells are reserved at any time step.
+    """
+    if n_agents<SPARSE_DENSITY*shape[0]*shape[1]:
+        return sparse_reservation_table(shape, window)
+    return reservation_table(shape, window)
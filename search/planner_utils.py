@@ -1,5 +1,8 @@
 import numpy as np
-from queue import PriorityQueue
+from collections import OrderedDict, deque
+from heapq import heappush, heappop
+
+from search.planner_profile import PROFILER, profiled_search
 
 def tup_equal(tup1, tup2):
     return tup1[0]==tup2[0] and tup1[1]==tup2[1]
@@ -14,115 +17,661 @@ def parse_moves(route):
         moves.append((route[i][0]-route[i-1][0], route[i][1]-route[i-1][1]))
     return moves
 
+class distance_heuristic:
+    """
+    Lazily built true-distance heuristic. A reverse BFS distance field is
+    computed the first time a goal is queried and kept in an LRU cache of at
+    most max_goals fields, so memory is O(max_goals*cells) instead of the
+    (m,n,m,n) all-pairs table. It is indexed like that table, i.e.
+    h[x, y, end_x, end_y], and can be passed to Astar as _heuristic.
+    """
+    def __init__(self, grid, max_goals=256):
+        """
+        grid : m*n np bool matrix, True for road, False for block
+        """
+        self.grid = np.asarray(grid, dtype=bool)
+        self.max_goals = max_goals
+        self.fields = OrderedDict()
+        self.precomputed = {}
+
+    def __getitem__(self, index):
+        x, y, end_x, end_y = index
+        return self.field((end_x, end_y))[x, y]
+
+    def field(self, end):
+        end = (int(end[0]), int(end[1]))
+        if end in self.fields:
+            self.fields.move_to_end(end)
+            return self.fields[end]
+        if end in self.precomputed:
+            field = self.precomputed[end].astype(np.int32)
+        else:
+            field = self._build_field(end)
+        self.fields[end] = field
+        if len(self.fields)>self.max_goals:
+            self.fields.popitem(last=False)
+        return field
+
+    def warm(self, ends):
+        for end in ends:
+            self.field(end)
+
+    def preload(self, ends, fields, grid=None):
+        """
+        Registers fields computed beforehand (e.g. the ones of a compiled
+        map), used instead of a BFS when their goal is queried.
+        grid: the road mask of the fields; if given and different from the
+              grid of this heuristic, the fields are not used
+        Returns whether the fields were registered.
+        """
+        if grid is not None and not np.array_equal(np.asarray(grid, dtype=bool), self.grid):
+            return False
+        for end, field in zip(ends, fields):
+            self.precomputed[(int(end[0]), int(end[1]))] = field
+        return True
+
+    def _build_field(self, end):
+        m, n = self.grid.shape
+        _, neighbors, _, _ = neighbor_table(self.grid.shape)
+        road = self.grid.ravel().tolist()
+        dist = [-1]*(m*n)
+        start = end[0]*n+end[1]
+        dist[start] = 0
+        q = deque([start])
+        while len(q)>0:
+            c = q.popleft()
+            d = dist[c]+1
+            for nc in neighbors[c]:
+                if dist[nc]>=0 or not road[nc]: continue
+                dist[nc] = d
+                q.append(nc)
+        dist = np.array(dist, dtype=np.int32).reshape(m, n)
+
+        # 起点可能是被占用的格子(例如AGV自身所在位置), 取相邻可达格子的距离+1
+        blocked = (dist<0)
+        padded = np.full((m+2, n+2), np.iinfo(np.int32).max, dtype=np.int64)
+        padded[1:-1,1:-1] = np.where(blocked, np.iinfo(np.int32).max, dist)
+        near = np.minimum(np.minimum(padded[:-2,1:-1], padded[2:,1:-1]),
+                          np.minimum(padded[1:-1,:-2], padded[1:-1,2:]))
+        fixable = blocked & (near<np.iinfo(np.int32).max)
+        dist[fixable] = near[fixable]+1
+
+        # 仍不可达的格子退化为manhattan距离
+        blocked = (dist<0)
+        if np.any(blocked):
+            xs, ys = np.nonzero(blocked)
+            dist[xs, ys] = np.abs(xs-end[0])+np.abs(ys-end[1])
+        return dist
+
+_neighbor_tables = {}
+_search_buffers = {}
+
+def neighbor_table(shape):
+    """
+    Returns the (m*n, 4) int32 table of the 4-connected neighbors of every
+    flat cell index (x*n+y), -1 for the ones outside the grid. The table is
+    computed once per grid shape and cached.
+    """
+    shape = (int(shape[0]), int(shape[1]))
+    if shape not in _neighbor_tables:
+        m, n = shape
+        xs, ys = np.divmod(np.arange(m*n), n)
+        table = -np.ones([m*n, 4], dtype=np.int32)
+        table[:,0] = np.where(xs>0, (xs-1)*n+ys, -1)
+        table[:,1] = np.where(xs<m-1, (xs+1)*n+ys, -1)
+        table[:,2] = np.where(ys>0, xs*n+ys-1, -1)
+        table[:,3] = np.where(ys<n-1, xs*n+ys+1, -1)
+        # 预先转成 python 的 list, 搜索时逐个取值远快于 numpy 标量索引
+        _neighbor_tables[shape] = (table, [tuple(c for c in row if c>=0) for row in table.tolist()],
+                                   xs.tolist(), ys.tolist())
+    return _neighbor_tables[shape]
+
+def _get_buffers(n_cells):
+    """
+    Preallocated (g, parent, stamp) buffers shared by all searches on grids
+    of n_cells cells. A cell's g and parent are only valid when its stamp
+    equals the generation of the current search, so the buffers never need
+    to be cleared between calls.
+    """
+    if n_cells not in _search_buffers:
+        _search_buffers[n_cells] = [np.zeros(n_cells, dtype=np.int32),
+                                    np.zeros(n_cells, dtype=np.int32),
+                                    np.zeros(n_cells, dtype=np.int32), 0]
+    buffers = _search_buffers[n_cells]
+    buffers[3] += 1
+    if buffers[3]>=np.iinfo(np.int32).max:
+        buffers[2][:] = 0
+        buffers[3] = 1
+    return buffers
+
+def _heuristic_field(_heuristic, end):
+    if _heuristic is None:
+        return None
+    if hasattr(_heuristic, "field"):
+        return _heuristic.field(end).ravel()
+    return np.ascontiguousarray(_heuristic[:, :, end[0], end[1]]).ravel()
+
+def _reservation_checks(reservation, m, n):
+    """
+    Returns the (is_reserved, is_blocked, is_swap) checks on flat cells for
+    either a reservation table (see planner_reservation) or a dense (m, n, T)
+    array. is_reserved(cell, t) is the vertex check at t, is_blocked(cell, t)
+    the strict check used by Astar (reserved at t or t+1) and
+    is_swap(cell, new_cell, t) the edge check, None for dense arrays.
+    """
+    if reservation is None:
+        return None, None, None
+    if hasattr(reservation, "is_blocked"):
+        return reservation.is_reserved, reservation.is_blocked, reservation.is_swap
+    n_res = reservation.shape[2]
+    res = reservation.reshape(m*n, n_res)
+    def is_reserved(cell, t):
+        return t<n_res and res[cell, t]>0
+    def is_blocked(cell, t):
+        return t+1<n_res and res[cell, t]+res[cell, t+1]>0
+    return is_reserved, is_blocked, None
+
+def _trace(node, parent):
+    chain = []
+    while node>=0:
+        chain.append(node)
+        node = parent(node)
+    chain.reverse()
+    return chain
+
 def _Astar_Strict(grid, start, end, reservation=None, _heuristic=None):
     """
     grid : m*n np bool matrix
     start: (x,y), tuple
     end  : (x,y), tuple
+    Searches over flat cell indices with a heapq open list, the cached
+    neighbor table and the shared g/parent buffers.
     """
-    def heuristic(node):
-        return tup_dist(node, end)
+    m, n = grid.shape
+    _, neighbors, xs, ys = neighbor_table(grid.shape)
+    g, parent, stamp, gen = _get_buffers(m*n)
+    road = grid.ravel()
+    ex, ey = int(end[0]), int(end[1])
+    s_cell = int(start[0])*n+int(start[1])
+    e_cell = ex*n+ey
+    hfield = _heuristic_field(_heuristic, (ex, ey))
+    is_reserved, is_blocked, is_swap = _reservation_checks(reservation, m, n)
 
-    visited = set([])
-    prevs = {}
-    q = PriorityQueue() # (priority, dist_to_origin, current_node)
-    q.put((0, 0, start))
+    g[s_cell] = 0
+    parent[s_cell] = -1
+    stamp[s_cell] = gen
+    q = [(0, 0, s_cell)] # (priority, dist_to_origin, current_cell)
+    closed = set()
     flag = False
+    profiling = PROFILER.enabled
 
-    while q.qsize()>0:
-        _, dist, node = q.get()
-        if node in visited: continue
-        if tup_equal(node, end):
+    while q:
+        _, dist, cell = heappop(q)
+        if profiling: PROFILER.popped += 1
+        if cell in closed: continue
+        if cell==e_cell:
             flag = True
             break
-        visited.add(node)
-        for new_node in [(int(node[0]-1), int(node[1])),
-                         (int(node[0]+1), int(node[1])),
-                         (int(node[0]), int(node[1]-1)),
-                         (int(node[0]), int(node[1]+1))]:
-            if new_node[0]<0 or new_node[1]<0 or new_node[0]>=grid.shape[0] or new_node[1]>=grid.shape[1]: continue
-            if not grid[new_node] or new_node in visited: continue
-            if reservation is not None and (dist+1)<reservation.shape[2] and \
-                    reservation[new_node[0], new_node[1], dist]+reservation[new_node[0], new_node[1], dist+1]>0:
-                continue
-            if _heuristic is None:
-                p = dist+1+heuristic(new_node)
+        closed.add(cell)
+        new_dist = dist+1
+        for new_cell in neighbors[cell]:
+            if new_cell in closed or not road[new_cell]: continue
+            if stamp[new_cell]==gen and g[new_cell]<=new_dist: continue
+            if is_blocked is not None and is_blocked(new_cell, dist): continue
+            if hfield is None:
+                p = new_dist+abs(xs[new_cell]-ex)+abs(ys[new_cell]-ey)
             else:
-                p = dist+1+_heuristic[new_node[0],new_node[1],end[0],end[1]]
-            q.put((p, dist+1, new_node))
-            prevs[new_node] = node
+                p = new_dist+int(hfield[new_cell])
+            g[new_cell] = new_dist
+            parent[new_cell] = cell
+            stamp[new_cell] = gen
+            heappush(q, (p, new_dist, new_cell))
+            if profiling: PROFILER.pushed += 1
 
     if flag:
-        route = []
-        while not tup_equal(node, start):
-            route.append(node)
-            node = prevs[node]
-        route.append(node)
-        route.reverse()
+        route = [(xs[c], ys[c]) for c in _trace(cell, lambda c: int(parent[c]))]
         moves = parse_moves(route)
         return route, moves
     else:
         return [], []
 
+def _scan_next(mask, wall, d):
+    """
+    Scans every row of the 2d arrays along the last axis in direction d (+1
+    or -1). Returns, for every cell, the index of the first cell strictly
+    beyond it where mask is set with no wall in between (-1 if none), and
+    the index of the first wall strictly beyond it (the grid border counts
+    as a wall at index -1 or L).
+    """
+    L = mask.shape[1]
+    if d<0:
+        nxt, nw = _scan_next(mask[:, ::-1], wall[:, ::-1], 1)
+        return np.where(nxt>=0, L-1-nxt, -1)[:, ::-1], (L-1-nw)[:, ::-1]
+    idx = np.arange(L)
+    border = np.full([mask.shape[0], 1], L)
+    nw = np.minimum.accumulate(np.where(wall, idx, L)[:, ::-1], axis=1)[:, ::-1]
+    nw = np.concatenate([nw[:, 1:], border], axis=1)
+    nf = np.minimum.accumulate(np.where(mask, idx, L)[:, ::-1], axis=1)[:, ::-1]
+    nf = np.concatenate([nf[:, 1:], border], axis=1)
+    return np.where(nf<nw, nf, -1), nw
+
+_jump_tables = OrderedDict()
+
+def jump_tables(grid, max_grids=8):
+    """
+    Goal-independent jump tables of a static grid for _jump_point_search,
+    cached by grid content. For both directions d of each axis:
+        next_y[d], wall_y[d]: the next y jump point / wall along the row
+        next_x[d], wall_x[d]: the next x jump point / wall along the column
+    A cell is a y jump point when it has a forced neighbor, and an x jump
+    point when a y jump point can be reached from it.
+    """
+    grid = np.ascontiguousarray(grid, dtype=bool)
+    key = (grid.shape, grid.tobytes())
+    if key in _jump_tables:
+        _jump_tables.move_to_end(key)
+        return _jump_tables[key]
+    padded = np.zeros([grid.shape[0]+2, grid.shape[1]+2], dtype=bool)
+    padded[1:-1,1:-1] = grid
+    up, down = padded[:-2,1:-1], padded[2:,1:-1]
+    wall = ~grid
+    next_y, wall_y, next_x, wall_x = {}, {}, {}, {}
+    for d in (1, -1):
+        # 沿y方向移动时, 只有被迫邻居才允许转向x方向
+        behind = slice(0, -2) if d>0 else slice(2, None)
+        forced = grid & ((up & ~padded[:-2,behind]) | (down & ~padded[2:,behind]))
+        next_y[d], wall_y[d] = _scan_next(forced, wall, d)
+    has_y = (next_y[1]>=0) | (next_y[-1]>=0)
+    for d in (1, -1):
+        nxt, nw = _scan_next(has_y.T, wall.T, d)
+        next_x[d], wall_x[d] = nxt.T, nw.T
+    tables = tuple({d: t[d].ravel().tolist() for d in (1, -1)} for t in (next_y, wall_y, next_x, wall_x))
+    _jump_tables[key] = tables
+    if len(_jump_tables)>max_grids:
+        _jump_tables.popitem(last=False)
+    return tables
+
+def _jump_point_search(grid, start, end, _heuristic=None):
+    """
+    4-connected Jump Point Search on a static grid, returning the same
+    (route, moves) as Astar with a route of the same length. Paths are
+    canonical: moves along x may turn into y anywhere, moves along y only
+    continue straight unless a forced neighbor appears. The jumps are looked
+    up in the cached jump_tables of the grid, so long runs of open cells
+    cost O(1) instead of one expansion per cell.
+    """
+    m, n = grid.shape
+    road = grid.ravel().tolist()
+    sx, sy = int(start[0]), int(start[1])
+    ex, ey = int(end[0]), int(end[1])
+    if sx==ex and sy==ey:
+        return [(sx, sy)], []
+    if not road[ex*n+ey]:
+        return [], []
+    next_y, wall_y, next_x, wall_x = jump_tables(grid)
+    hfield = _heuristic_field(_heuristic, (ex, ey))
+
+    def free(x, y):
+        return 0<=x<m and 0<=y<n and road[x*n+y]
+
+    def reaches(a, target, d, w):
+        # 沿方向 d 从 a 出发能否在碰到墙 w 之前到达 target
+        return (target-a)*d>0 and (w-target)*d>0
+
+    def jump_y(x, y, d):
+        c = x*n+y
+        best = next_y[d][c]
+        if x==ex and reaches(y, ey, d, wall_y[d][c]) and (best<0 or (best-ey)*d>0):
+            best = ey
+        return None if best<0 else (x, best)
+
+    def jump_x(x, y, d):
+        c = x*n+y
+        w = wall_x[d][c]
+        best = next_x[d][c]
+        if reaches(x, ex, d, w) and (best<0 or (best-ex)*d>0):
+            # 在终点所在的行上可以沿y方向直达终点
+            if y==ey:
+                best = ex
+            else:
+                dy = 1 if ey>y else -1
+                if reaches(y, ey, dy, wall_y[dy][ex*n+y]):
+                    best = ex
+        return None if best<0 else (best, y)
+
+    def heuristic(x, y):
+        if hfield is None:
+            return abs(x-ex)+abs(y-ey)
+        return int(hfield[x*n+y])
+
+    g = {(sx, sy): 0}
+    parent = {(sx, sy): None}
+    q = [(heuristic(sx, sy), 0, sx, sy, 0, 0)] # (priority, dist_to_origin, x, y, dx, dy)
+    closed = set()
+    flag = False
+    profiling = PROFILER.enabled
+
+    while q:
+        _, dist, x, y, dx, dy = heappop(q)
+        if profiling: PROFILER.popped += 1
+        if (x, y) in closed: continue
+        if x==ex and y==ey:
+            flag = True
+            break
+        closed.add((x, y))
+
+        if dx==0 and dy==0:
+            dirs = ((-1,0),(1,0),(0,-1),(0,1))
+        elif dx!=0:
+            dirs = ((dx,0),(0,-1),(0,1))
+        else:
+            dirs = [(0,dy)]+[(d,0) for d in (-1,1) if free(x+d, y) and not free(x+d, y-dy)]
+        for ddx, ddy in dirs:
+            point = jump_x(x, y, ddx) if ddx!=0 else jump_y(x, y, ddy)
+            if point is None or point in closed: continue
+            new_dist = dist+abs(point[0]-x)+abs(point[1]-y)
+            if g.get(point, new_dist+1)<=new_dist: continue
+            g[point] = new_dist
+            parent[point] = (x, y)
+            heappush(q, (new_dist+heuristic(*point), new_dist, point[0], point[1], ddx, ddy))
+            if profiling: PROFILER.pushed += 1
+
+    if not flag:
+        return [], []
+    points = []
+    node = (ex, ey)
+    while node is not None:
+        points.append(node)
+        node = parent[node]
+    points.reverse()
+    # 将跳点之间的直线段展开为逐格路线
+    route = [points[0]]
+    for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
+        step_x, step_y = (x1>x0)-(x1<x0), (y1>y0)-(y1<y0)
+        for k in range(1, abs(x1-x0)+abs(y1-y0)+1):
+            route.append((x0+k*step_x, y0+k*step_y))
+    return route, parse_moves(route)
+
+@profiled_search("astar")
 def Astar(grid, start, end, reservation=None, _heuristic=None, isStrictCheck=True, canWait=False, useVisited=True):
     """
     grid : m*n np bool matrix, True for road, False for block
     start: (x,y), tuple
     end  : (x,y), tuple
     """
+    if reservation is None and (not canWait):
+        # 静态网格上没有时间维度, 使用 jump point search
+        return _jump_point_search(grid, start, end, _heuristic=_heuristic)
     if isStrictCheck and (not canWait) and useVisited:
         return _Astar_Strict(grid, start, end, reservation=reservation, _heuristic=_heuristic)
 
-    def heuristic(node):
-        return tup_dist(node, end)
+    # 状态为(格子, 时间), 用父节点编号代替在每次入队时复制整条路线
+    m, n = grid.shape
+    _, neighbors, xs, ys = neighbor_table(grid.shape)
+    road = grid.ravel()
+    ex, ey = int(end[0]), int(end[1])
+    s_cell = int(start[0])*n+int(start[1])
+    e_cell = ex*n+ey
+    hfield = _heuristic_field(_heuristic, (ex, ey))
+    is_reserved, is_blocked, is_swap = _reservation_checks(reservation, m, n)
 
-    visited = set([])
-    q = PriorityQueue() # (priority, dist_to_origin, current_node)
-    q.put((0, 0, start, [start]))
+    cells = [s_cell]
+    parents = [-1]
+    visited = set()
+    q = [(0, 0, s_cell, 0)] # (priority, dist_to_origin, current_cell, state_id)
     flag = False
+    profiling = PROFILER.enabled
 
-    while q.qsize()>0:
-        _, dist, node, route = q.get()
-        if tup_equal(node, end):
+    while q:
+        _, dist, cell, state = heappop(q)
+        if profiling: PROFILER.popped += 1
+        if cell==e_cell:
             flag = True
             break
-        if useVisited: visited.add(node)
-
-        if canWait:
-            new_nodes = [(int(node[0]), int(node[1])),
-                         (int(node[0]-1), int(node[1])),
-                         (int(node[0]+1), int(node[1])),
-                         (int(node[0]), int(node[1]-1)),
-                         (int(node[0]), int(node[1]+1))]
-        else:
-            new_nodes = [(int(node[0]-1), int(node[1])),
-                         (int(node[0]+1), int(node[1])),
-                         (int(node[0]), int(node[1]-1)),
-                         (int(node[0]), int(node[1]+1))]
+        if useVisited: visited.add(cell)
 
-        for new_node in new_nodes:
-            if new_node[0]<0 or new_node[1]<0 or new_node[0]>=grid.shape[0] or new_node[1]>=grid.shape[1]:
+        new_dist = dist+1
+        new_cells = ((cell,)+neighbors[cell]) if canWait else neighbors[cell]
+        for new_cell in new_cells:
+            if not road[new_cell]:
                 continue
-            if not grid[new_node]:
+            if new_cell in visited and new_cell!=cell:
                 continue
-            if new_node in visited and (not tup_equal(node, new_node)):
-                continue
-            if isStrictCheck:
-                if reservation is not None and (dist+1)<reservation.shape[2] and \
-                        reservation[new_node[0], new_node[1], dist]+reservation[new_node[0], new_node[1], dist+1]>0:
+            if reservation is not None:
+                if isStrictCheck:
+                    if is_blocked(new_cell, dist): continue
+                elif is_reserved(new_cell, new_dist):
                     continue
-            else:
-                if reservation is not None and (dist+1)<reservation.shape[2] and \
-                        reservation[new_node[0], new_node[1], dist+1]>0:
+                elif is_swap is not None and is_swap(cell, new_cell, dist):
                     continue
-            if _heuristic is None:
-                p = dist+1+heuristic(new_node)
+            if hfield is None:
+                p = new_dist+abs(xs[new_cell]-ex)+abs(ys[new_cell]-ey)
             else:
-                p = dist+1+_heuristic[new_node[0],new_node[1],end[0],end[1]]
-            q.put((p, dist+1, new_node, route+[new_node]))
+                p = new_dist+int(hfield[new_cell])
+            cells.append(new_cell)
+            parents.append(state)
+            heappush(q, (p, new_dist, new_cell, len(cells)-1))
+            if profiling: PROFILER.pushed += 1
 
     if flag:
+        route = [(xs[cells[s]], ys[cells[s]]) for s in _trace(state, parents.__getitem__)]
         moves = parse_moves(route)
         return route, moves
     else:
         return [], []
+
+class focal_queue:
+    """
+    Open list of a focal search with suboptimality factor w. Every item has
+    a lower-bound key lb, a value that must be at most w*lb_min (lb_min being
+    the smallest lb still open) for the item to enter FOCAL, and the key
+    that orders FOCAL. pop() returns the FOCAL item with the smallest key.
+    """
+    def __init__(self, w):
+        self.w = w
+        self._open = [] # (lb, id)
+        self._pending = [] # (value, id), not admitted to FOCAL yet
+        self._focal = [] # (focal_key, id)
+        self._items = {} # id -> (value, focal_key, item)
+        self._n = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def push(self, lb, value, focal_key, item):
+        self._n += 1
+        self._items[self._n] = (value, focal_key, item)
+        heappush(self._open, (lb, self._n))
+        heappush(self._pending, (value, self._n))
+
+    def lb_min(self):
+        while self._open and self._open[0][1] not in self._items:
+            heappop(self._open)
+        return self._open[0][0] if self._open else None
+
+    def pop(self):
+        """
+        Returns (item, lb_min), lb_min being the smallest lower bound open
+        before the pop.
+        """
+        lb_min = self.lb_min()
+        if lb_min is None:
+            raise IndexError("pop from an empty focal_queue")
+        bound = self.w*lb_min
+        while self._pending and self._pending[0][0]<=bound:
+            value, i = heappop(self._pending)
+            if i in self._items:
+                heappush(self._focal, (self._items[i][1], i))
+        while self._focal:
+            key, i = heappop(self._focal)
+            if i not in self._items: continue
+            if self._items[i][0]>bound:
+                heappush(self._pending, (self._items[i][0], i))
+                continue
+            return self._items.pop(i)[2], lb_min
+        # 理论上 FOCAL 不会为空, 以防万一退化为按 lb 取出
+        i = self._open[0][1]
+        return self._items.pop(i)[2], lb_min
+
+@profiled_search("focal_astar")
+def focal_Astar(grid, start, end, w, conflicts=None, reservation=None, _heuristic=None):
+    """
+    Bounded-suboptimal A* (the low level of ECBS). Among the open states with
+    f <= w*f_min it expands the one with the fewest conflicts, as counted by
+    conflicts(x, y, t) (the number of other agents at (x,y) at time t), so
+    the route is at most w times longer than the shortest one.
+    Returns (route, moves, lb), lb being the lower bound f_min on the length
+    of the shortest route when the goal was reached.
+    """
+    m, n = grid.shape
+    _, neighbors, xs, ys = neighbor_table(grid.shape)
+    road = grid.ravel()
+    ex, ey = int(end[0]), int(end[1])
+    s_cell = int(start[0])*n+int(start[1])
+    e_cell = ex*n+ey
+    hfield = _heuristic_field(_heuristic, (ex, ey))
+    is_reserved, is_blocked, is_swap = _reservation_checks(reservation, m, n)
+
+    def heuristic(cell):
+        if hfield is None:
+            return abs(xs[cell]-ex)+abs(ys[cell]-ey)
+        return int(hfield[cell])
+
+    best_g = {s_cell: 0}
+    cells = [s_cell]
+    parents = [-1]
+    q = focal_queue(w)
+    h0 = heuristic(s_cell)
+    q.push(h0, h0, (0, h0, 0), (0, 0, 0)) # item: (state_id, dist_to_origin, n_conflicts)
+    profiling = PROFILER.enabled
+
+    while len(q)>0:
+        (state, dist, n_conf), lb = q.pop()
+        if profiling: PROFILER.popped += 1
+        cell = cells[state]
+        if dist>best_g[cell]: continue
+        if cell==e_cell:
+            route = [(xs[cells[s]], ys[cells[s]]) for s in _trace(state, parents.__getitem__)]
+            return route, parse_moves(route), lb
+        new_dist = dist+1
+        for new_cell in neighbors[cell]:
+            if not road[new_cell]: continue
+            if new_cell in best_g and best_g[new_cell]<=new_dist: continue
+            if is_blocked is not None and is_blocked(new_cell, dist): continue
+            best_g[new_cell] = new_dist
+            f = new_dist+heuristic(new_cell)
+            new_conf = n_conf
+            if conflicts is not None:
+                new_conf += conflicts(xs[new_cell], ys[new_cell], new_dist)
+            cells.append(new_cell)
+            parents.append(state)
+            q.push(f, f, (new_conf, f, -new_dist), (len(cells)-1, new_dist, new_conf))
+            if profiling: PROFILER.pushed += 1
+
+    return [], [], None
+
+INF = float("inf")
+
+def safe_intervals(cell, is_reserved, window):
+    """
+    The maximal runs [start, end] of timesteps in which cell is not reserved.
+    The last interval is open-ended (end=INF), since nothing is reserved
+    beyond the window.
+    """
+    intervals = []
+    start = 0
+    for t in range(window):
+        if is_reserved(cell, t):
+            if start<t:
+                intervals.append((start, t-1))
+            start = t+1
+    intervals.append((start, INF))
+    return intervals
+
+@profiled_search("sipp")
+def SIPP(grid, start, end, reservation=None, _heuristic=None, stay=False):
+    """
+    Safe Interval Path Planning.
+    grid : m*n np bool matrix, True for road, False for block
+    start: (x,y), tuple
+    end  : (x,y), tuple
+    The search runs over (cell, safe interval) states instead of (cell, t),
+    so waiting is handled natively and the state space does not grow with
+    the reservation window. Moves follow the strict check of Astar: the
+    entered cell must be free at the departure and the arrival times, and
+    as in Astar a move departing at the last slot of the window (arriving
+    past it) is not checked against that slot.
+    stay: the goal must be reached in its last, open-ended, safe interval so
+          that the agent can stay there.
+    Returns (route, moves) like Astar, waits appearing as repeated cells.
+    """
+    m, n = grid.shape
+    _, neighbors, xs, ys = neighbor_table(grid.shape)
+    road = grid.ravel()
+    ex, ey = int(end[0]), int(end[1])
+    s_cell = int(start[0])*n+int(start[1])
+    e_cell = ex*n+ey
+    hfield = _heuristic_field(_heuristic, (ex, ey))
+    is_reserved, is_blocked, is_swap = _reservation_checks(reservation, m, n)
+    if reservation is None:
+        window = 0
+    elif hasattr(reservation, "window"):
+        window = reservation.window
+    else:
+        window = reservation.shape[2]
+
+    if is_reserved is not None:
+        # AGV 此刻就在起点, 忽略起点在 t=0 的占用
+        _is_reserved = is_reserved
+        is_reserved = lambda cell, t: (t>0 or cell!=s_cell) and _is_reserved(cell, t)
+
+    cache = {}
+    def intervals_of(cell):
+        if cell not in cache:
+            cache[cell] = [(0, INF)] if is_reserved is None else safe_intervals(cell, is_reserved, window)
+        return cache[cell]
+
+    def heuristic(cell):
+        if hfield is None:
+            return abs(xs[cell]-ex)+abs(ys[cell]-ey)
+        return int(hfield[cell])
+
+    states = [(s_cell, 0, 0)] # (cell, interval_index, arrival_time)
+    parents = [-1]
+    best = {(s_cell, 0): 0}
+    q = [(heuristic(s_cell), 0, 0)] # (priority, arrival_time, state_id)
+    closed = set()
+    profiling = PROFILER.enabled
+
+    while q:
+        _, arrival, state = heappop(q)
+        if profiling: PROFILER.popped += 1
+        cell, k, _ = states[state]
+        if (cell, k) in closed: continue
+        closed.add((cell, k))
+        interval_end = intervals_of(cell)[k][1]
+        if cell==e_cell and (not stay or interval_end==INF):
+            route = []
+            chain = _trace(state, parents.__getitem__)
+            for a, b in zip(chain[:-1], chain[1:]):
+                prev_cell, _, prev_arrival = states[a]
+                route.extend([(xs[prev_cell], ys[prev_cell])]*(states[b][2]-prev_arrival))
+            route.append((xs[cell], ys[cell]))
+            return route, parse_moves(route)
+        for new_cell in neighbors[cell]:
+            if not road[new_cell]: continue
+            for new_k, (a, b) in enumerate(intervals_of(new_cell)):
+                # 出发时刻 t 需满足: 当前格子在 t 之前一直安全, 目标格子在 t 和 t+1 均安全
+                # 与 Astar 相同, 在窗口最后一步出发时不检查目标格子在该步的占用
+                earliest = a-1 if 0<a==window else a
+                t = max(arrival, earliest)
+                if t>interval_end or t+1>b: continue
+                if (new_cell, new_k) in closed: continue
+                if best.get((new_cell, new_k), INF)<=t+1: continue
+                best[(new_cell, new_k)] = t+1
+                states.append((new_cell, new_k, t+1))
+                parents.append(state)
+                heappush(q, (t+1+heuristic(new_cell), t+1, len(states)-1))
+                if profiling: PROFILER.pushed += 1
+
+    return [], []
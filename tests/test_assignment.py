@@ -0,0 +1,62 @@
+import itertools
+import numpy as np
+
+from search.planner_assignment import assignment_solver
+
+def brute_force(cost):
+    n, m = cost.shape
+    if n<=m:
+        return min(sum(cost[i, cols[i]] for i in range(n)) for cols in itertools.permutations(range(m), n))
+    return brute_force(cost.T)
+
+def total(cost, rows, cols, result):
+    row_index = {key: i for i, key in enumerate(rows)}
+    col_index = {key: j for j, key in enumerate(cols)}
+    assert len(set(result.values()))==len(result)
+    assert len(result)==min(len(rows), len(cols))
+    return sum(cost[row_index[r], col_index[c]] for r, c in result.items())
+
+def test_hungarian_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        n, m = rng.integers(1, 7, 2)
+        cost = rng.integers(0, 20, (n, m)).astype(float)
+        rows, cols = list(range(n)), list(range(100, 100+m))
+        result = assignment_solver().solve(rows, cols, cost)
+        assert np.isclose(total(cost, rows, cols, result), brute_force(cost))
+
+def test_warm_start_stays_optimal():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        solver = assignment_solver()
+        rows, cols = list(range(5)), list(range(100, 105))
+        next_key = 200
+        for _ in range(10):
+            # 每次替换一部分行和列, 并扰动代价, 沿用上次的匹配和势能
+            if rng.random()<0.5 and len(rows)>1:
+                rows.pop(int(rng.integers(len(rows))))
+            if rng.random()<0.5:
+                rows.append(next_key)
+                next_key += 1
+            if rng.random()<0.5 and len(cols)>1:
+                cols.pop(int(rng.integers(len(cols))))
+            if rng.random()<0.5:
+                cols.append(next_key)
+                next_key += 1
+            rows, cols = rows[:6], cols[:6]
+            cost = rng.integers(0, 20, (len(rows), len(cols))).astype(float)
+            result = solver.solve(rows, cols, cost)
+            assert np.isclose(total(cost, rows, cols, result), brute_force(cost))
+
+def test_column_shift():
+    rng = np.random.default_rng(2)
+    for _ in range(100):
+        n, m = rng.integers(1, 6), rng.integers(1, 6)
+        rows, cols = list(range(n)), list(range(10, 10+m))
+        cost = rng.integers(0, 20, (n, m)).astype(float)
+        solver = assignment_solver()
+        solver.solve(rows, cols, cost)
+        shift = rng.integers(-5, 5, m).astype(float)
+        cost = cost+shift[None,:]
+        result = solver.solve(rows, cols, cost, col_shift=shift)
+        assert np.isclose(total(cost, rows, cols, result), brute_force(cost))
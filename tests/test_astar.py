@@ -0,0 +1,66 @@
+import numpy as np
+
+from search import planner_utils
+from search.planner_utils import Astar, neighbor_table, _get_buffers
+from test_distance_heuristic import bfs
+
+def strict_query(rng, shape):
+    grid = rng.random(shape)>0.3
+    free = [tuple(int(v) for v in c) for c in np.argwhere(grid)]
+    start, end = free[rng.integers(len(free))], free[rng.integers(len(free))]
+    # 空的预约数组, Astar 走带缓冲区的严格检查分支
+    return grid, start, end, np.zeros(shape+(4,), dtype=int)
+
+def assert_shortest(grid, start, end, route):
+    ref = bfs(grid, end)[start]
+    if ref<0:
+        assert route==[]
+        return
+    assert len(route)-1==ref
+    assert route[0]==start and route[-1]==end
+    for a, b in zip(route[:-1], route[1:]):
+        assert abs(a[0]-b[0])+abs(a[1]-b[1])==1 and grid[b]
+
+def test_reused_buffers_give_shortest_routes():
+    rng = np.random.default_rng(0)
+    # 形状不同但格子数相同的网格共用同一组缓冲区
+    for shape in [(6, 8), (8, 6), (4, 12), (7, 7)]*25:
+        grid, start, end, reservation = strict_query(rng, shape)
+        route, moves = Astar(grid, start, end, reservation=reservation)
+        assert_shortest(grid, start, end, route)
+        assert len(moves)==max(len(route)-1, 0)
+
+def test_generation_wraps_around():
+    rng = np.random.default_rng(1)
+    n_cells = 5*9
+    buffers = _get_buffers(n_cells)
+    # 上一代留下的脏数据, 之后几次搜索的代数越过 int32 的上限
+    buffers[0][:] = 0
+    buffers[3] = np.iinfo(np.int32).max-3
+    buffers[2][:] = buffers[3]
+    for _ in range(6):
+        grid, start, end, reservation = strict_query(rng, (5, 9))
+        route, _ = Astar(grid, start, end, reservation=reservation)
+        assert_shortest(grid, start, end, route)
+    assert 0<planner_utils._search_buffers[n_cells][3]<10
+
+def test_stale_stamps_are_ignored():
+    grid = np.ones((5, 5), dtype=bool)
+    reservation = np.zeros((5, 5, 4), dtype=int)
+    Astar(grid, (0, 0), (4, 4), reservation=reservation)
+    # 上一次搜索留下很小的 g 值, 新一代的搜索不应读到
+    g, parent, stamp, gen = _get_buffers(25)
+    g[:] = 0
+    parent[:] = 0
+    route, _ = Astar(grid, (4, 0), (0, 4), reservation=reservation)
+    assert len(route)==9
+
+def test_neighbor_table():
+    table, neighbors, xs, ys = neighbor_table((3, 4))
+    assert table is neighbor_table((3, 4))[0]
+    for cell in range(12):
+        x, y = divmod(cell, 4)
+        expected = {(x+dx)*4+y+dy for dx, dy in [(-1,0),(1,0),(0,-1),(0,1)] if 0<=x+dx<3 and 0<=y+dy<4}
+        assert set(neighbors[cell])==expected
+        assert set(table[cell].tolist())-{-1}==expected
+        assert (xs[cell], ys[cell])==(x, y)
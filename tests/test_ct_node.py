@@ -0,0 +1,55 @@
+import copy
+import numpy as np
+
+from search.planner_CBS import ct_node, build_occupancy
+
+def random_route(rng, length):
+    return [(int(rng.integers(4)), int(rng.integers(4))) for _ in range(length)]
+
+def as_sets(occupancy):
+    # 同一格子上AGV的顺序不影响冲突检测
+    return [{cell: sorted(agents) for cell, agents in occ.items()} for occ in occupancy]
+
+def test_delta_nodes_match_deep_copied_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        n_agents = int(rng.integers(2, 6))
+        solution = [random_route(rng, int(rng.integers(1, 7))) for _ in range(n_agents)]
+        lbs = [len(route)-1 for route in solution]
+        root = ct_node(None, solution=solution, lb=lbs)
+        # 参照: 旧的实现在每个节点深拷贝整个解和约束表
+        nodes = [(root, {"solution": copy.deepcopy(solution), "constraints": {i: [] for i in range(n_agents)},
+                         "lb": list(lbs)})]
+        for _ in range(40):
+            parent, ref = nodes[rng.integers(len(nodes))]
+            agent = int(rng.integers(n_agents))
+            constraint = (int(rng.integers(4)), int(rng.integers(4)), int(rng.integers(8)))
+            route = random_route(rng, int(rng.integers(1, 9)))
+            node = ct_node(parent, agent, constraint, route, lb=len(route)-2)
+            child = copy.deepcopy(ref)
+            child["solution"][agent] = route
+            child["constraints"][agent].append(constraint)
+            child["lb"][agent] = len(route)-2
+            nodes.append((node, child))
+            assert node.depth==parent.depth+1
+        # 以随机顺序检查, 子节点的占用可能先于父节点被计算
+        for k in rng.permutation(len(nodes)):
+            node, ref = nodes[k]
+            assert node.solution()==ref["solution"]
+            assert node.lower_bounds()==ref["lb"]
+            for agent in range(n_agents):
+                assert node.constraints(agent)==ref["constraints"][agent]
+                assert node.route_of(agent)==ref["solution"][agent]
+            assert as_sets(node.occupancy(node.solution()))==as_sets(build_occupancy(ref["solution"]))
+        # 根节点的解不被子节点修改
+        assert root.solution()==solution
+
+def test_unchanged_steps_share_the_parent_occupancy():
+    solution = [[(0,0), (0,1), (0,2)], [(1,0), (1,1), (1,2)]]
+    root = ct_node(None, solution=solution, lb=[2, 2])
+    child = ct_node(root, 1, (1,1,1), [(1,0), (1,0), (1,1), (1,2)])
+    parent_occ = root.occupancy(root.solution())
+    occ = child.occupancy(child.solution())
+    assert occ[0] is parent_occ[0]
+    assert occ[1] is not parent_occ[1]
+    assert as_sets(occ)==as_sets(build_occupancy(child.solution()))
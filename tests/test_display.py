@@ -0,0 +1,83 @@
+import os
+import random
+import numpy as np
+import pytest
+
+pygame = pytest.importorskip("pygame")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from lib.game_display import game_display, cell_states, changed_cells
+from lib.game_display_X import game_display_X
+from lib.game_engine import game_engine
+from lib.utils import read_map, parse_map, init_parcels
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def new_engine(name, step_left=None):
+    np.random.seed(0)
+    random.seed(0)
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+    return game_engine(parse_map(_abs, _players, init_parcels(_abs, 5)), 2, step_left=step_left)
+
+def loop_cell_states(engine):
+    m, n = engine.terrain.shape
+    state = np.zeros((m, n, 4), dtype=np.int64)
+    for i in range(m):
+        for j in range(n):
+            player, parcel = int(engine.player_map[i,j]), int(engine.parcel_map[i,j])
+            state[i,j,0] = player
+            state[i,j,1] = player>0 and engine.players[player-1,2]>0
+            state[i,j,2] = parcel
+            if parcel>0 and engine.step_left is not None:
+                state[i,j,3] = engine.step_left[parcel-1]
+    return state
+
+def test_changed_cells_cover_every_change():
+    ge = new_engine("M0", step_left=[])
+    policy = greedy_WHCA(ge, 10)
+    prev = None
+    for _ in range(60):
+        state = cell_states(ge)
+        assert np.array_equal(state, loop_cell_states(ge))
+        changed = {tuple(c) for c in changed_cells(state, prev).tolist()}
+        m, n = ge.terrain.shape
+        for i in range(m):
+            for j in range(n):
+                if prev is None:
+                    expected = state[i,j,0]>0 or state[i,j,2]>0
+                else:
+                    expected = np.any(state[i,j]!=prev[i,j])
+                assert ((i, j) in changed)==expected
+        prev = state
+        _, moves = policy.pop_moves(ge)
+        ge.step(moves)
+
+@pytest.mark.parametrize("display_class", [game_display, game_display_X])
+@pytest.mark.parametrize("disp_scale", [0.5, 1.0])
+def test_dirty_rects_match_full_redraw(display_class, disp_scale, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    ge = new_engine("M0", step_left=[])
+    display = display_class(ge, disp_scale=disp_scale)
+    policy = greedy_WHCA(ge, 10)
+    try:
+        for _ in range(25):
+            _, moves = policy.pop_moves(ge)
+            ge.step(moves)
+            assert display.update(ge)
+            partial = pygame.surfarray.array3d(display.screen)
+            # 从背景重画整个画面, 与只重画改变的格子的结果逐像素比较
+            display.invalidate()
+            assert display.update(ge)
+            assert np.array_equal(partial, pygame.surfarray.array3d(display.screen))
+        # set_state 换了地形之后整个重画
+        other = new_engine("M0")
+        ge.set_state(*other.get_state())
+        assert display.update(ge)
+        partial = pygame.surfarray.array3d(display.screen)
+        display.invalidate()
+        display.update(ge)
+        assert np.array_equal(partial, pygame.surfarray.array3d(display.screen))
+    finally:
+        pygame.quit()
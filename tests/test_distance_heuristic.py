@@ -0,0 +1,94 @@
+from collections import deque
+import numpy as np
+
+from search.planner_utils import distance_heuristic, Astar
+
+def bfs(grid, end):
+    m, n = grid.shape
+    dist = -np.ones((m, n), dtype=int)
+    dist[end] = 0
+    q = deque([end])
+    while q:
+        x, y = q.popleft()
+        for nx, ny in [(x+1,y), (x-1,y), (x,y+1), (x,y-1)]:
+            if 0<=nx<m and 0<=ny<n and grid[nx,ny] and dist[nx,ny]<0:
+                dist[nx,ny] = dist[x,y]+1
+                q.append((nx, ny))
+    return dist
+
+def test_fields_are_true_distances():
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        grid = rng.random((9, 11))>0.3
+        heuristic = distance_heuristic(grid)
+        for end in [tuple(int(v) for v in c) for c in np.argwhere(grid)[:5]]:
+            field = heuristic.field(end)
+            ref = bfs(grid, end)
+            reachable = ref>=0
+            assert np.array_equal(field[reachable], ref[reachable])
+            # 被封闭的格子不小于0, 索引方式与全对表一致
+            assert np.all(field>=0)
+            x, y = np.argwhere(reachable)[-1]
+            assert heuristic[x, y, end[0], end[1]]==ref[x, y]
+
+def test_unreachable_cells_fall_back_to_manhattan():
+    grid = np.ones((5, 5), dtype=bool)
+    grid[:, 2] = False
+    field = distance_heuristic(grid).field((0, 0))
+    for x in range(5):
+        for y in range(3, 5):
+            assert field[x, y]==x+y
+    # 墙上的格子取相邻可达格子的距离+1
+    for x in range(5):
+        assert field[x, 2]==x+2
+
+def test_lru_keeps_at_most_max_goals(monkeypatch):
+    grid = np.ones((6, 6), dtype=bool)
+    heuristic = distance_heuristic(grid, max_goals=2)
+    built = []
+    build = distance_heuristic._build_field
+    def counting(self, end):
+        built.append(end)
+        return build(self, end)
+    monkeypatch.setattr(distance_heuristic, "_build_field", counting)
+    a, b, c = (0, 0), (5, 5), (2, 3)
+    heuristic.field(a)
+    heuristic.field(b)
+    heuristic.field(a) # a 最近使用, b 最久未用
+    heuristic.field(c)
+    assert list(heuristic.fields)==[a, c]
+    heuristic.field(a)
+    assert built==[a, b, c]
+    heuristic.field(b)
+    assert built==[a, b, c, b]
+    assert len(heuristic.fields)==2
+
+def test_preloaded_fields_skip_the_bfs(monkeypatch):
+    grid = np.ones((4, 5), dtype=bool)
+    grid[1, 1:4] = False
+    ends = [(0, 0), (3, 4)]
+    fields = [distance_heuristic(grid).field(end).astype(np.int16) for end in ends]
+    heuristic = distance_heuristic(grid)
+    assert heuristic.preload(ends, fields, grid)
+    monkeypatch.setattr(distance_heuristic, "_build_field", lambda self, end: None)
+    for end, field in zip(ends, fields):
+        assert heuristic.field(end).dtype==np.int32
+        assert np.array_equal(heuristic.field(end), field)
+    # 网格不同的距离场不被采用
+    other = distance_heuristic(np.ones((4, 5), dtype=bool))
+    assert not other.preload(ends, fields, grid)
+    assert other.precomputed=={}
+
+def test_astar_with_heuristic_finds_shortest_routes():
+    rng = np.random.default_rng(1)
+    for _ in range(30):
+        grid = rng.random((10, 10))>0.25
+        free = [tuple(int(v) for v in c) for c in np.argwhere(grid)]
+        start, end = free[0], free[-1]
+        heuristic = distance_heuristic(grid, max_goals=4)
+        route, _ = Astar(grid, start, end, reservation=np.zeros((10, 10, 5), dtype=int), _heuristic=heuristic)
+        ref = bfs(grid, end)[start]
+        if ref<0:
+            assert route==[]
+        else:
+            assert len(route)-1==ref
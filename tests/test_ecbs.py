@@ -0,0 +1,67 @@
+import random
+import numpy as np
+
+from lib.game_engine import game_engine
+from lib.utils import random_puzzle_abs
+from search.planner_CBS import build_moving_plan, build_occupancy, find_conflicts, cost
+from search.planner_utils import focal_queue
+
+def puzzle(seed, shape=(8,8), num=4):
+    np.random.seed(seed)
+    random.seed(seed)
+    ge = game_engine(random_puzzle_abs(shape, 0.7, num), 0, auto_unload=True)
+    grid = ge.terrain>=0
+    startings = [(int(x[0]), int(x[1])) for x in ge.parcel_coords if x[0]>=0]
+    endings = [(int(x[0]), int(x[1])) for x in ge.shelf_coords]
+    return grid, startings, endings
+
+def at(route, t):
+    return route[min(t, len(route)-1)]
+
+def assert_conflict_free(solution):
+    for t in range(cost(solution)):
+        cells = [at(route, t) for route in solution]
+        assert len(set(cells))==len(cells)
+        nexts = [at(route, t+1) for route in solution]
+        for i in range(len(solution)):
+            for j in range(len(solution)):
+                if i!=j and cells[i]!=nexts[i]:
+                    assert not (cells[i]==nexts[j] and nexts[i]==cells[j])
+
+def test_focal_queue_pops_best_focal_item():
+    rng = np.random.default_rng(0)
+    for w in [1.0, 1.5, 2.0]:
+        q = focal_queue(w)
+        items = {}
+        for k in range(60):
+            lb = int(rng.integers(1, 20))
+            value = lb+int(rng.integers(0, 5))
+            key = int(rng.integers(0, 10))
+            q.push(lb, value, (key, k), k)
+            items[k] = (lb, value, key)
+        while len(q)>0:
+            lb_min = min(lb for lb, _, _ in items.values())
+            focal = [(key, k) for k, (_, value, key) in items.items() if value<=w*lb_min]
+            item, popped_lb = q.pop()
+            assert popped_lb==lb_min
+            if len(focal)>0:
+                assert (items[item][2], item)==min(focal)
+            else:
+                # FOCAL 为空时按下界取出
+                assert items[item][0]==lb_min
+            del items[item]
+
+def test_ecbs_within_bound_of_optimal():
+    for seed in range(6):
+        grid, startings, endings = puzzle(seed)
+        optimal = build_moving_plan(grid, startings, endings)
+        assert optimal is not None
+        assert_conflict_free(optimal)
+        for w in [1.2, 1.5, 2.0]:
+            solution = build_moving_plan(grid, startings, endings, w=w)
+            assert solution is not None
+            assert_conflict_free(solution)
+            assert find_conflicts(solution, build_occupancy(solution))==[]
+            assert cost(solution)<=w*cost(optimal)
+            for route, start, end in zip(solution, startings, endings):
+                assert tuple(route[0])==start and tuple(route[-1])==end
@@ -0,0 +1,81 @@
+import numpy as np
+
+from search.planner_CBS import build_occupancy, find_conflicts, build_moving_plan
+from test_ecbs import puzzle
+
+def at(route, t):
+    return route[min(t, len(route)-1)]
+
+def brute_force_conflicts(solution):
+    """
+    Pairwise check of every timestep, as validate did before the hash maps.
+    """
+    n = len(solution)
+    for t in range(max(len(route) for route in solution)):
+        conflicts = set()
+        for i in range(n):
+            for j in range(n):
+                if i!=j and at(solution[i], t)==at(solution[j], t):
+                    conflicts.add((i, at(solution[i], t), t))
+        if t>0:
+            # i 进入 j 刚离开的格子; 沿着这条关系回到自身的AGV构成环(包括对穿)
+            def succ(i):
+                for j in range(n):
+                    if j!=i and at(solution[j], t-1)==at(solution[i], t):
+                        return j
+                return -1
+            for i in range(n):
+                j = succ(i)
+                for _ in range(n):
+                    if j<0 or j==i: break
+                    j = succ(j)
+                if j==i:
+                    conflicts.add((i, at(solution[i], t), t))
+        if len(conflicts)>0:
+            return conflicts
+    return set()
+
+def random_solution(rng, n_agents, size, length):
+    solution = []
+    for _ in range(n_agents):
+        route = [(int(rng.integers(size)), int(rng.integers(size)))]
+        for _ in range(int(rng.integers(0, length))):
+            x, y = route[-1]
+            dx, dy = [(0,1), (1,0), (0,-1), (-1,0), (0,0)][rng.integers(5)]
+            route.append((min(max(x+dx, 0), size-1), min(max(y+dy, 0), size-1)))
+        solution.append(route)
+    return solution
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(0)
+    found = {"vertex": 0, "ring": 0, "none": 0}
+    for _ in range(2000):
+        solution = random_solution(rng, int(rng.integers(2, 7)), int(rng.integers(2, 6)), 8)
+        expected = brute_force_conflicts(solution)
+        conflicts = find_conflicts(solution, build_occupancy(solution))
+        assert len(conflicts)==len(set(conflicts))
+        assert set(conflicts)==expected
+        if len(expected)==0:
+            found["none"] += 1
+        else:
+            t = next(iter(expected))[2]
+            cells = [at(route, t) for route in solution]
+            found["vertex" if len(set(cells))<len(cells) else "ring"] += 1
+    assert min(found.values())>0
+
+def test_swap_and_rotation():
+    # 对穿
+    swap = [[(0,0), (0,1)], [(0,1), (0,0)]]
+    assert set(find_conflicts(swap, build_occupancy(swap)))=={(0, (0,1), 1), (1, (0,0), 1)}
+    # 三个AGV的环
+    ring = [[(0,0), (0,1)], [(0,1), (1,1)], [(1,1), (0,0)]]
+    assert len(find_conflicts(ring, build_occupancy(ring)))==3
+    # 跟随前车不是冲突
+    chain = [[(0,0), (0,1)], [(0,1), (0,2)]]
+    assert find_conflicts(chain, build_occupancy(chain))==[]
+
+def test_cbs_solutions_are_conflict_free():
+    for seed in range(6):
+        grid, startings, endings = puzzle(seed)
+        solution = build_moving_plan(grid, startings, endings)
+        assert find_conflicts(solution, build_occupancy(solution))==[]
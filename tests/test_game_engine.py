@@ -0,0 +1,78 @@
+import os
+import random
+import numpy as np
+
+from lib.game_engine import game_engine
+from lib.utils import read_map, parse_map, init_parcels
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_map(name, n_parcels):
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+    return parse_map(_abs, _players, init_parcels(_abs, n_parcels))
+
+def rescan_timeout(ge):
+    # 与旧引擎相同, 逐个包裹扫描地图
+    if ge.step_left is None:
+        return 0
+    return sum(1 for k in range(ge.n_shelves) if ge.step_left[k]<0 and np.any(ge.parcel_map==k+1))
+
+def assert_indices_match_map(ge):
+    _map = np.asarray(ge._map)
+    for k in range(ge.n_shelves):
+        cells = np.argwhere(_map[:,:,0]==k+1)
+        assert ge.shelf_coords[k].tolist()==cells[0].tolist()
+        cells = np.argwhere(_map[:,:,1]==k+1)
+        if len(cells)==0:
+            assert ge.parcel_coords[k].tolist()==[-1, -1]
+            assert k not in ge.parcel_index
+        else:
+            assert ge.parcel_coords[k].tolist()==cells[0].tolist()
+            assert ge.parcel_index.position(k)==tuple(cells[0])
+    assert ge.spawn_coords.tolist()==np.argwhere(_map[:,:,0]==-2).tolist()
+    assert ge.n_parcels==int(np.sum(_map[:,:,1]>0))
+    assert len(ge.parcel_index)==ge.n_parcels
+    for i, (x, y, _) in enumerate(ge.players.tolist()):
+        assert _map[x, y, 2]==i+1
+        assert ge.player_index.position(i)==(x, y)
+    assert ge.get_score()[4]==rescan_timeout(ge)
+
+def test_indices_match_rescan_after_steps():
+    for name, step_left in [("M0", None), ("M3", [])]:
+        np.random.seed(0)
+        random.seed(0)
+        ge = game_engine(load_map(name, 5), 2, step_left=step_left)
+        policy = greedy_WHCA(ge, 10)
+        rng = np.random.RandomState(0)
+        for t in range(150):
+            _, moves = policy.pop_moves(ge)
+            moves = np.array(moves)
+            # 掺入随机动作, 覆盖被拒绝的移动与抓取
+            noisy = rng.random_sample(len(moves))<0.2
+            dirs = np.array([[-1,0], [1,0], [0,-1], [0,1], [0,0]])
+            moves[noisy,:2] = dirs[rng.randint(5, size=int(noisy.sum()))]
+            moves[noisy,2] = rng.randint(2, size=int(noisy.sum()))
+            ge.step(moves.tolist())
+            if t%10==0:
+                assert_indices_match_map(ge)
+        assert_indices_match_map(ge)
+
+def test_timeout_follows_deadline_changes():
+    np.random.seed(1)
+    ge = game_engine(load_map("M0", 5), 0, step_left=[])
+    assert ge.get_score()[4]==0
+    # 外部修改 step_left 后超时数随之更新, 不使用缓存的值
+    ge.step_left[ge.parcel_coords[:,0]>=0] = -1
+    assert ge.get_score()[4]==ge.n_parcels>0
+
+def test_set_state_rebuilds_indices():
+    np.random.seed(2)
+    ge = game_engine(load_map("M0", 5), 2, step_left=[])
+    other = game_engine(load_map("M3", 5), 2, step_left=[])
+    for _ in range(20):
+        other.step([[0,0,0]]*len(other.players))
+    ge.set_state(*other.get_state())
+    assert_indices_match_map(ge)
+    assert ge.shelf_coords.tolist()==other.shelf_coords.tolist()
+    assert ge.get_score()[4]==other.get_score()[4]
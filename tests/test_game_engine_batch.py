@@ -0,0 +1,49 @@
+import os
+import random
+import numpy as np
+
+from lib.game_engine import game_engine
+from lib.game_engine_batch import game_engine_batch
+from lib.utils import read_map, parse_map, init_parcels
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_map(name, n_parcels):
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+    return parse_map(_abs, _players, init_parcels(_abs, n_parcels))
+
+def test_batch_matches_single_engine():
+    for name, auto_unload in [("M0", False), ("M3", True)]:
+        np.random.seed(0)
+        random.seed(0)
+        _map = load_map(name, 10)
+        ge = game_engine(np.copy(_map), 0, auto_unload=auto_unload)
+        gb = game_engine_batch(np.stack([_map]*3), 0, auto_unload=auto_unload)
+        policy = greedy_WHCA(ge, 10)
+        for _ in range(100):
+            _, moves = policy.pop_moves(ge)
+            result = ge.step(moves)
+            batch_result = gb.step(np.stack([np.array(moves)]*3))
+            assert np.array_equal(batch_result, [result]*3)
+            for b in range(3):
+                assert np.array_equal(gb._map[b], np.asarray(ge._map))
+                assert np.array_equal(gb.players[b], ge.players)
+        steps, score, delivered, delayed, timeout = gb.get_score()
+        assert steps==ge.steps
+        assert list(score)==[ge.score]*3
+        assert list(delivered)==[ge.n_delivered]*3
+
+def test_parcel_sequence_past_horizon():
+    _map = load_map("M0", 0)
+    spawns = np.argwhere(_map[:,:,0]==-2)
+    seq = [[(int(spawns[0][0]), int(spawns[0][1]), 1)], [], [(int(spawns[1][0]), int(spawns[1][1]), 2)]]
+    ge = game_engine(np.copy(_map), 0, parcel_gen_seq=seq)
+    gb = game_engine_batch(np.stack([_map]*2), 0, parcel_gen_seqs=[seq, seq])
+    stay = np.zeros([len(ge.players), 3], dtype=int)
+    # 超出序列长度后两种引擎都不再产生包裹
+    for _ in range(len(seq)+3):
+        ge.step(stay.tolist())
+        gb.step(np.stack([stay]*2))
+        assert np.array_equal(gb._map[0], np.asarray(ge._map))
+    assert ge.n_parcels==2
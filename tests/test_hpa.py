@@ -0,0 +1,76 @@
+import numpy as np
+
+from search.planner_HPA import hpa_graph
+from test_distance_heuristic import bfs
+
+def abstraction(hpa):
+    # 与构造顺序无关的形式
+    inter = {cell: others for cell, others in hpa.inter.items() if len(others)>0}
+    intra = {c: {node: set(edges) for node, edges in cluster.items()} for c, cluster in hpa.intra.items()}
+    return hpa.borders, inter, intra
+
+def test_update_matches_rebuild():
+    rng = np.random.default_rng(0)
+    for _ in range(15):
+        shape = (int(rng.integers(8, 20)), int(rng.integers(8, 20)))
+        grid = rng.random(shape)>0.25
+        cluster_size = int(rng.integers(3, 7))
+        hpa = hpa_graph(grid, cluster_size)
+        for _ in range(8):
+            k = int(rng.integers(1, 6))
+            cells = [(int(rng.integers(shape[0])), int(rng.integers(shape[1]))) for _ in range(k)]
+            values = rng.random(k)>0.5
+            hpa.update(cells, values)
+            for (x, y), value in zip(cells, values):
+                grid[x, y] = value
+            assert np.array_equal(hpa.grid, grid)
+            assert abstraction(hpa)==abstraction(hpa_graph(grid, cluster_size))
+
+def test_update_only_rebuilds_touched_clusters(monkeypatch):
+    grid = np.ones((30, 30), dtype=bool)
+    hpa = hpa_graph(grid, 10)
+    rebuilt = []
+    build = hpa_graph._build_cluster
+    def counting(self, c):
+        rebuilt.append(c)
+        return build(self, c)
+    monkeypatch.setattr(hpa_graph, "_build_cluster", counting)
+    # 簇内部的格子, 不改变边界上的入口
+    hpa.update([(15, 15)], [False])
+    assert rebuilt==[4]
+    hpa.update([(15, 15)], [False])
+    assert rebuilt==[4]
+
+def test_abstract_paths_and_subgoals_are_valid():
+    rng = np.random.default_rng(1)
+    for _ in range(40):
+        shape = (int(rng.integers(10, 25)), int(rng.integers(10, 25)))
+        grid = rng.random(shape)>0.3
+        hpa = hpa_graph(grid, int(rng.integers(3, 8)))
+        free = [tuple(int(v) for v in c) for c in np.argwhere(grid)]
+        for _ in range(5):
+            start, end = free[rng.integers(len(free))], free[rng.integers(len(free))]
+            from_start = bfs(grid, start)
+            waypoints = hpa.abstract_path(start, end)
+            if from_start[end]<0:
+                assert waypoints is None and hpa.subgoal(start, end, 5) is None
+                continue
+            # 入口覆盖了每个开口, 可达的终点一定有抽象路径
+            assert waypoints is not None
+            if start==end:
+                assert waypoints==[] and hpa.subgoal(start, end, 5)==end
+                continue
+            assert waypoints[-1][:2]==end
+            assert waypoints[-1][2]>=from_start[end]
+            prev, prev_dist = start, 0
+            for x, y, dist in waypoints:
+                assert grid[x, y]
+                # 抽象路径上相邻两点之间的代价不小于真实距离
+                assert dist-prev_dist>=bfs(grid, prev)[x, y]>=0
+                prev, prev_dist = (x, y), dist
+            horizon = int(rng.integers(1, 15))
+            subgoal = hpa.subgoal(start, end, horizon)
+            assert subgoal in [w[:2] for w in waypoints]
+            dist = [w[2] for w in waypoints if w[:2]==subgoal][0]
+            assert subgoal==end or dist>=horizon
+            assert all(w[2]<horizon for w in waypoints[:[w[:2] for w in waypoints].index(subgoal)])
@@ -0,0 +1,58 @@
+import os
+from collections import deque
+import numpy as np
+
+from lib.utils import read_map
+from search.planner_utils import Astar, _jump_point_search
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def bfs_length(grid, start, end):
+    """
+    Number of cells of the shortest route, 0 if there is none. The start
+    cell itself does not need to be open, as in Astar.
+    """
+    m, n = grid.shape
+    dist = {start: 1}
+    q = deque([start])
+    while q:
+        x, y = q.popleft()
+        if (x, y)==end:
+            return dist[(x, y)]
+        for nx, ny in [(x+1,y), (x-1,y), (x,y+1), (x,y-1)]:
+            if 0<=nx<m and 0<=ny<n and grid[nx,ny] and (nx, ny) not in dist:
+                dist[(nx, ny)] = dist[(x, y)]+1
+                q.append((nx, ny))
+    return 0
+
+def assert_route(grid, route, start, end):
+    assert tuple(route[0])==start and tuple(route[-1])==end
+    for a, b in zip(route[:-1], route[1:]):
+        assert abs(a[0]-b[0])+abs(a[1]-b[1])==1
+        assert grid[tuple(b)]
+
+def test_jps_length_equals_bfs_on_random_grids():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        m, n = rng.integers(1, 25, 2)
+        grid = rng.random((m, n))<rng.choice([0.5, 0.7, 0.9, 1.0])
+        start = (int(rng.integers(m)), int(rng.integers(n)))
+        end = (int(rng.integers(m)), int(rng.integers(n)))
+        route, moves = _jump_point_search(grid, start, end)
+        assert len(route)==bfs_length(grid, start, end)
+        if len(route)>0:
+            assert_route(grid, route, start, end)
+            assert len(moves)==len(route)-1
+
+def test_astar_without_reservation_on_maps():
+    rng = np.random.default_rng(1)
+    for name in ["M3", "L0", "XL0"]:
+        _abs, _ = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+        grid = _abs>=0
+        cells = np.argwhere(grid)
+        for _ in range(50):
+            start, end = [tuple(int(v) for v in cells[k]) for k in rng.integers(len(cells), size=2)]
+            route, _ = Astar(grid, start, end)
+            assert len(route)==bfs_length(grid, start, end)
+            if len(route)>0:
+                assert_route(grid, route, start, end)
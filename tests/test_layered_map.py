@@ -0,0 +1,100 @@
+import os
+import random
+import numpy as np
+
+from lib.game_engine import game_engine, layered_map
+from lib.utils import read_map, parse_map, init_parcels
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_map(name, n_parcels):
+    np.random.seed(0)
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+    return parse_map(_abs, _players, init_parcels(_abs, n_parcels))
+
+def raises(error, f):
+    try:
+        f()
+    except error:
+        return True
+    return False
+
+def test_reads_match_dense():
+    dense = load_map("M3", 10)
+    _map = layered_map.from_array(dense)
+    assert _map.shape==dense.shape
+    assert np.array_equal(np.asarray(_map), dense)
+    assert _map.nbytes<dense.nbytes
+    x, y = np.argwhere(dense[:,:,1]>0)[0]
+    indices = [(x, y, 1), (x, y), (slice(None), slice(None), 0), (slice(1, 5), y, 2),
+               (x, slice(None), slice(0, 2)), (slice(2, 6), slice(3, 9)), (-1, -1, -1),
+               (dense[:,:,1]>0, 1), (dense[:,:,0]>0,), (dense[:,:,0]>0, slice(1, 3)), (np.array([0, x]), np.array([1, y]), 1)]
+    for index in indices:
+        assert np.array_equal(_map[index], dense[index]), index
+    assert isinstance(_map[x,y,1], int)
+    # 单层的切片是窄整数层的视图
+    assert np.shares_memory(_map[:,:,2], _map.layers[2])
+
+def test_single_layer_writes_through():
+    dense = load_map("M0", 0)
+    _map = layered_map.from_array(dense)
+    x, y = np.argwhere(dense[:,:,0]==0)[0]
+    _map[:,:,1][x,y] = 3
+    assert _map[x,y,1]==3
+    _map[x,y,2] = 7
+    assert _map.layers[2][x,y]==7
+    _map[:,:,1][_map[:,:,1]==3] = 0
+    assert np.sum(np.asarray(_map)[:,:,1])==0
+    _map[_map[:,:,0]==0, 1] = 5
+    assert np.all(_map[:,:,1][dense[:,:,0]==0]==5)
+    _map[_map[:,:,0]==0, 1] = 0
+    assert np.sum(np.asarray(_map)[:,:,1])==0
+
+def test_multi_layer_results_are_read_only():
+    _map = layered_map.from_array(load_map("M0", 5))
+    for index in [(0, 0), (slice(None), slice(None), slice(None)), (0, slice(None), slice(1, 3))]:
+        view = _map[index]
+        assert raises(ValueError, lambda: view.__setitem__(..., 1))
+
+def test_multi_layer_setitem():
+    dense = load_map("M0", 5)
+    _map = layered_map.from_array(dense)
+    x, y = np.argwhere(dense[:,:,0]==0)[0]
+    _map[x,y] = [0, 2, 4]
+    assert list(_map[x,y])==[0, 2, 4]
+    _map[x,y,1:] = 0
+    assert list(_map[x,y])==[0, 0, 0]
+    _map[0:2,0:2,1:3] = np.ones([2, 2, 2], dtype=int)
+    assert np.all(_map[0:2,0:2,1:3]==1)
+
+def test_unsupported_indices():
+    _map = layered_map.from_array(load_map("M0", 0))
+    for index in [(..., 1), (None, 0, 0), (0, 0, 0, 0), (np.ones([2, 2], dtype=bool), 0, 0), (0, 0, [0, 1]), (0, 0, np.array([1]))]:
+        assert raises(IndexError, lambda: _map[index]), index
+        assert raises(IndexError, lambda: _map.__setitem__(index, 0)), index
+
+def test_get_set_state():
+    np.random.seed(0)
+    random.seed(0)
+    dense = load_map("M3", 10)
+    ge = game_engine(np.copy(dense), 2)
+    policy = greedy_WHCA(ge, 10)
+    for _ in range(20):
+        ge.step(policy.pop_moves(ge)[1])
+    state = ge.get_state()
+    assert isinstance(state[0], layered_map)
+    saved = np.asarray(state[0])
+    for _ in range(20):
+        ge.step(policy.pop_moves(ge)[1])
+    # get_state 返回的是副本, 之后的步不改变它
+    assert np.array_equal(np.asarray(state[0]), saved)
+    ge.set_state(*state)
+    assert np.array_equal(np.asarray(ge._map), saved)
+    assert np.array_equal(ge.players, state[1])
+
+    # set_state 也接受旧的 (x,y,3) 数组
+    other = game_engine(np.copy(dense), 2)
+    other.set_state(saved, state[1])
+    assert np.array_equal(np.asarray(other._map), saved)
+    assert all(layer.dtype==ours.dtype for layer, ours in zip(other._map.layers, ge._map.layers))
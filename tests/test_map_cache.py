@@ -0,0 +1,179 @@
+import glob
+import os
+import shutil
+import numpy as np
+
+from lib.map_cache import compile_map, default_field_grid, default_cache_dir
+from lib.utils import read_map, read_trans_center_map, parse_map, init_parcels
+from search.planner_utils import distance_heuristic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPS = sorted(glob.glob(os.path.join(ROOT, "res", "maps", "*.txt")))
+TRANS_CENTER_MAP = os.path.join(ROOT, "res", "maps_trans_center", "L0.txt")
+
+# 向量化之前的逐格实现, 作为参照
+def read_lines(file_path, convert):
+    data = []
+    with open(file_path, 'r') as f:
+        for line in f:
+            if len(line.strip())>0:
+                data.append([convert(x) for x in line.strip().split(",")])
+            else:
+                data.append([])
+    return np.array(data[:data.index([])], dtype=int), np.array(data[data.index([])+1:], dtype=int)
+
+def loop_parse_map(_abs, _players, _parcels=None):
+    _map = np.copy(-_abs)
+    _pid = np.copy(_players)
+    shelf_id = 1
+    player_id = 1
+    if _parcels is None:
+        _parcels = np.zeros(_map.shape)
+    for i in range(_map.shape[0]):
+        for j in range(_map.shape[1]):
+            if _map[i,j]==-3:
+                _map[i,j] = shelf_id
+                shelf_id+=1
+            if _pid[i,j]==1:
+                _pid[i,j] = player_id
+                player_id+=1
+    return np.transpose(np.array([_map, _parcels, _pid]), [1,2,0]).astype(int)
+
+def loop_read_trans_center_map(file_path, spawn_marks):
+    marks = "*0123456789abcdefghijklmnopqrstuvwxyz"
+    _abs, _players = read_lines(file_path, lambda x: marks.index(x)-1)
+    for i in range(_abs.shape[0]):
+        for j in range(_abs.shape[1]):
+            if _abs[i,j]==-1:
+                _abs[i,j]=1
+            elif _abs[i,j]>0:
+                _abs[i,j] = 2 if _abs[i,j] in spawn_marks else 3
+    return _abs, _players
+
+def test_parse_map_matches_loop():
+    for path in MAPS:
+        _abs, _players = read_map(path)
+        ref_abs, ref_players = read_lines(path, int)
+        assert np.array_equal(_abs, ref_abs) and np.array_equal(_players, ref_players)
+        np.random.seed(0)
+        _parcels = init_parcels(_abs, 5)
+        assert np.array_equal(parse_map(_abs, _players), loop_parse_map(_abs, _players))
+        assert np.array_equal(parse_map(_abs, _players, _parcels), loop_parse_map(_abs, _players, _parcels))
+
+def test_trans_center_map_matches_loop():
+    for spawn_marks in [[1, 2, 3], [5], []]:
+        _abs, _players = read_trans_center_map(TRANS_CENTER_MAP, spawn_marks)
+        ref_abs, ref_players = loop_read_trans_center_map(TRANS_CENTER_MAP, spawn_marks)
+        assert np.array_equal(_abs, ref_abs)
+        assert np.array_equal(_players, ref_players)
+
+def test_read_map_without_deprecation_warnings():
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for path in MAPS:
+            read_map(path)
+
+def test_ragged_map_rows(tmp_path):
+    path = str(tmp_path/"ragged.txt")
+    with open(path, "w") as f:
+        f.write("0,0,0\n0,0\n\n0,0,0\n0,0,0\n")
+    try:
+        read_map(path)
+        assert False, "no ValueError on rows of different lengths"
+    except ValueError:
+        pass
+
+def test_default_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("MAP_CACHE_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path/"xdg"))
+    assert default_cache_dir()==str(tmp_path/"xdg"/"grid-map-path-finding"/"maps")
+    monkeypatch.setenv("MAP_CACHE_DIR", str(tmp_path/"maps"))
+    assert default_cache_dir()==str(tmp_path/"maps")
+    # 默认不在地图所在的文件夹内写缓存
+    folder = tmp_path/"res"
+    folder.mkdir()
+    path = str(folder/"M0.txt")
+    shutil.copy(MAPS[0], path)
+    compile_map(path)
+    assert os.listdir(str(folder))==["M0.txt"]
+    assert len(os.listdir(str(tmp_path/"maps")))==1
+
+def test_unknown_mark(tmp_path):
+    path = str(tmp_path/"bad.txt")
+    with open(path, "w") as f:
+        f.write("0,0,?\n0,0,0\n\n0,0,0\n0,0,0\n")
+    try:
+        read_trans_center_map(path, [])
+        assert False, "no ValueError on an unknown mark"
+    except ValueError:
+        pass
+
+def test_compile_map_cache(tmp_path):
+    path = os.path.join(ROOT, "res", "maps", "M3.txt")
+    cache_dir = str(tmp_path/"cache")
+    built = compile_map(path, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir))==1
+    cached = compile_map(path, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir))==1
+    _abs, _players = read_map(path)
+    assert np.array_equal(built._map, parse_map(_abs, _players))
+    for key in built.KEYS:
+        assert np.array_equal(getattr(built, key), getattr(cached, key))
+    for i, (x, y) in enumerate(built.shelf_coords):
+        assert built._map[x,y,0]==i+1
+    for i, (x, y) in enumerate(built.home_coords):
+        assert built._map[x,y,2]==i+1
+    np.random.seed(0)
+    _parcels = init_parcels(_abs, 5)
+    assert np.array_equal(cached.parse(_parcels), parse_map(_abs, _players, _parcels))
+
+    # 地图内容改变后重新编译
+    edited = str(tmp_path/"M3.txt")
+    shutil.copy(path, edited)
+    compile_map(edited, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir))==1
+    with open(edited, "a") as f:
+        f.write("\n")
+    compile_map(edited, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir))==2
+
+def test_compile_trans_center_map(tmp_path):
+    compiled = compile_map(TRANS_CENTER_MAP, spawn_marks=[1, 2], cache_dir=str(tmp_path))
+    _abs, _players = read_trans_center_map(TRANS_CENTER_MAP, [1, 2])
+    assert np.array_equal(compiled._abs, _abs)
+    assert np.array_equal(compiled._map, parse_map(_abs, _players))
+
+def test_distance_fields(tmp_path):
+    path = os.path.join(ROOT, "res", "maps", "M0.txt")
+    cache_dir = str(tmp_path)
+    compiled = compile_map(path, distance_fields=True, cache_dir=cache_dir)
+    assert np.array_equal(compiled.field_grid, default_field_grid(compiled._map))
+    heuristic = distance_heuristic(compiled.field_grid, max_goals=0)
+    for i, end in enumerate(compiled.shelf_coords):
+        assert np.array_equal(compiled.fields[i], heuristic.field(tuple(end)))
+    cached = compile_map(path, distance_fields=True, cache_dir=cache_dir)
+    assert np.array_equal(cached.fields, compiled.fields)
+
+    # 另一个掩码的距离场单独缓存
+    grid = np.copy(compiled.field_grid)
+    x, y = np.argwhere(grid)[0]
+    grid[x,y] = False
+    other = compile_map(path, distance_fields=True, cache_dir=cache_dir, field_grid=grid)
+    assert np.array_equal(other.field_grid, grid)
+    assert len(os.listdir(cache_dir))==2
+    heuristic = distance_heuristic(grid, max_goals=0)
+    for i, end in enumerate(other.shelf_coords):
+        assert np.array_equal(other.fields[i], heuristic.field(tuple(end)))
+
+def test_preload_rejects_other_grid(tmp_path):
+    compiled = compile_map(os.path.join(ROOT, "res", "maps", "M0.txt"), distance_fields=True, cache_dir=str(tmp_path))
+    heuristic = distance_heuristic(compiled.field_grid)
+    assert heuristic.preload(compiled.shelf_coords, compiled.fields, compiled.field_grid)
+    grid = np.copy(compiled.field_grid)
+    x, y = np.argwhere(grid)[0]
+    grid[x,y] = False
+    heuristic = distance_heuristic(grid)
+    assert not heuristic.preload(compiled.shelf_coords, compiled.fields, compiled.field_grid)
+    end = tuple(compiled.shelf_coords[0])
+    assert np.array_equal(heuristic.field(end), distance_heuristic(grid, max_goals=0).field(end))
@@ -0,0 +1,40 @@
+import os
+import random
+import numpy as np
+
+from lib.game_engine import game_engine
+from lib.utils import read_map, parse_map, init_parcels
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(name, steps, **kwargs):
+    np.random.seed(0)
+    random.seed(0)
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+    ge = game_engine(parse_map(_abs, _players, init_parcels(_abs, 3)), 2)
+    policy = greedy_WHCA(ge, 10, **kwargs)
+    trace = []
+    try:
+        for _ in range(steps):
+            _, moves = policy.pop_moves(ge)
+            trace.append([tuple(int(v) for v in m) for m in moves])
+            ge.step(moves)
+        used_pool = policy.pool is not None
+    finally:
+        policy.close()
+    return trace, ge.get_score(), used_pool
+
+def test_pool_matches_sequential_moves():
+    for name, kwargs in [("M0", {}), ("M3", {"low_level": "sipp"})]:
+        sequential = run(name, 40, n_workers=1, **kwargs)
+        # 小地图上强制使用进程池
+        pooled = run(name, 40, n_workers=2, parallel_min_searches=2, **kwargs)
+        assert pooled[2] and not sequential[2]
+        assert pooled[:2]==sequential[:2]
+
+def test_small_ticks_stay_sequential():
+    # M0 每一步的搜索远少于默认阈值, 不启动进程池
+    trace, score, used_pool = run("M0", 20, n_workers=2)
+    assert not used_pool
+    assert (trace, score)==run("M0", 20, n_workers=1)[:2]
@@ -0,0 +1,129 @@
+import os
+import pickle
+import numpy as np
+
+from lib.game_card import game_card, convert_card, CARD_VERSION
+from lib.parcel_events import parcel_events, as_parcel_events
+from lib.utils import read_map
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def random_seq(n_steps, have_dl, seed):
+    rng = np.random.RandomState(seed)
+    seq = []
+    for _ in range(n_steps):
+        gens = []
+        for _ in range(rng.randint(3)):
+            gen = [int(rng.randint(20)), int(rng.randint(20)), int(rng.randint(1, 9))]
+            if have_dl:
+                gen.append(int(rng.randint(10, 50)))
+            gens.append(tuple(gen))
+        seq.append(gens)
+    return seq
+
+def test_round_trip():
+    for have_dl in [False, True]:
+        for seed in range(5):
+            seq = random_seq(50, have_dl, seed)
+            events = parcel_events.from_seq(seq, have_dl)
+            assert len(events)==len(seq)
+            assert events.to_seq()==seq
+            assert as_parcel_events(events, have_dl) is events
+            assert as_parcel_events(None, have_dl) is None
+    assert parcel_events.from_seq([[], []], False).to_seq()==[[], []]
+
+def test_past_horizon():
+    events = parcel_events.from_seq(random_seq(10, True, 0), True)
+    for step in [-1, 10, 100]:
+        assert len(events.at(step))==0
+        try:
+            events[step]
+            assert False, "no IndexError at step %d" % step
+        except IndexError:
+            pass
+
+def test_save_load_mmap(tmp_path):
+    seq = random_seq(30, True, 1)
+    root = str(tmp_path)+"/"
+    parcel_events.from_seq(seq, True).save(root)
+    for mmap in [True, False]:
+        loaded = parcel_events.load(root, True, mmap=mmap)
+        assert isinstance(loaded.events, np.memmap)==mmap
+        assert loaded.to_seq()==seq
+    # 重新保存内存映射的数组不应破坏文件
+    loaded = parcel_events.load(root, True)
+    loaded.save(root)
+    assert parcel_events.load(root, True).to_seq()==seq
+
+def make_card(have_dl, parcel_gen_gap=2):
+    np.random.seed(0)
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", "M0.txt"))
+    return game_card([_abs, _players, parcel_gen_gap, 5, 100, have_dl])
+
+def test_card_save_load(tmp_path):
+    for have_dl in [False, True]:
+        card = make_card(have_dl)
+        folder = str(tmp_path/("card%d" % have_dl))
+        card.save(folder)
+        loaded = game_card(folder)
+        assert loaded.version==CARD_VERSION
+        assert np.array_equal(loaded._map, card._map)
+        assert loaded.parcel_gen_seq.to_seq()==card.parcel_gen_seq.to_seq()
+        if have_dl:
+            assert np.array_equal(loaded.step_left, card.step_left)
+
+def save_v0(card, folder):
+    # 旧版本的卡片: basic_info 只有三项, parcel_gen_seq 以 pickle 保存
+    root = folder+"/"
+    os.mkdir(root)
+    np.save(root+"basic_info", np.array([card.max_step, card.parcel_gen_gap, card.have_dl]))
+    np.save(root+"_map", card._map)
+    if card.have_dl: np.save(root+"step_left", card.step_left)
+    seq = None if card.parcel_gen_seq is None else card.parcel_gen_seq.to_seq()
+    with open(root+"parcel_gen_seq.pickle", "wb") as handle:
+        pickle.dump(seq, handle)
+    return seq
+
+def test_convert_card(tmp_path):
+    for have_dl in [False, True]:
+        card = make_card(have_dl)
+        folder = str(tmp_path/("card%d" % have_dl))
+        seq = save_v0(card, folder)
+        assert game_card(folder).version==0
+        assert game_card(folder).parcel_gen_seq.to_seq()==seq
+        converted = convert_card(folder)
+        assert converted.version==CARD_VERSION
+        assert not os.path.exists(folder+"/parcel_gen_seq.pickle")
+        loaded = game_card(folder)
+        assert loaded.version==CARD_VERSION
+        assert loaded.parcel_gen_seq.to_seq()==seq
+        # 已经是新版本的卡片原样返回
+        assert convert_card(folder).version==CARD_VERSION
+
+def test_engine_from_converted_card(tmp_path):
+    card = make_card(True)
+    folder = str(tmp_path/"card")
+    save_v0(card, folder)
+    _, ge_old = game_card(folder).output_engine()
+    convert_card(folder)
+    _, ge_new = game_card(folder).output_engine()
+    n_players = len(ge_old.players)
+    for _ in range(50):
+        ge_old.step([[0,0,0]]*n_players)
+        ge_new.step([[0,0,0]]*n_players)
+        assert np.array_equal(np.asarray(ge_old._map), np.asarray(ge_new._map))
+    assert np.sum(ge_new.parcel_map>0)>np.sum(card._map[:,:,1]>0)
+
+def test_convert_card_mismatch_raises(tmp_path, monkeypatch):
+    card = make_card(False)
+    folder = str(tmp_path/"card")
+    save_v0(card, folder)
+    to_seq = parcel_events.to_seq
+    # 模拟写回后读出的包裹序列与原来不同
+    monkeypatch.setattr(parcel_events, "to_seq", lambda self: to_seq(self)[1:])
+    try:
+        convert_card(folder)
+        assert False, "no ValueError on a mismatching conversion"
+    except ValueError:
+        pass
+    assert os.path.exists(folder+"/parcel_gen_seq.pickle")
@@ -0,0 +1,110 @@
+import json
+import heapq
+import numpy as np
+
+from search import planner_profile, planner_utils
+from search.planner_profile import PROFILER
+from search.planner_utils import Astar, SIPP, focal_Astar, focal_queue
+from test_sipp import random_query
+
+def counting_heap(monkeypatch):
+    counts = {"push": 0, "pop": 0}
+    def push(heap, item):
+        counts["push"] += 1
+        heapq.heappush(heap, item)
+    def pop(heap):
+        counts["pop"] += 1
+        return heapq.heappop(heap)
+    monkeypatch.setattr(planner_utils, "heappush", push)
+    monkeypatch.setattr(planner_utils, "heappop", pop)
+    return counts
+
+def test_search_counters_match_heap_operations(monkeypatch):
+    counts = counting_heap(monkeypatch)
+    rng = np.random.default_rng(0)
+    planner_profile.enable()
+    try:
+        for _ in range(30):
+            grid, start, end, table = random_query(rng)
+            for search, reservation in [(Astar, None), (Astar, table), (SIPP, table)]:
+                counts["push"] = counts["pop"] = 0
+                pushed, popped = PROFILER.pushed, PROFILER.popped
+                search(grid, start, end, reservation=reservation)
+                assert PROFILER.pushed-pushed==counts["push"]
+                assert PROFILER.popped-popped==counts["pop"]
+    finally:
+        planner_profile.disable()
+    summary = PROFILER.summary()["searches"]
+    assert summary["astar"]["calls"]==60 and summary["sipp"]["calls"]==30
+    assert summary["astar"]["expanded"]>0
+
+def test_focal_search_does_not_count_queue_internals(monkeypatch):
+    n_pops = [0]
+    pop = focal_queue.pop
+    def counting(self):
+        n_pops[0] += 1
+        return pop(self)
+    monkeypatch.setattr(focal_queue, "pop", counting)
+    rng = np.random.default_rng(1)
+    planner_profile.enable()
+    try:
+        for _ in range(20):
+            grid, start, end, _ = random_query(rng)
+            n_pops[0] = 0
+            popped = PROFILER.popped
+            focal_Astar(grid, start, end, 1.5)
+            # focal_queue 内部的三个堆不计入, 只计展开的状态
+            assert PROFILER.popped-popped==n_pops[0]
+    finally:
+        planner_profile.disable()
+
+def test_disabled_profiler_is_untouched():
+    planner_profile.enable()
+    planner_profile.disable()
+    grid, start, end, table = random_query(np.random.default_rng(2))
+    Astar(grid, start, end, reservation=table)
+    with PROFILER.phase("idle"):
+        pass
+    assert PROFILER.pushed==0 and PROFILER.popped==0
+    assert PROFILER.summary()=={"phases": {}, "searches": {}, "counters": {}, "dropped_events": 0}
+    assert planner_utils.heappush is heapq.heappush
+
+def test_json_and_trace_export(tmp_path):
+    planner_profile.enable()
+    try:
+        with PROFILER.phase("outer"):
+            grid, start, end, table = random_query(np.random.default_rng(3))
+            SIPP(grid, start, end, reservation=table)
+        PROFILER.count("replans", 3)
+        PROFILER.count("replans", 3)
+        PROFILER.count("repairs")
+    finally:
+        planner_profile.disable()
+    PROFILER.save_json(str(tmp_path/"profile.json"))
+    PROFILER.save_chrome_trace(str(tmp_path/"trace.json"))
+    with open(tmp_path/"profile.json") as f:
+        summary = json.load(f)
+    assert summary["phases"]["outer"]["count"]==1
+    assert summary["searches"]["sipp"]["calls"]==1
+    assert summary["counters"]=={"replans": {"3": 2}, "repairs": 1}
+    with open(tmp_path/"trace.json") as f:
+        trace = json.load(f)
+    names = [e["name"] for e in trace["traceEvents"]]
+    assert sorted(names)==["outer", "sipp"]
+    outer, search = sorted(trace["traceEvents"], key=lambda e: e["name"])
+    # 搜索在阶段之内
+    assert outer["ts"]<=search["ts"] and search["ts"]+search["dur"]<=outer["ts"]+outer["dur"]
+    assert set(search["args"])=={"pushed", "expanded", "found"}
+
+def test_dropped_events_are_still_aggregated():
+    PROFILER.max_events, max_events = 2, PROFILER.max_events
+    planner_profile.enable()
+    try:
+        for _ in range(5):
+            with PROFILER.phase("tick"):
+                pass
+    finally:
+        planner_profile.disable()
+        PROFILER.max_events = max_events
+    assert len(PROFILER.events)==2 and PROFILER.n_dropped==3
+    assert PROFILER.summary()["phases"]["tick"]["count"]==5
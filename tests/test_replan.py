@@ -0,0 +1,47 @@
+import os
+import random
+import numpy as np
+
+from lib.game_engine import game_engine
+from lib.utils import read_map, parse_map, init_parcels
+from search import planner_CA
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(name, steps, seed, **kwargs):
+    np.random.seed(seed)
+    random.seed(seed)
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+    ge = game_engine(parse_map(_abs, _players, init_parcels(_abs, 3)), 2)
+    policy = greedy_WHCA(ge, 10, **kwargs)
+    trace = []
+    for _ in range(steps):
+        _, moves = policy.pop_moves(ge)
+        trace.append([tuple(int(v) for v in m) for m in moves])
+        ge.step(moves)
+    return trace, ge.get_score()
+
+def test_keep_parked_matches_full(monkeypatch):
+    n_searches = [0]
+    search = planner_CA.route_planner.search
+    def counting(self, *args):
+        n_searches[0] += 1
+        return search(self, *args)
+    monkeypatch.setattr(planner_CA.route_planner, "search", counting)
+    for name, low_level in [("M0", "astar"), ("M3", "astar"), ("M3", "sipp")]:
+        n_searches[0] = 0
+        full = run(name, 150, 0, low_level=low_level, replan="full")
+        n_full = n_searches[0]
+        n_searches[0] = 0
+        kept = run(name, 150, 0, low_level=low_level, replan="keep_parked")
+        assert kept==full
+        # 停车的AGV不再重新搜索
+        assert n_searches[0]<n_full
+
+def test_unknown_replan_mode():
+    try:
+        run("M0", 1, 0, replan="incremental")
+        assert False, "no ValueError on an unknown replan mode"
+    except ValueError:
+        pass
@@ -0,0 +1,94 @@
+import numpy as np
+
+from search.planner_reservation import reservation_table
+
+class shifting_table:
+    """
+    The (m, n, window) array the planners used before the ring buffer,
+    copied one step to the left on every advance.
+    """
+    def __init__(self, shape, window):
+        self.data = np.zeros(tuple(shape)+(window,), dtype=int)
+        self.now = 0
+
+    def reserve(self, route, agent_id):
+        for t in range(min(len(route), self.data.shape[2])):
+            self.data[route[t][0], route[t][1], t] = agent_id
+        return self.now
+
+    def release(self, route, agent_id, start):
+        for j in range(len(route)):
+            t = start+j-self.now
+            if 0<=t<self.data.shape[2] and self.data[route[j][0], route[j][1], t]==agent_id:
+                self.data[route[j][0], route[j][1], t] = 0
+
+    def advance(self):
+        self.data[:,:,:-1] = self.data[:,:,1:]
+        self.data[:,:,-1] = 0
+        self.now += 1
+
+def random_route(rng, shape, length):
+    route = [(int(rng.integers(shape[0])), int(rng.integers(shape[1])))]
+    for _ in range(length-1):
+        x, y = route[-1]
+        dx, dy = [(0,1), (1,0), (0,-1), (-1,0), (0,0)][rng.integers(5)]
+        route.append((min(max(x+dx, 0), shape[0]-1), min(max(y+dy, 0), shape[1]-1)))
+    return route
+
+def test_ring_buffer_matches_shifting_array():
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        shape = (int(rng.integers(2, 7)), int(rng.integers(2, 7)))
+        window = int(rng.integers(1, 8))
+        table, ref = reservation_table(shape, window), shifting_table(shape, window)
+        held = []
+        for agent in range(1, 60):
+            op = rng.integers(3)
+            if op==0:
+                route = random_route(rng, shape, int(rng.integers(1, window+3)))
+                start = table.reserve(route, agent)
+                assert ref.reserve(route, agent)==start
+                held.append((route, agent, start))
+            elif op==1 and len(held)>0:
+                route, agent_id, start = held.pop(rng.integers(len(held)))
+                table.release(route, agent_id, start)
+                ref.release(route, agent_id, start)
+            else:
+                table.advance()
+                ref.advance()
+            assert table.now==ref.now
+            assert np.array_equal(table.to_array(), ref.data)
+            n = shape[1]
+            for x in range(shape[0]):
+                for y in range(shape[1]):
+                    for t in range(window+1):
+                        expected = ref.data[x, y, t] if t<window else 0
+                        assert table.agent_at(x, y, t)==expected
+                        assert table.is_reserved(x*n+y, t)==(expected>0)
+                        blocked = t+1<window and ref.data[x, y, t]+ref.data[x, y, t+1]>0
+                        assert table.is_blocked(x*n+y, t)==blocked
+
+def test_advance_only_clears_the_expired_slice():
+    table = reservation_table((4, 4), 3)
+    table.reserve([(0, 0), (0, 1), (0, 2)], 1)
+    table.reserve_cell(3, 3, 2, 2)
+    table.advance()
+    assert table.agent_at(0, 0, 0)==0 and table.agent_at(0, 1, 0)==1 and table.agent_at(0, 2, 1)==1
+    assert table.agent_at(3, 3, 1)==2
+    # 回收的切片成为新的最后一步, 且已被清空
+    assert not np.any(table.to_array()[:,:,2])
+    table.reserve_cell(1, 1, 2, 3)
+    for _ in range(3):
+        table.advance()
+    assert not np.any(table.to_array())
+    assert all(len(touched)==0 for touched in table._touched)
+
+def test_release_after_advance_keeps_other_agents():
+    table = reservation_table((3, 3), 4)
+    start = table.reserve([(0, 0), (0, 1), (1, 1), (2, 1)], 1)
+    table.advance()
+    # 另一个AGV覆盖了 1 在 t=1 的占用
+    table.reserve_cell(1, 1, 1, 2)
+    table.release([(0, 0), (0, 1), (1, 1), (2, 1)], 1, start)
+    assert table.agent_at(1, 1, 1)==2
+    assert table.agent_at(0, 1, 0)==0 and table.agent_at(2, 1, 2)==0
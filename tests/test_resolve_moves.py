@@ -0,0 +1,145 @@
+import numpy as np
+
+from lib.game_engine import game_engine
+
+UP, DOWN, LEFT, RIGHT, STAY = (-1,0,0), (1,0,0), (0,-1,0), (0,1,0), (0,0,0)
+
+def engine(shape, players, parcels=(), walls=()):
+    """
+    players: [(x, y), ...] numbered 1..n in this order, parcels: [(x, y, shelf), ...]
+    """
+    _map = np.zeros(shape+(3,), dtype=int)
+    # 货架放在右下角, 编号与包裹对应
+    for k in range(max([p[2] for p in parcels], default=0)):
+        _map[shape[0]-1, shape[1]-1-k, 0] = k+1
+    for x, y in walls:
+        _map[x, y, 0] = -1
+    for x, y, shelf in parcels:
+        _map[x, y, 1] = shelf
+    ge = game_engine(_map, 0)
+    # 按给定顺序编号
+    ge.player_map[:] = 0
+    for i, (x, y) in enumerate(players):
+        ge.player_map[x, y] = i+1
+    ge.players = np.zeros([len(players), 3], dtype=np.int32)
+    ge.players[:,:2] = players
+    ge._build_player_index()
+    return ge
+
+def positions(ge):
+    return [tuple(p) for p in ge.players[:,:2].tolist()]
+
+def test_rotating_cycle_moves():
+    # 2x2 方块内四个AGV顺时针旋转
+    ge = engine((4, 4), [(1,1), (1,2), (2,2), (2,1)])
+    ge.step([RIGHT, DOWN, LEFT, UP])
+    assert positions(ge)==[(1,2), (2,2), (2,1), (1,1)]
+    assert np.array_equal(np.argwhere(ge.player_map>0).tolist(), sorted(positions(ge)))
+
+def test_swap_is_blocked():
+    ge = engine((3, 4), [(1,1), (1,2), (0,0)])
+    ge.step([RIGHT, LEFT, DOWN])
+    assert positions(ge)==[(1,1), (1,2), (1,0)]
+
+def test_chain_moves_into_free_cell():
+    ge = engine((3, 6), [(1,1), (1,2), (1,3)])
+    ge.step([RIGHT, RIGHT, RIGHT])
+    assert positions(ge)==[(1,2), (1,3), (1,4)]
+
+def test_chain_behind_blocked_head_stays():
+    ge = engine((3, 5), [(1,1), (1,2), (1,3)], walls=[(1,4)])
+    ge.step([RIGHT, RIGHT, RIGHT])
+    assert positions(ge)==[(1,1), (1,2), (1,3)]
+    # 链头撞到静止的AGV
+    ge = engine((3, 6), [(1,1), (1,2), (1,3), (1,4)])
+    ge.step([RIGHT, RIGHT, RIGHT, STAY])
+    assert positions(ge)==[(1,1), (1,2), (1,3), (1,4)]
+
+def test_chain_contesting_a_cycle_cell():
+    # 链头 4 与环上的 3 争夺 (1,1): 3 赢则环整体旋转, 4 赢则环断开, 所有AGV都不动
+    start = [(1,1), (1,2), (2,2), (2,1), (1,0)]
+    outcomes = set()
+    for seed in range(20):
+        np.random.seed(seed)
+        ge = engine((4, 5), start)
+        ge.step([RIGHT, DOWN, LEFT, UP, RIGHT])
+        pos = positions(ge)
+        assert pos in [[(1,2), (2,2), (2,1), (1,1), (1,0)], start]
+        outcomes.add(pos==start)
+    assert outcomes=={True, False}
+
+def test_contested_cell_goes_to_one_player():
+    winners = set()
+    for seed in range(20):
+        np.random.seed(seed)
+        # 0 和 1 争夺 (1,2), 2 跟在 1 的后面
+        ge = engine((3, 6), [(0,2), (1,1), (1,0)])
+        ge.step([DOWN, RIGHT, RIGHT])
+        pos = positions(ge)
+        if pos[0]==(1,2):
+            winners.add(0)
+            assert pos[1:]==[(1,1), (1,0)]
+        else:
+            winners.add(1)
+            assert pos==[(0,2), (1,2), (1,1)]
+    assert winners=={0, 1}
+
+def test_loaded_agv_cannot_follow_onto_floor_parcel():
+    # 0 空载站在地上的包裹1上, 1 带着包裹2跟在后面
+    ge = engine((3, 6), [(1,2), (1,1)], parcels=[(1,2,1), (1,1,2)])
+    ge.step([STAY, (0,0,1)])
+    assert ge.players[:,2].tolist()==[0, 2]
+    ge.step([RIGHT, RIGHT])
+    assert positions(ge)==[(1,3), (1,1)]
+    assert ge.parcel_map[1,2]==1 and ge.parcel_map[1,1]==2
+    assert ge.n_parcels==2
+
+def test_loaded_agv_follows_loaded_agv():
+    ge = engine((3, 6), [(1,2), (1,1)], parcels=[(1,2,1), (1,1,2)])
+    ge.step([(0,0,1), (0,0,1)])
+    ge.step([RIGHT, RIGHT])
+    assert positions(ge)==[(1,3), (1,2)]
+    assert ge.parcel_map[1,3]==1 and ge.parcel_map[1,2]==2 and ge.parcel_map[1,1]==0
+    assert ge.parcel_coords[:2].tolist()==[[1,3], [1,2]]
+
+def test_grab_is_skipped_when_the_move_fails():
+    ge = engine((3, 4), [(1,0)], parcels=[(1,0,1)], walls=[(1,1)])
+    ge.step([(0,1,1)])
+    assert ge.players[0].tolist()==[1, 0, 0]
+
+def test_random_moves_keep_invariants():
+    rng = np.random.RandomState(0)
+    for seed in range(30):
+        np.random.seed(seed)
+        shape = (6, 6)
+        # 最后一行是货架
+        cells = [(x, y) for x in range(shape[0]-1) for y in range(shape[1])]
+        chosen = rng.choice(len(cells), 13, replace=False)
+        players = [cells[k] for k in chosen[:10]]
+        parcels = [cells[k]+(i+1,) for i, k in enumerate(chosen[7:13])]
+        ge = engine(shape, players, parcels=parcels)
+        for _ in range(20):
+            before = ge.players.copy()
+            floor = {tuple(c) for c in np.argwhere(ge.parcel_map>0).tolist()} - \
+                    {tuple(p[:2]) for p in before.tolist() if p[2]>0}
+            moves = [tuple(m)+(int(rng.randint(5)==0),) for m in [UP[:2], DOWN[:2], LEFT[:2], RIGHT[:2], STAY[:2]]]
+            moves = [moves[k] for k in rng.randint(5, size=len(players))]
+            ge.step(moves)
+            after = ge.players
+            pos = positions(ge)
+            assert len(set(pos))==len(pos)
+            assert sorted(pos)==sorted(tuple(c) for c in np.argwhere(ge.player_map>0).tolist())
+            for i in range(len(pos)):
+                assert pos[i] in [tuple(before[i,:2]), tuple(before[i,:2]+np.array(moves[i][:2]))]
+                # 带货的AGV不能进入地上有包裹的格子
+                if before[i,2]>0 and pos[i]!=tuple(before[i,:2]):
+                    assert pos[i] not in floor
+                for j in range(len(pos)):
+                    if i!=j and pos[i]!=tuple(before[i,:2]):
+                        assert not (pos[i]==tuple(before[j,:2]) and pos[j]==tuple(before[i,:2]))
+            # 包裹不会凭空消失或被覆盖
+            carried = [p for p in after[:,2].tolist() if p>0]
+            assert len(set(carried))==len(carried)
+            assert ge.n_parcels==int(np.sum(ge.parcel_map>0))
+            for p in carried:
+                assert tuple(ge.parcel_coords[p-1])==pos[after[:,2].tolist().index(p)]
@@ -0,0 +1,92 @@
+import numpy as np
+
+from search import planner_CBS
+from search.planner_CBS import build_moving_plan, cost
+from search.planner_reservation import build_reservation_table
+from search.planner_utils import Astar, SIPP
+from test_ecbs import puzzle, assert_conflict_free
+
+def random_query(rng):
+    m, n = rng.integers(5, 12, 2)
+    grid = rng.random((m, n))>0.25
+    free = np.argwhere(grid)
+    start, end = free[rng.choice(len(free), 2, replace=False)]
+    window = int(rng.integers(3, 12))
+    table = build_reservation_table((m, n), window, 4)
+    # 其他AGV的随机游走占用
+    for agent in range(1, 4):
+        route = [tuple(free[rng.integers(len(free))])]
+        for _ in range(window-1):
+            x, y = route[-1]
+            steps = [(x+dx, y+dy) for dx, dy in [(0,1),(1,0),(0,-1),(-1,0),(0,0)]]
+            steps = [p for p in steps if 0<=p[0]<m and 0<=p[1]<n and grid[p]]
+            route.append(steps[rng.integers(len(steps))])
+        table.reserve(route, agent)
+    return grid, (int(start[0]), int(start[1])), (int(end[0]), int(end[1])), table
+
+def assert_valid(grid, route, start, end, table):
+    n = grid.shape[1]
+    assert tuple(route[0])==start and tuple(route[-1])==end
+    for t in range(len(route)-1):
+        a, b = tuple(route[t]), tuple(route[t+1])
+        assert abs(a[0]-b[0])+abs(a[1]-b[1])<=1
+        assert grid[b]
+        cell = b[0]*n+b[1]
+        if a!=b:
+            assert not table.is_blocked(cell, t)
+        else:
+            assert not table.is_reserved(cell, t+1)
+
+def test_sipp_routes_valid_and_not_longer_than_astar():
+    rng = np.random.default_rng(0)
+    for _ in range(1000):
+        grid, start, end, table = random_query(rng)
+        route, moves = SIPP(grid, start, end, reservation=table)
+        astar_route, _ = Astar(grid, start, end, reservation=table)
+        if len(astar_route)>0:
+            assert len(route)>0 and len(route)<=len(astar_route)
+        if len(route)>0:
+            assert_valid(grid, route, start, end, table)
+            assert len(moves)==len(route)-1
+
+def test_sipp_stay_ends_in_open_interval():
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        grid, start, end, table = random_query(rng)
+        route, _ = SIPP(grid, start, end, reservation=table, stay=True)
+        if len(route)==0: continue
+        assert_valid(grid, route, start, end, table)
+        cell = end[0]*grid.shape[1]+end[1]
+        for t in range(len(route)-1, table.window):
+            assert not table.is_reserved(cell, t)
+
+def test_sipp_without_reservation_is_shortest():
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        grid, start, end, _ = random_query(rng)
+        route, _ = SIPP(grid, start, end)
+        astar_route, _ = Astar(grid, start, end)
+        assert len(route)==len(astar_route)
+
+def test_cbs_replans_with_sipp(monkeypatch):
+    calls = []
+    def spy(*args, **kwargs):
+        calls.append(args[1:3])
+        return SIPP(*args, **kwargs)
+    monkeypatch.setattr(planner_CBS, "SIPP", spy)
+    for seed in range(8):
+        for shape, num in [((8,8), 4), ((10,10), 6)]:
+            grid, startings, endings = puzzle(seed, shape, num)
+            n_calls = len(calls)
+            solution = build_moving_plan(grid, startings, endings, low_level="sipp")
+            assert solution is not None
+            assert_conflict_free(solution)
+            for route, start, end in zip(solution, startings, endings):
+                assert route[0]==start and route[-1]==end
+            reference = build_moving_plan(grid, startings, endings)
+            # 只有存在冲突时才会带约束重新规划
+            if len(calls)==n_calls:
+                assert cost(solution)==cost(reference)
+            else:
+                assert cost(solution)<=cost(reference)
+    assert len(calls)>0
@@ -0,0 +1,91 @@
+import numpy as np
+
+from search.planner_reservation import reservation_table, sparse_reservation_table, build_reservation_table, SPARSE_DENSITY
+
+STEPS = [(0,1), (1,0), (0,-1), (-1,0), (0,0)]
+
+def random_route(rng, table, shape, length):
+    """
+    A random walk that neither meets nor swaps with the routes already in
+    table, as the routes of the planners do. It stops where it gets stuck.
+    """
+    m, n = shape
+    free = [(x, y) for x in range(m) for y in range(n) if not table.is_reserved(x*n+y, 0)]
+    if len(free)==0:
+        return []
+    route = [free[rng.integers(len(free))]]
+    for t in range(length-1):
+        x, y = route[-1]
+        options = []
+        for dx, dy in STEPS:
+            nx, ny = x+dx, y+dy
+            if not (0<=nx<m and 0<=ny<n): continue
+            if table.is_reserved(nx*n+ny, t+1): continue
+            if (dx, dy)!=(0,0) and table.is_swap(x*n+y, nx*n+ny, t): continue
+            options.append((nx, ny))
+        if len(options)==0:
+            break
+        route.append(options[rng.integers(len(options))])
+    return route
+
+def assert_same(dense, sparse):
+    m, n = dense.shape
+    n_swaps = 0
+    assert dense.now==sparse.now
+    assert np.array_equal(dense.to_array(), sparse.to_array())
+    for x in range(m):
+        for y in range(n):
+            cell = x*n+y
+            neighbors = [(x+dx)*n+y+dy for dx, dy in STEPS[:4] if 0<=x+dx<m and 0<=y+dy<n]
+            for t in range(dense.window+1):
+                assert dense.agent_at(x, y, t)==sparse.agent_at(x, y, t)
+                assert dense.is_reserved(cell, t)==sparse.is_reserved(cell, t)
+                assert dense.is_blocked(cell, t)==sparse.is_blocked(cell, t)
+                for new_cell in neighbors:
+                    # 稠密表由格子占用推出交换, 稀疏表保存显式的边
+                    swap = bool(dense.is_swap(cell, new_cell, t))
+                    assert swap==bool(sparse.is_swap(cell, new_cell, t))
+                    n_swaps += swap
+    return n_swaps
+
+def test_dense_and_sparse_tables_agree():
+    rng = np.random.default_rng(0)
+    n_swaps = 0
+    for _ in range(40):
+        shape = tuple(int(v) for v in rng.integers(3, 8, 2))
+        window = int(rng.integers(2, 9))
+        dense, sparse = reservation_table(shape, window), sparse_reservation_table(shape, window)
+        held = {} # agent -> (route, start)
+        next_id = 1
+        for _ in range(12):
+            op = rng.integers(4)
+            if op==0 or len(held)==0:
+                route = random_route(rng, dense, shape, int(rng.integers(1, window+3)))
+                if len(route)==0: continue
+                start = dense.reserve(route, next_id)
+                assert sparse.reserve(route, next_id)==start
+                held[next_id] = (route, start)
+                next_id += 1
+            elif op==1:
+                agent = list(held)[rng.integers(len(held))]
+                route, start = held.pop(agent)
+                dense.release(route, agent, start)
+                sparse.release(route, agent, start)
+            elif op==2:
+                dense.advance()
+                sparse.advance()
+            else:
+                # CBS 的点约束, 只占格子不占边
+                x, y = int(rng.integers(shape[0])), int(rng.integers(shape[1]))
+                t = int(rng.integers(-1, window+1))
+                if dense.agent_at(x, y, t)==0:
+                    dense.reserve_cell(x, y, t, next_id)
+                    sparse.reserve_cell(x, y, t, next_id)
+                    next_id += 1
+            n_swaps += assert_same(dense, sparse)
+    assert n_swaps>0
+
+def test_backend_follows_density():
+    n_cells = 64*64
+    assert isinstance(build_reservation_table((64, 64), 10, int(SPARSE_DENSITY*n_cells)-1), sparse_reservation_table)
+    assert isinstance(build_reservation_table((64, 64), 10, int(SPARSE_DENSITY*n_cells)), reservation_table)
@@ -0,0 +1,70 @@
+import os
+import random
+import numpy as np
+
+from lib.game_engine import game_engine
+from lib.spatial_index import grid_index
+from lib.utils import read_map, parse_map, init_parcels
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def sorted_by_distance(positions, x, y, accept=None):
+    return sorted((abs(px-x)+abs(py-y), item) for item, (px, py) in positions.items()
+                  if accept is None or accept(item))
+
+def test_nearest_matches_sorting():
+    rng = np.random.default_rng(0)
+    for bucket_size in [1, 3, 8]:
+        shape = (int(rng.integers(1, 40)), int(rng.integers(1, 40)))
+        index = grid_index(shape, bucket_size)
+        positions = {}
+        for _ in range(500):
+            op = rng.random()
+            item = int(rng.integers(30))
+            x, y = int(rng.integers(shape[0])), int(rng.integers(shape[1]))
+            if op<0.4:
+                index.insert(item, x, y)
+                positions[item] = (x, y)
+            elif op<0.7:
+                index.move(item, x, y)
+                positions[item] = (x, y)
+            elif op<0.8:
+                index.remove(item)
+                positions.pop(item, None)
+            else:
+                assert list(index.iter_nearest(x, y))==sorted_by_distance(positions, x, y)
+                odd = lambda k: k%2==1
+                assert index.nearest(x, y, k=3, accept=odd)==sorted_by_distance(positions, x, y, odd)[:3]
+            assert len(index)==len(positions)
+            for k, pos in positions.items():
+                assert k in index and index.position(k)==pos
+
+def test_nearest_with_path_distance():
+    rng = np.random.default_rng(1)
+    index = grid_index((30, 30), 4)
+    positions = {}
+    for item in range(40):
+        positions[item] = (int(rng.integers(30)), int(rng.integers(30)))
+        index.insert(item, *positions[item])
+    extra = {item: int(rng.integers(0, 10)) for item in positions}
+    for _ in range(50):
+        x, y = int(rng.integers(30)), int(rng.integers(30))
+        distance = lambda k: abs(positions[k][0]-x)+abs(positions[k][1]-y)+extra[k]
+        expected = sorted((distance(k), k) for k in positions)
+        assert list(index.iter_nearest(x, y, distance=distance))==expected
+
+def test_engine_indices_follow_state():
+    np.random.seed(0)
+    random.seed(0)
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", "M3.txt"))
+    ge = game_engine(parse_map(_abs, _players, init_parcels(_abs, 5)), 2)
+    policy = greedy_WHCA(ge, 10)
+    for _ in range(60):
+        _, moves = policy.pop_moves(ge)
+        ge.step(moves)
+        assert {i: ge.player_index.position(i) for i in range(len(ge.players))}== \
+               {i: (int(x), int(y)) for i, (x, y, _) in enumerate(ge.players)}
+        parcels = {k: tuple(int(v) for v in ge.parcel_coords[k]) for k in np.nonzero(ge.parcel_coords[:,0]>=0)[0]}
+        assert {k: ge.parcel_index.position(k) for k in parcels}==parcels
+        assert len(ge.parcel_index)==len(parcels)==ge.n_parcels
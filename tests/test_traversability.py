@@ -0,0 +1,54 @@
+import os
+import random
+import numpy as np
+
+from lib.game_engine import game_engine
+from lib.utils import read_map, parse_map, init_parcels
+from search.planner_CA import greedy_WHCA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def new_engine(name, seed):
+    np.random.seed(seed)
+    random.seed(seed)
+    _abs, _players = read_map(os.path.join(ROOT, "res", "maps", name+".txt"))
+    return game_engine(parse_map(_abs, _players, init_parcels(_abs, 5)), 2)
+
+def expected_free(ge):
+    blocked = (ge.terrain==-1) | (ge.player_map>0)
+    return ~blocked, ~(blocked | (ge.terrain==-2) | (ge.parcel_map>0))
+
+def assert_current(policy, ge):
+    context = policy.traversability(ge)
+    free, loaded = expected_free(ge)
+    assert np.array_equal(context.free[False], free)
+    assert np.array_equal(context.free[True], loaded)
+
+def test_set_state_invalidates_grids():
+    ge = new_engine("M0", 0)
+    policy = greedy_WHCA(ge, 10)
+    for _ in range(5):
+        _, moves = policy.pop_moves(ge)
+        ge.step(moves)
+    assert_current(policy, ge)
+    # 步数相同, 状态不同
+    other = new_engine("M0", 1)
+    for _ in range(5):
+        other.step([[0,1,0]]*len(other.players))
+    state = other.get_state()
+    assert not np.array_equal(np.asarray(state[0]), np.asarray(ge._map))
+    steps = ge.steps
+    ge.set_state(*state)
+    assert ge.steps==steps
+    assert_current(policy, ge)
+
+def test_grids_follow_the_engine():
+    ge = new_engine("M0", 0)
+    policy = greedy_WHCA(ge, 10)
+    assert_current(policy, ge)
+    # 另一个步数相同的引擎不会读到缓存的网格
+    other = new_engine("M0", 2)
+    assert other.steps==ge.steps
+    assert not np.array_equal(other.parcel_map, ge.parcel_map)
+    assert_current(policy, other)
+    assert_current(policy, ge)